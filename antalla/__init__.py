@@ -1 +0,0 @@
-from . import exchange_listeners
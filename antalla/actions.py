@@ -1,4 +1,7 @@
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import text
+
+from . import models
 
 
 class Action:
@@ -49,3 +52,90 @@ class UpdateAction(Action):
                 setattr(instance, key, value)
         return n
 
+
+# deletes the levels of the order book unless a more recent update is stored for them
+DELETE_LEVELS_COLUMNS = ["exchange_id", "first_coin_id", "second_coin_id", "order_type", "price", "last_update_id"]
+DELETE_LEVELS_QUERY = """
+    delete from current_order_book c
+    using (values {values}) deleted_levels(exchange_id, first_coin_id, second_coin_id, order_type, price, last_update_id)
+    where c.exchange_id = deleted_levels.exchange_id
+    and c.first_coin_id = deleted_levels.first_coin_id
+    and c.second_coin_id = deleted_levels.second_coin_id
+    and c.order_type = deleted_levels.order_type
+    and c.price = deleted_levels.price
+    and c.last_update_id <= deleted_levels.last_update_id
+"""
+
+
+class UpdateOrderBookAction(Action):
+    """maintains the `current_order_book` table from aggregated orders: levels with a positive size
+    are upserted with a single statement and levels with a size of 0 are deleted with a single statement,
+    unless a more recent update is already stored
+    """
+    def __init__(self, agg_orders):
+        super().__init__()
+        self.agg_orders = agg_orders
+
+    def execute(self, session):
+        levels = self._latest_levels()
+        if not levels:
+            return 0
+        upserts = [level for level in levels if level["size"] > 0]
+        deletes = [level for level in levels if level["size"] <= 0]
+        index_elements = models.CurrentOrder.index_elements()
+        if upserts:
+            insert_stmt = insert(models.CurrentOrder).values(upserts)
+            insert_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_=dict(size=insert_stmt.excluded.size,
+                          last_update_id=insert_stmt.excluded.last_update_id,
+                          timestamp=insert_stmt.excluded.timestamp),
+                where=models.CurrentOrder.last_update_id <= insert_stmt.excluded.last_update_id)
+            session.execute(insert_stmt)
+        if deletes:
+            values = []
+            params = {}
+            for i, level in enumerate(deletes):
+                values.append("(:exchange_id_{0}, :first_coin_id_{0}, :second_coin_id_{0}, :order_type_{0}, "
+                              "cast(:price_{0} as double precision), :last_update_id_{0})".format(i))
+                for column in DELETE_LEVELS_COLUMNS:
+                    params["{}_{}".format(column, i)] = level[column]
+            session.execute(text(DELETE_LEVELS_QUERY.format(values=", ".join(values))), params)
+        return len(levels)
+
+    def _latest_levels(self):
+        """returns the most recent update of each price level of the orders
+        """
+        index_elements = models.CurrentOrder.index_elements()
+        latest = {}
+        for order in self.agg_orders:
+            # read the column values directly as executed actions detach their items
+            data = vars(order)
+            if data.get("last_update_id") is None:
+                continue
+            key = tuple(data[column] for column in index_elements)
+            if key not in latest or data["last_update_id"] >= latest[key]["last_update_id"]:
+                latest[key] = dict(
+                    exchange_id=data["exchange_id"],
+                    first_coin_id=data["first_coin_id"],
+                    second_coin_id=data["second_coin_id"],
+                    order_type=data["order_type"],
+                    price=data["price"],
+                    buy_sym_id=data["buy_sym_id"],
+                    sell_sym_id=data["sell_sym_id"],
+                    size=data["size"],
+                    last_update_id=data["last_update_id"],
+                    timestamp=data["timestamp"],
+                )
+        return list(latest.values())
+
+
+def add_order_book_updates(actions):
+    """adds an action maintaining `current_order_book` for every insertion of aggregated orders
+    """
+    all_actions = []
+    for action in actions:
+        all_actions.append(action)
+        if isinstance(action, InsertAction) and action.item_type is models.AggOrder:
+            all_actions.append(UpdateOrderBookAction(action.items))
+    return all_actions
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+import logging
+import time
+
+from . import db
+from . import settings
+
+BASE_RESOLUTION = "1m"
+DEFAULT_CANDLE_LOOKBACK_SECONDS = 300
+# origin of the bars
+EPOCH = datetime(1970, 1, 1)
+
+# expression of the start of the bar of length :seconds containing `{value}`
+BUCKET_EXPRESSION = "timestamp 'epoch' + floor(extract(epoch from {value}) / :seconds) * :seconds * interval '1 second'"
+
+# start of the bars recomputed for every market, from its latest candle of :resolution minus :lookback seconds
+MARKET_START_TIMES = """
+    select exchange_id, buy_sym_id, sell_sym_id, {start_time} start_time
+    from candles
+    where resolution = :resolution
+    group by exchange_id, buy_sym_id, sell_sym_id
+""".format(start_time=BUCKET_EXPRESSION.format(value="max(timestamp) - :lookback * interval '1 second'"))
+
+# markets of the trades, found with one lookup of trades_market_timestamp_index per market instead of reading
+# all the trades
+TRADE_MARKETS = """
+    with recursive trade_markets as (
+        (select exchange_id, buy_sym_id, sell_sym_id
+         from trades
+         order by exchange_id, buy_sym_id, sell_sym_id
+         limit 1)
+        union all
+        select next_market.exchange_id, next_market.buy_sym_id, next_market.sell_sym_id
+        from trade_markets, lateral (
+            select trades.exchange_id, trades.buy_sym_id, trades.sell_sym_id
+            from trades
+            where (trades.exchange_id, trades.buy_sym_id, trades.sell_sym_id)
+                > (trade_markets.exchange_id, trade_markets.buy_sym_id, trade_markets.sell_sym_id)
+            order by trades.exchange_id, trades.buy_sym_id, trades.sell_sym_id
+            limit 1
+        ) next_market
+    )
+    select exchange_id, buy_sym_id, sell_sym_id from trade_markets
+"""
+
+# markets of the base candles
+BASE_CANDLE_MARKETS = """
+    select distinct exchange_id, buy_sym_id, sell_sym_id
+    from candles
+    where resolution = :base_resolution
+"""
+
+UPSERT_CANDLES = """
+    on conflict (exchange_id, buy_sym_id, sell_sym_id, resolution, timestamp) do update set
+        open = excluded.open,
+        high = excluded.high,
+        low = excluded.low,
+        close = excluded.close,
+        volume = excluded.volume,
+        quote_volume = excluded.quote_volume,
+        vwap = excluded.vwap,
+        trade_count = excluded.trade_count
+"""
+
+# base candles aggregated from the trades
+INSERT_TRADE_CANDLES = """
+    insert into candles (exchange_id, buy_sym_id, sell_sym_id, resolution, timestamp,
+                         open, high, low, close, volume, quote_volume, vwap, trade_count)
+    select exchange_id, buy_sym_id, sell_sym_id, :resolution, bucket,
+        (array_agg(price order by timestamp, exchange_trade_id))[1],
+        max(price),
+        min(price),
+        (array_agg(price order by timestamp desc, exchange_trade_id desc))[1],
+        sum(size),
+        sum(price * size),
+        sum(price * size) / nullif(sum(size), 0),
+        count(*)
+    from (
+        select market_trades.*, {bucket} bucket
+        from ({markets}) markets
+        left join ({start_times}) market_start_times using (exchange_id, buy_sym_id, sell_sym_id)
+        cross join lateral (
+            select *
+            from trades
+            where trades.exchange_id = markets.exchange_id
+            and trades.buy_sym_id = markets.buy_sym_id
+            and trades.sell_sym_id = markets.sell_sym_id
+            and trades.timestamp >= coalesce(market_start_times.start_time, '-infinity')
+            and trades.timestamp < :stop_time
+        ) market_trades
+    ) bucketed_trades
+    group by exchange_id, buy_sym_id, sell_sym_id, bucket
+""".format(bucket=BUCKET_EXPRESSION.format(value="timestamp"), markets=TRADE_MARKETS,
+           start_times=MARKET_START_TIMES) + UPSERT_CANDLES
+
+# coarser candles rolled up from the base candles
+INSERT_ROLLUP_CANDLES = """
+    insert into candles (exchange_id, buy_sym_id, sell_sym_id, resolution, timestamp,
+                         open, high, low, close, volume, quote_volume, vwap, trade_count)
+    select exchange_id, buy_sym_id, sell_sym_id, :resolution, bucket,
+        (array_agg(open order by timestamp))[1],
+        max(high),
+        min(low),
+        (array_agg(close order by timestamp desc))[1],
+        sum(volume),
+        sum(quote_volume),
+        sum(quote_volume) / nullif(sum(volume), 0),
+        sum(trade_count)
+    from (
+        select market_candles.*, {bucket} bucket
+        from ({markets}) markets
+        left join ({start_times}) market_start_times using (exchange_id, buy_sym_id, sell_sym_id)
+        cross join lateral (
+            select *
+            from candles base_candles
+            where base_candles.exchange_id = markets.exchange_id
+            and base_candles.buy_sym_id = markets.buy_sym_id
+            and base_candles.sell_sym_id = markets.sell_sym_id
+            and base_candles.resolution = :base_resolution
+            and base_candles.timestamp >= coalesce(market_start_times.start_time, '-infinity')
+            and base_candles.timestamp < :stop_time
+        ) market_candles
+    ) bucketed_candles
+    group by exchange_id, buy_sym_id, sell_sym_id, bucket
+""".format(bucket=BUCKET_EXPRESSION.format(value="timestamp"), markets=BASE_CANDLE_MARKETS,
+           start_times=MARKET_START_TIMES) + UPSERT_CANDLES
+
+
+def bucket_start(timestamp, resolution):
+    """returns the start of the bar of `resolution` containing `timestamp`
+
+    >>> bucket_start(datetime(2019, 5, 15, 19, 34, 12), "5m")
+    datetime.datetime(2019, 5, 15, 19, 30)
+    >>> bucket_start(datetime(2019, 5, 15, 19, 34, 12), "1d")
+    datetime.datetime(2019, 5, 15, 0, 0)
+    """
+    seconds = settings.CANDLE_RESOLUTIONS[resolution]
+    return EPOCH + timedelta(seconds=(timestamp - EPOCH) // timedelta(seconds=seconds) * seconds)
+
+
+class CandleBuilder:
+    """maintains the `candles` table incrementally. The watermark of every market and resolution is the start
+    of its latest candle: each run recomputes the bars of every market from its own watermark (minus `lookback`,
+    to include trades stored late) up to `stop_time`, so that the latest, incomplete bar is completed by the next
+    run. Only the rows of a market after its own watermark are read, so that a market which stopped trading does
+    not hold back the others, and the markets without candles yet are aggregated from their first trade. Bars are
+    recomputed from scratch and upserted, which makes runs idempotent. Base candles are aggregated from `trades`
+    and the coarser resolutions are rolled up from the base candles.
+    """
+    def __init__(self, resolutions=None, session=db.session,
+                 lookback=timedelta(seconds=DEFAULT_CANDLE_LOOKBACK_SECONDS)):
+        if resolutions is None:
+            resolutions = list(settings.CANDLE_RESOLUTIONS)
+        unknown_resolutions = set(resolutions) - set(settings.CANDLE_RESOLUTIONS)
+        if unknown_resolutions:
+            raise ValueError("unknown candle resolutions: {}".format(", ".join(sorted(unknown_resolutions))))
+        # coarser resolutions are rolled up from the base candles, which are therefore always built
+        self.resolutions = [resolution for resolution in settings.CANDLE_RESOLUTIONS
+                            if resolution in resolutions or resolution == BASE_RESOLUTION]
+        self.session = session
+        self.lookback = lookback
+
+    def run(self, stop_time=None):
+        """updates the candles of all resolutions up to `stop_time` and returns the number of rows upserted
+        """
+        start = time.time()
+        if stop_time is None:
+            stop_time = datetime.now()
+        rows = 0
+        for resolution in self.resolutions:
+            if resolution == BASE_RESOLUTION:
+                query = INSERT_TRADE_CANDLES
+            else:
+                query = INSERT_ROLLUP_CANDLES
+            result = self.session.execute(query, {
+                "resolution": resolution,
+                "base_resolution": BASE_RESOLUTION,
+                "seconds": settings.CANDLE_RESOLUTIONS[resolution],
+                "stop_time": stop_time,
+                "lookback": self.lookback.total_seconds(),
+            })
+            logging.debug("candles %s - %s rows", resolution, result.rowcount)
+            rows += result.rowcount
+        self.session.commit()
+        logging.info("candles updated up to %s - %s rows in %.1f seconds", stop_time, rows, time.time() - start)
+        return rows
@@ -1,7 +1,8 @@
 import argparse
 import logging
 
-from . import commands
+from dateutil.parser import parse as parse_date
+
 from .exchange_listener import ExchangeListener
 from . import settings
 
@@ -21,6 +22,22 @@ run_parser.add_argument("--event-type", choices=["trade", "depth"],
 run_parser.add_argument("--markets-files",
                         help="files to use to select the markets for each exchange",
                         nargs="*")
+run_parser.add_argument("--snapshots", default=False, action="store_true",
+                        help="computes order book snapshots in real time from the received order books")
+run_parser.add_argument("--snapshot-depth", type=float, nargs="+",
+                        help="order book depths of the real time snapshots, expressed in percentage relative to the mid price; defaults to the quartile range")
+run_parser.add_argument("--snapshot-interval", type=int, default=settings.LIVE_SNAPSHOT_INTERVAL_SECONDS,
+                        help="interval in seconds between real time snapshots")
+run_parser.add_argument("--buffer-rows", type=int, default=settings.INGEST_BUFFER_ROWS,
+                        help="maximum number of rows buffered before being written to the db; 0 writes the rows as they are received")
+run_parser.add_argument("--overflow-policy", nargs="+", metavar="DATA_TYPE=POLICY",
+                        help="policy applied to depth, trade or other updates when the buffer is full: block, conflate (depth only) or spill (depth and trade only); defaults to depth=conflate trade=block other=block")
+run_parser.add_argument("--spill-dir", default=settings.INGEST_SPILL_DIR,
+                        help="directory to which updates are spilled with the spill policy")
+run_parser.add_argument("--backlog-dir", default=settings.DB_BACKLOG_DIR,
+                        help="directory to which updates are spilled while the db is unavailable, to be written once it is back")
+run_parser.add_argument("--trade-cache-size", type=int, default=settings.TRADE_CACHE_SIZE,
+                        help="number of recent trade ids kept per market to drop the trades resent by the exchanges; 0 disables it")
 
 markets = subparsers.add_parser("markets")
 markets.add_argument("--exchange", "-e", nargs="*", choices=ExchangeListener.registered())
@@ -37,8 +54,33 @@ init_data.add_argument("--fetch-prices", default=False, action="store_true",
 
 snapshots_parser = subparsers.add_parser("snapshot")
 snapshots_parser.add_argument("--exchange", nargs="*", choices=ExchangeListener.registered())
-snapshots_parser.add_argument("--depth", type=float, help="sets order book depth for orders to be included in snapshot, expressed in percentage relative to the mid price")
+snapshots_parser.add_argument("--depth", type=float, nargs="+", help="sets one or more order book depths for orders to be included in snapshots, expressed in percentage relative to the mid price")
 snapshots_parser.add_argument("--quartile", action='store_true', help="includes orders ranging from upper quartile bids to lower quartile asks")
+snapshots_parser.add_argument("--interval", type=int, nargs="+", default=[settings.SNAPSHOT_INTERVAL_SECONDS], help="one or more intervals in seconds between snapshots")
+snapshots_parser.add_argument("--flush-size", type=int, default=settings.SNAPSHOT_FLUSH_SIZE, help="number of snapshots written to the db per batch insert")
+snapshots_parser.add_argument("--checkpoint-interval", type=int, default=settings.SNAPSHOT_CHECKPOINT_INTERVAL_SECONDS, help="interval in seconds between persisted order book checkpoints used to resume snapshot generation")
+snapshots_parser.add_argument("--jobs", "-j", type=int, default=1, help="number of processes used to generate snapshots of different markets in parallel")
+
+compact_parser = subparsers.add_parser("compact", help="removes the depth updates older than the retention window once covered by order book checkpoints")
+compact_parser.add_argument("--exchange", nargs="*", choices=ExchangeListener.registered())
+compact_parser.add_argument("--retention-days", type=float, default=settings.COMPACT_RETENTION_DAYS, help="number of days of depth updates to keep")
+compact_parser.add_argument("--batch-size", type=int, default=settings.COMPACT_BATCH_SIZE, help="number of rows removed per transaction")
+compact_parser.add_argument("--archive-dir", help="directory to which the removed rows are archived as gzipped csv files")
+compact_parser.add_argument("--no-checkpoints", default=False, action="store_true", help="does not generate the missing checkpoints before compacting")
+compact_parser.add_argument("--every", type=int, help="runs the compaction every given number of seconds instead of once")
+
+candles_parser = subparsers.add_parser("candles", help="updates the OHLCV candles aggregated from the trades")
+candles_parser.add_argument("--resolution", nargs="+", choices=list(settings.CANDLE_RESOLUTIONS), help="resolutions to update; defaults to all")
+candles_parser.add_argument("--every", type=int, help="updates the candles every given number of seconds instead of once")
+
+export_parser = subparsers.add_parser("export", help="exports the data of a market to columnar files")
+export_parser.add_argument("--exchange", required=True, choices=ExchangeListener.registered())
+export_parser.add_argument("--market", required=True, help="market to export, e.g. ETH_BTC")
+export_parser.add_argument("--start", required=True, type=parse_date, help="start of the exported time range")
+export_parser.add_argument("--stop", type=parse_date, help="end of the exported time range; defaults to now")
+export_parser.add_argument("--tables", nargs="+", choices=settings.EXPORT_TABLES, help="tables to export; defaults to all")
+export_parser.add_argument("--format", choices=settings.EXPORT_FORMATS, default="npy", help="npy (one memory-mappable file per column), npz or parquet (requires pyarrow)")
+export_parser.add_argument("--output-dir", default="export", help="directory to write the files to")
 
 plot_order_book_parser = subparsers.add_parser("plot-order-book", help="plot the order book")
 plot_order_book_parser.add_argument("--exchange", choices=ExchangeListener.registered())
@@ -60,5 +102,6 @@ def run():
     command = args["command"].replace("-", "_")
     if command != "migrations" and unkown_args:
         parser.error("unknown arguments: {0}".format(unkown_args))
+    from . import commands
     func = getattr(commands, command)
     func(args)
@@ -2,27 +2,27 @@ import signal
 import os
 from os import path
 import json
-import pkg_resources
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 import sys
+import time
 
-import websockets
-from alembic.config import main as alembic_main
+from sqlalchemy.dialects.postgresql import insert
 
-from .ob_analyser import OrderBookAnalyser
 from . import db, models, settings
 from .exchange_listener import ExchangeListener
-from .orchestrator import Orchestrator
-from . import market_crawler
-from .ob_snapshot_generator import OBSnapshotGenerator
-from .web.websocket_handler import handle_connection
+
+# the dependencies specific to a command are imported by the command itself to keep the startup of the cli fast
 
 
 
 def run(args):
+    from .orchestrator import Orchestrator
+    from .ingest_buffer import IngestBuffer, parse_overflow_policies
+    from .trade_dedup import TradeDeduplicator
+    from .spill import Backlog
     if args["exchange"]:
         exchanges = args["exchange"]
     else:
@@ -37,7 +37,21 @@ def run(args):
     else:
         for exchange in exchanges:
             markets[exchange] = settings.MARKETS
-    orchestrator = Orchestrator(exchanges, event_type=args["event_type"], markets=markets)
+    buffer = None
+    backlog = None
+    if args["buffer_rows"] > 0:
+        buffer = IngestBuffer(args["buffer_rows"], parse_overflow_policies(args["overflow_policy"]), args["spill_dir"])
+        backlog = Backlog(args["backlog_dir"])
+    deduplicator = None
+    if args["trade_cache_size"] > 0:
+        deduplicator = TradeDeduplicator(args["trade_cache_size"])
+    orchestrator = Orchestrator(exchanges, event_type=args["event_type"], markets=markets,
+                                live_snapshots=args["snapshots"],
+                                snapshot_depths=args["snapshot_depth"],
+                                snapshot_interval=args["snapshot_interval"],
+                                buffer=buffer,
+                                deduplicator=deduplicator,
+                                backlog=backlog)
     def handler(_signum, _frame):
         orchestrator.stop()
     signal.signal(signal.SIGINT, handler)
@@ -53,6 +67,7 @@ def markets(args):
         logging.info("stop 'markets'")    
 
 async def _markets(args):
+    from .orchestrator import Orchestrator
     if args["exchange"]:
         exchange = args["exchange"]
     else:
@@ -63,24 +78,22 @@ async def _markets(args):
     signal.signal(signal.SIGINT, handler)
     try:
         await orchestrator.get_markets()
+        orchestrator.session.commit()
     except KeyboardInterrupt:
         orchestrator.stop()
 
 def init_data(args):
+    import pkg_resources
     fixtures = [("coins.json", models.Coin, "symbol"),
                 ("exchanges.json", models.Exchange, "name")]
     for filename, Model, column in fixtures:
         filepath = path.join("fixtures", filename)
         entities = pkg_resources.resource_string(settings.PACKAGE, filepath)
         entities = json.loads(entities)
-
-        for entity in entities:
-            if db.session.query(Model).filter_by(**{column: entity[column]}).first():
-                continue
-            model = Model(**entity)
-            db.session.add(model)
-
-        db.session.commit()
+        if entities:
+            insert_stmt = insert(Model).values(entities).on_conflict_do_nothing(index_elements=[column])
+            db.session.execute(insert_stmt)
+    db.session.commit()
     try:
         asyncio.get_event_loop().run_until_complete(_init_data(args))
     except KeyboardInterrupt:
@@ -105,71 +118,164 @@ async def _fetch_prices(args):
     await start_crawler()
 
 async def start_crawler():
-    n = 0
-    update_actions = []
+    from . import market_crawler
+    from .reference_cache import reference_cache
     crawler = market_crawler.MarketCrawler()
-    coins = db.session.query(models.Coin).all()
-    for coin in coins:
-        coin.price_usd = await crawler.get_price(coin.symbol)
-        coin.last_price_updated = datetime.now()
-        if coin.name is None:
-            coin.name = crawler.get_coin_name(coin.symbol)
-        logging.debug("PRICE UPDATE - %s: %s USD", coin.symbol, coin.price_usd)
-        db.session.add(coin)
-        n += 1
+    prices = await crawler.get_prices()
+    symbols = sorted(reference_cache.get_coin_symbols())
+    coin_prices = []
+    for symbol in symbols:
+        price = prices.get(symbol, 0)
+        if not price:
+            logging.info("coin name not found for: %s", symbol)
+        logging.debug("PRICE UPDATE - %s: %s USD", symbol, price)
+        coin_prices.append((symbol, price, crawler.get_coin_name(symbol)))
+    n = update_coin_prices(db.session, coin_prices, datetime.now())
     logging.info("UPDATE - %s coin prices have been updated in antalla db", n)
     db.session.commit()
 
+def update_coin_prices(session, coin_prices, timestamp):
+    """updates the price of all the given (symbol, price, name) with a single statement,
+    setting the name of the coins which do not have one yet
+    """
+    if not coin_prices:
+        return 0
+    values = []
+    params = {"timestamp": timestamp}
+    for i, (symbol, price, name) in enumerate(coin_prices):
+        values.append("(:symbol_{0}, cast(:price_{0} as float), cast(:name_{0} as varchar))".format(i))
+        params.update({"symbol_{}".format(i): symbol, "price_{}".format(i): price, "name_{}".format(i): name})
+    query = (
+        """
+        update coins
+        set price_usd = prices.price_usd,
+            last_price_updated = :timestamp,
+            name = coalesce(coins.name, prices.name)
+        from (values {}) prices (symbol, price_usd, name)
+        where coins.symbol = prices.symbol
+        """.format(", ".join(values))
+    )
+    return session.execute(query, params).rowcount
+
 def norm_volume(args):
     if args["exchange"]:
         exchanges = args["exchange"]
     else:
         exchanges = ExchangeListener.registered()
+    known_exchanges = {row[0] for row in db.session.execute(
+        "select name from exchanges where name = any(:exchanges)", {"exchanges": list(exchanges)})}
     for e in exchanges:
-        exchange = db.session.query(models.Exchange).filter_by(name=e).all()
-        if exchange != None:
-            id = exchange[0].id
-            set_usd_vol(id)
-            logging.info("usd volume computed for exchange: '%s'", exchange[0].name)
-        else:
+        if e not in known_exchanges:
             logging.warning("exchange '%s' not found in db - check '--exchange' flag is set with correct argument", e)
+    exchanges = sorted(known_exchanges)
+    if not exchanges:
+        return
+    _log_missing_usd_volumes(exchanges)
+    updated = set_usd_vol(exchanges)
+    for e in exchanges:
+        logging.info("usd volume computed for exchange: '%s' - %s markets", e, updated.get(e, 0))
 
-def set_usd_vol(exchange_id):
-    exchange_markets = db.session.query(models.ExchangeMarket).filter_by(exchange_id=exchange_id).all()
-    for exm in exchange_markets:
-        coin_price = get_usd_price(exm.quoted_volume_id)
-        if exm.quoted_volume is None:
-            logging.warning("no quoted volume for pair '{}-{}' on exchange id '{}'".format(exm.first_coin_id, exm.second_coin_id, exchange_id)) 
-        else: 
-            exm.volume_usd = coin_price * exm.quoted_volume
-            exm.vol_usd_timestamp = datetime.now()
-            logging.debug("UPDATE 'volume_usd' - exchange id: {} - usd volume: {} - market: '{}-{}' - timestamp: {}".format(
-                exm.exchange_id, exm.volume_usd, exm.first_coin_id, exm.second_coin_id, exm.vol_usd_timestamp
-            ))
-            db.session.add(exm)
-    db.session.commit()
+def _log_missing_usd_volumes(exchanges):
+    """reports the markets without quoted volume and the coins without USD price of all exchanges with one query
+    """
+    rows = db.session.execute(
+        """
+        select em.exchange_id, em.first_coin_id, em.second_coin_id, em.quoted_volume_id,
+            em.quoted_volume is null missing_volume, c.price_usd is null missing_price
+        from exchange_markets em
+        inner join exchanges e on em.exchange_id = e.id
+        left join coins c on c.symbol = upper(em.quoted_volume_id)
+        where e.name = any(:exchanges)
+        and (em.quoted_volume is null or c.price_usd is null)
+        """, {"exchanges": exchanges})
+    for exchange_id, first_coin_id, second_coin_id, quoted_volume_id, missing_volume, missing_price in rows:
+        if missing_volume:
+            logging.warning("no quoted volume for pair '{}-{}' on exchange id '{}'".format(first_coin_id, second_coin_id, exchange_id))
+        elif missing_price:
+            logging.debug("no USD price for symbol '%s' in db", quoted_volume_id)
 
-def get_usd_price(symbol):
-    coin = db.session.query(models.Coin).get(symbol.upper())
-    if coin is None:
-        logging.debug("no USD price for symbol '%s' in db", symbol)
-        return 0
-    else:
-        return coin.price_usd
+def set_usd_vol(exchanges):
+    """sets the USD volume of all the markets of the given exchanges with a single statement and returns
+    the number of markets updated per exchange. Markets quoted in a coin without USD price get a volume of 0
+    """
+    rows = db.session.execute(
+        """
+        update exchange_markets em
+        set volume_usd = em.quoted_volume * coalesce(
+                (select price_usd from coins c where c.symbol = upper(em.quoted_volume_id)), 0),
+            vol_usd_timestamp = :timestamp
+        from exchanges e
+        where em.exchange_id = e.id
+        and e.name = any(:exchanges)
+        and em.quoted_volume is not null
+        returning e.name
+        """, {"exchanges": exchanges, "timestamp": datetime.now()})
+    updated = {}
+    for (name,) in rows:
+        updated[name] = updated.get(name, 0) + 1
+    db.session.commit()
+    return updated
 
 def snapshot(args):
+    from .ob_snapshot_generator import OBSnapshotGenerator
     if args["exchange"]:
         exchanges = args["exchange"]
     else:
         exchanges = ExchangeListener.registered()
+    mid_price_ranges = list(args["depth"] or [])
+    if args["quartile"] or not mid_price_ranges:
+        mid_price_ranges.append(0)
     stop_time = datetime.now()
-    obs_generator = OBSnapshotGenerator(exchanges, stop_time, args["depth"]) 
+    obs_generator = OBSnapshotGenerator(exchanges, stop_time, mid_price_ranges, args["interval"],
+                                        flush_size=args["flush_size"],
+                                        checkpoint_interval=args["checkpoint_interval"])
     try:
-        obs_generator.run()
+        obs_generator.run(jobs=args["jobs"])
     except KeyboardInterrupt:
         logging.warning("KeybaordInterrupt - 'obs_generator.run()'")
 
+def compact(args):
+    from .compactor import Compactor
+    if args["exchange"]:
+        exchanges = args["exchange"]
+    else:
+        exchanges = ExchangeListener.registered()
+    obs_compactor = Compactor(exchanges, timedelta(days=args["retention_days"]),
+                              batch_size=args["batch_size"],
+                              archive_dir=args["archive_dir"],
+                              generate_checkpoints=not args["no_checkpoints"])
+    try:
+        while True:
+            obs_compactor.run()
+            if not args["every"]:
+                break
+            time.sleep(args["every"])
+    except KeyboardInterrupt:
+        logging.warning("KeyboardInterrupt - 'compact'")
+
+def candles(args):
+    from .candles import CandleBuilder
+    candle_builder = CandleBuilder(args["resolution"])
+    try:
+        while True:
+            candle_builder.run()
+            if not args["every"]:
+                break
+            time.sleep(args["every"])
+    except KeyboardInterrupt:
+        logging.warning("KeyboardInterrupt - 'candles'")
+
+def export(args):
+    from .exporter import Exporter
+    buy_sym_id, sell_sym_id = re.split("[_-]", args["market"])
+    stop_time = args["stop"] or datetime.now()
+    market_exporter = Exporter(args["exchange"], buy_sym_id, sell_sym_id, args["start"], stop_time,
+                               args["output_dir"], tables=args["tables"], file_format=args["format"])
+    written = market_exporter.run()
+    logging.info("exported %s files to '%s'", len(written), args["output_dir"])
+
 def plot_order_book(args):
+    from .ob_analyser import OrderBookAnalyser
     if args["exchange"] and args["market"]:
         exchange = args["exchange"]
         market = args["market"]
@@ -190,6 +296,8 @@ def plot_order_book(args):
 
 
 def ws_server(args):
+    import websockets
+    from .web.websocket_handler import handle_connection
     start_server = websockets.serve(handle_connection, args["host"], args["port"])
     logging.info("websocket server starting to listen at %s:%s", args["host"], args["port"])
     asyncio.get_event_loop().run_until_complete(start_server)
@@ -197,6 +305,8 @@ def ws_server(args):
 
 
 def migrations(_args):
+    import pkg_resources
+    from alembic.config import main as alembic_main
     migrations_path = pkg_resources.resource_filename("antalla", "migrations")
     os.chdir(migrations_path)
     alembic_main(sys.argv[2:], prog="antalla migrations")
@@ -0,0 +1,124 @@
+import csv
+from datetime import datetime, timedelta
+import gzip
+import logging
+from os import path
+import time
+
+from . import db
+from . import partitions
+from . import settings
+from .ob_snapshot_generator import OBSnapshotGenerator
+
+AGG_ORDER_COLUMNS = ["hash_id", "last_update_id", "timestamp", "buy_sym_id", "sell_sym_id", "first_coin_id",
+                     "second_coin_id", "exchange_id", "order_type", "price", "size"]
+
+
+class Compactor:
+    """removes the rows of `aggregate_orders` older than a retention window, optionally archiving them to
+    gzipped csv files. The rows of a market are only removed up to its latest order book checkpoint, so that
+    snapshot generation can always resume from a checkpoint instead of the removed updates. Rows are deleted in
+    batches of `batch_size`, each committed separately, to keep the locks taken away from the ingest short.
+    """
+    def __init__(self, exchanges,
+                 retention=timedelta(days=settings.COMPACT_RETENTION_DAYS),
+                 session=db.session,
+                 batch_size=settings.COMPACT_BATCH_SIZE,
+                 archive_dir=None,
+                 generate_checkpoints=True):
+        self.exchanges = exchanges
+        self.retention = retention
+        self.session = session
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir
+        self.generate_checkpoints = generate_checkpoints
+
+    def run(self, now=None):
+        """compacts all markets of the exchanges and returns the number of rows removed and the time taken
+        """
+        start_time = time.time()
+        if now is None:
+            now = datetime.now()
+        cutoff = now - self.retention
+        if self.generate_checkpoints:
+            # checkpoints are brought up to the cutoff before any update is removed
+            OBSnapshotGenerator(self.exchanges, cutoff, session=self.session, checkpoints_only=True).run()
+        rows = 0
+        for market in self._query_markets(cutoff):
+            rows += self._compact_market(market)
+        dropped = []
+        if "aggregate_orders" in partitions.get_partitioned_tables(self.session):
+            dropped = partitions.drop_empty_partitions(self.session, "aggregate_orders", cutoff)
+        elapsed = time.time() - start_time
+        logging.info("compaction completed - removed %s rows and %s partitions older than %s in %.1f seconds",
+                     rows, len(dropped), cutoff, elapsed)
+        return dict(rows=rows, partitions=dropped, seconds=elapsed)
+
+    def _query_markets(self, cutoff):
+        """returns the markets with their compaction cutoff: the retention cutoff or their
+        latest checkpoint if it is older
+        """
+        query = (
+            """
+            select e.name exchange, exchange_id, buy_sym_id, sell_sym_id, least(max(timestamp), :cutoff) cutoff
+            from order_book_checkpoints
+            inner join exchanges e on order_book_checkpoints.exchange_id = e.id
+            where e.name in :exchanges
+            group by e.name, exchange_id, buy_sym_id, sell_sym_id
+            order by e.name, buy_sym_id, sell_sym_id
+            """
+        )
+        return list(self.session.execute(query, {"cutoff": cutoff, "exchanges": tuple(self.exchanges)}))
+
+    def _compact_market(self, market):
+        logging.info("compacting depth updates - %s - '%s-%s' - before %s", market["exchange"].upper(),
+                     market["buy_sym_id"], market["sell_sym_id"], market["cutoff"])
+        archive = None
+        if self.archive_dir is not None:
+            filename = "{}-{}-{}-{:%Y%m%dT%H%M%S}.csv.gz".format(
+                market["exchange"], market["buy_sym_id"], market["sell_sym_id"], market["cutoff"])
+            archive = gzip.open(path.join(self.archive_dir, filename), "wt", newline="")
+        try:
+            writer = None
+            if archive is not None:
+                writer = csv.writer(archive)
+                writer.writerow(AGG_ORDER_COLUMNS)
+            rows = 0
+            while True:
+                deleted = self._delete_batch(market, returning=writer is not None)
+                if writer is not None:
+                    writer.writerows(deleted)
+                    deleted = len(deleted)
+                self.session.commit()
+                rows += deleted
+                if deleted < self.batch_size:
+                    return rows
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def _delete_batch(self, market, returning=False):
+        """deletes up to `batch_size` rows of the market and returns them if `returning`,
+        or their number otherwise
+        """
+        query = (
+            """
+            delete from aggregate_orders
+            where (hash_id, timestamp) in (
+                select hash_id, timestamp
+                from aggregate_orders
+                where exchange_id = :exchange_id
+                and buy_sym_id = :buy_sym_id
+                and sell_sym_id = :sell_sym_id
+                and timestamp < :cutoff
+                limit :batch_size
+            )
+            """
+        )
+        if returning:
+            query += "returning {}".format(", ".join(AGG_ORDER_COLUMNS))
+        result = self.session.execute(query, {"exchange_id": market["exchange_id"], "buy_sym_id": market["buy_sym_id"],
+            "sell_sym_id": market["sell_sym_id"], "cutoff": market["cutoff"], "batch_size": self.batch_size})
+        if returning:
+            return [tuple(row) for row in result]
+        return result.rowcount
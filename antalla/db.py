@@ -6,7 +6,23 @@ from sqlalchemy.ext.declarative import declarative_base
 from . import settings
 
 
-engine = create_engine(settings.DB_URL)
-Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engine = None
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine():
+    """returns the engine of `settings.DB_URL`, created on first use so that importing antalla does not
+    load the db driver
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(settings.DB_URL)
+    return _engine
+
+
+def Session() -> DBSession:
+    return _sessionmaker(bind=get_engine())
+
+
 session: DBSession = scoped_session(Session)
 Base = declarative_base()
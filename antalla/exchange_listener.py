@@ -1,45 +1,69 @@
-import aiohttp
 import uuid
 import json
 import logging
 import re
 from datetime import datetime
 from .base_factory import BaseFactory
+from .exchange_listeners import LISTENER_MODULES, load_listener
+from .reference_cache import get_reference_cache
 from . import models
 from . import actions
 from . import db
 
 
 class ExchangeListener(BaseFactory):
-    def __init__(self, exchange, on_event, markets, session=db.session, event_type=None):
+    def __init__(self, exchange, on_event, markets, session=db.session, event_type=None, cache=None,
+                 max_markets=None):
+        if cache is None:
+            cache = get_reference_cache(session)
         self._connected = False
+        self.disconnections = 0
         self.exchange = exchange
         self.event_type = event_type
         self.on_event = on_event
         self.session = session
+        self.cache = cache
+        # buffer whose `wait_writable` is awaited before reading new data, set by the orchestrator
+        self.backpressure = None
+        # called after the listener rolls the session back, set by the orchestrator
+        self.on_rollback = None
         self._session_id = uuid.uuid4()
         self._all_symbols = None
+        # number of markets with the highest volume in USD listened to, or None for all the markets
+        self.max_markets = max_markets
         self.markets = self._get_existing_markets(markets)
 
     def _get_existing_markets(self, markets):
-        existing_markets = []
-        for market in markets:
-            exchange_market = self._find_market(market)
-            if exchange_market:
-                existing_markets.append(exchange_market.original_name)
-        return existing_markets
+        """resolves all `markets` through the reference cache and returns the original names of the existing ones
+        """
+        return [market["original_name"]
+                for market in self.cache.load_markets(self.exchange, markets, max_markets=self.max_markets)]
+
+    @classmethod
+    def registered(cls):
+        """returns the names of all the listeners, including the ones which are not imported yet
+        """
+        return sorted(set(LISTENER_MODULES) | set(cls._entities))
 
-    def _find_market(self, market):
-        pair = sorted(market.split("_"))
-        return self.session.query(models.ExchangeMarket).get((pair[0], pair[1], self.exchange.id))
+    @classmethod
+    def get(cls, name: str):
+        if name not in cls._entities:
+            load_listener(name)
+        return super().get(name)
 
     async def listen(self):
         raise NotImplementedError()
 
+    def _rollback(self):
+        self.session.rollback()
+        if self.on_rollback is not None:
+            self.on_rollback()
+
     def stop(self):
         raise NotImplementedError()
 
     async def get_markets(self):
+        import aiohttp
         markets_uri = self._get_markets_uri()
         async with aiohttp.ClientSession() as http_session:
             markets = await self._fetch(http_session, markets_uri)
@@ -93,20 +117,34 @@ class ExchangeListener(BaseFactory):
         return self._all_symbols
 
     def _log_event(self, market, connection_event, data_collected):
-        pair = self._parse_market_to_symbols(market, self.all_symbols)
-        event = models.Event(
-            timestamp=datetime.now(),
-            session_id=self._session_id,
-            exchange_id=self.exchange.id,
-            buy_sym_id=pair[0], 
-            sell_sym_id=pair[1],
-            connection_event=connection_event,
-            data_collected=data_collected
-        )
-        action = actions.InsertAction([event])
+        self._log_events([(market, connection_event, data_collected)])
+
+    def _log_events(self, market_events):
+        """logs the (market, connection_event, data_collected) events with a single insert and commit
+        """
+        if not market_events:
+            return
+        timestamp = datetime.now()
+        events = []
+        for market, connection_event, data_collected in market_events:
+            pair = self._parse_market_to_symbols(market, self.all_symbols)
+            events.append(models.Event(
+                timestamp=timestamp,
+                session_id=self._session_id,
+                exchange_id=self.exchange.id,
+                buy_sym_id=pair[0], 
+                sell_sym_id=pair[1],
+                connection_event=connection_event,
+                data_collected=data_collected
+            ))
+        action = actions.InsertAction(events)
+        if self.backpressure is not None:
+            # written along with the data by the orchestrator, which does not lose them if the db is unavailable
+            self.on_event([action])
+            return
         action.execute(self.session)
         self.session.commit()
-        logging.info("event log - {0} - commited to 'events' table".format(self.exchange.name))
+        logging.info("event log - {0} - {1} events commited to 'events' table".format(self.exchange.name, len(events)))
 
     def _compute_events(self, event_type, events):
         if event_type is None:
@@ -116,6 +154,6 @@ class ExchangeListener(BaseFactory):
     def _log_disconnection(self):
         if not self._connected:
             return
-        for market in self.markets:
-            self._log_event(market, "disconnect", "all")
+        self._log_events([(market, "disconnect", "all") for market in self.markets])
         self._connected = False
+        self.disconnections += 1
@@ -1,12 +1,17 @@
-from os import path
-import pkgutil
-import sys
+import importlib
 
 
-def load_listeners():
-    for _, module_name, _ in pkgutil.iter_modules(__path__, prefix=__name__ + "."):
-        __import__(module_name)
+# module of every exchange listener, imported on demand so that only the listeners used get loaded
+LISTENER_MODULES = {
+    "binance": "binance_listener",
+    "coinbase": "coinbase_listener",
+    "hitbtc": "hitbtc_listener",
+    "idex": "idex_listener",
+}
 
-# force to load all listeners so they get registered to the factory
-load_listeners()
 
+def load_listener(name):
+    """imports the module of the listener `name`, which registers it to the factory
+    """
+    if name in LISTENER_MODULES:
+        importlib.import_module("." + LISTENER_MODULES[name], __name__)
@@ -10,6 +10,7 @@ from dateutil.parser import parse as parse_date
 import websockets
 import aiohttp
 import asyncio 
+import sqlalchemy
 
 from .. import settings
 from .. import db
@@ -21,6 +22,55 @@ from ..websocket_listener import WebsocketListener
 # needs to be 5, 10, 20, 50, 100, 500 or 1000
 DEPTH_SNAPSHOT_LIMIT = 1000
 
+
+class StreamShard:
+    """a websocket connection carrying the combined streams of a subset of the markets
+    """
+    def __init__(self, index, markets, events):
+        self.index = index
+        self.markets = markets
+        self.events = events
+        self.connected = False
+        self.stats = dict(messages=0, reconnects=0)
+        self._reported = (time.time(), 0)
+
+    @property
+    def url(self):
+        streams = ["".join(pair.lower().split("_")) + "@" + event for pair in self.markets for event in self.events]
+        return settings.BINANCE_COMBINED_STREAM + "/".join(streams)
+
+    def message_rate(self):
+        """returns the number of messages received per second since the last call
+        """
+        now, messages = time.time(), self.stats["messages"]
+        reported_at, reported_messages = self._reported
+        self._reported = (now, messages)
+        return (messages - reported_messages) / max(now - reported_at, 1e-6)
+
+
+class RateLimiter:
+    """token bucket allowing `burst` requests at once and `rate` requests per second on average
+    """
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = burst
+        self._updated_at = clock()
+
+    async def acquire(self):
+        """waits until a request can be made
+        """
+        while True:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
 @ExchangeListener.register("binance")
 class BinanceListener(WebsocketListener):
     def __init__(self,
@@ -29,36 +79,116 @@ class BinanceListener(WebsocketListener):
                  markets=settings.BINANCE_MARKETS,
                  ws_url=None,
                  session=db.session,
-                 event_type=None):
-        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type)
+                 event_type=None,
+                 cache=None,
+                 max_streams_per_connection=settings.BINANCE_MAX_STREAMS_PER_CONNECTION):
+        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type,
+                         cache=cache)
         self.running = False
-        self._get_ws_url()
+        self.max_streams_per_connection = max_streams_per_connection
+        self.shards = self._create_shards()
         self._api_url = settings.BINANCE_API
         self._all_symbols = []
+        # the requests of all the shards share the rate limit of the api
+        self._rate_limiter = RateLimiter(settings.BINANCE_SNAPSHOT_REQUESTS_PER_SECOND,
+                                         settings.BINANCE_SNAPSHOT_REQUESTS_BURST)
+        # (last update id, timestamp) of the latest depth snapshot of every pair
+        self._snapshot_times = {}
+
+    def _create_shards(self):
+        """splits the markets over connections of at most `max_streams_per_connection` streams. All the streams
+        of a market use the same connection so that a disconnection affects whole markets
+        """
+        events = self._get_events()
+        markets_per_shard = max(1, self.max_streams_per_connection // len(events))
+        return [StreamShard(index, self.markets[start:start + markets_per_shard], events)
+                for index, start in enumerate(range(0, len(self.markets), markets_per_shard))]
 
-    async def _listen(self):
-        initial_actions = await self._setup_listener()
-        self.on_event(initial_actions)
-        await super()._listen()
+    async def listen(self):
+        self.running = True
+        logging.info("binance - listening to %s markets over %s connections", len(self.markets), len(self.shards))
+        await asyncio.gather(self._report_shard_stats(), *[self._listen_shard(shard) for shard in self.shards])
 
-    def _get_ws_url(self):
-        streams = []
-        for stream in self._get_events():
-            for pair in self.markets:
-                streams.append("".join(pair.lower().split("_")) + "@" + stream)
-        self._ws_url = settings.BINANCE_COMBINED_STREAM + "/".join(streams)
+    async def _listen_shard(self, shard):
+        """listens to a shard, reconnecting it independently of the other shards
+        """
+        while self.running:
+            try:
+                await self._listen_to_shard(shard)
+            except sqlalchemy.exc.DBAPIError as e:
+                self._rollback()
+                logging.error("db error in binance shard %s: %s", shard.index, e)
+                self._log_shard_disconnection(shard)
+            except Exception as e:
+                logging.error("error in binance shard %s: %s", shard.index, e)
+                self._log_shard_disconnection(shard)
+            if self.running:
+                shard.stats["reconnects"] += 1
+
+    async def _listen_to_shard(self, shard):
+        logging.debug("websocket connecting to: %s", shard.url)
+        async with websockets.connect(shard.url) as websocket:
+            # the order books of the shard are resynchronised on every connection. The stream is read in the
+            # meantime so that the connection is not dropped while waiting for the rate limited snapshots
+            pending_messages = []
+            setup = asyncio.ensure_future(self._setup_listener(shard.markets))
+            reader = asyncio.ensure_future(self._read_messages(websocket, pending_messages))
+            try:
+                await asyncio.wait([setup, reader], return_when=asyncio.FIRST_COMPLETED)
+                if reader.done():
+                    # raises the error which closed the connection
+                    reader.result()
+                initial_actions = setup.result()
+            finally:
+                setup.cancel()
+                reader.cancel()
+                await asyncio.gather(setup, reader, return_exceptions=True)
+            self.on_event(initial_actions)
+            self._setup_shard_connection(shard)
+            for data in pending_messages:
+                self._handle_message(data, shard.stats)
+            await self._receive(websocket, shard.stats)
+
+    async def _read_messages(self, websocket, messages):
+        while True:
+            messages.append(await websocket.recv())
+
+    async def _report_shard_stats(self):
+        reported_at = time.time()
+        while self.running:
+            await asyncio.sleep(1)
+            if time.time() - reported_at < settings.BINANCE_SHARD_STATS_INTERVAL:
+                continue
+            reported_at = time.time()
+            for shard in self.shards:
+                logging.info("binance shard %s - %s markets - %.1f messages/s - %s messages - %s reconnects",
+                             shard.index, len(shard.markets), shard.message_rate(),
+                             shard.stats["messages"], shard.stats["reconnects"])
 
     def _get_events(self):
         if self.event_type is None:
             return settings.BINANCE_STREAMS
         return [self.event_type]
 
-    async def _setup_connection(self, websocket):
-        for stream in self._get_events():
-            for pair in self.markets:
-                collected_data = self._get_event_data_collected(stream)
-                self._log_event(pair, "connect", collected_data)
-                
+    def _setup_shard_connection(self, shard):
+        self._log_events([(pair, "connect", self._get_event_data_collected(stream))
+                          for stream in shard.events for pair in shard.markets])
+        shard.connected = True
+        self._connected = True
+
+    def _log_shard_disconnection(self, shard):
+        if not shard.connected:
+            return
+        self._log_events([(market, "disconnect", "all") for market in shard.markets])
+        shard.connected = False
+        self.disconnections += 1
+
+    def stop(self):
+        self.running = False
+        for shard in self.shards:
+            self._log_shard_disconnection(shard)
+        self._connected = False
+
 
     def _get_event_data_collected(self, data_type):
         if data_type == "trade":
@@ -69,33 +199,42 @@ class BinanceListener(WebsocketListener):
             logging.debug("unknown event type for 'data collected' - {}".format(data_type))
             return "Unknown"
 
-    async def _setup_listener(self):
+    async def _setup_listener(self, markets):
         actions = []
         async with aiohttp.ClientSession() as session:
+            await self._rate_limiter.acquire()
             self._all_symbols = await self.fetch_all_symbols(session)
             events = self._get_events()
             if "depth" in events:
-                requests = 0
-                for pair in self.markets:
-                    if requests % 10 == 0:
-                        await asyncio.sleep(4)
+                for pair in markets:
+                    await self._rate_limiter.acquire()
                     uri = settings.BINANCE_API + "/api/v1/depth?symbol=" + ''.join(pair.upper().split("_")) + "&limit=" + str(DEPTH_SNAPSHOT_LIMIT)
                     snapshot = await self._fetch(session, uri)
                     logging.debug("GET orderbook snapshot for '%s': %s", pair, snapshot)
                     actions.extend(self._parse_snapshot(snapshot, pair))
-                    requests += 1
         return actions
 
     def _parse_snapshot(self, snapshot, pair):
         order_info = {
             "pair": pair,
-            "timestamp": time.time(),
-            "last_update_id": snapshot["lastUpdateId"],              
+            "timestamp": self._get_snapshot_time(pair, snapshot["lastUpdateId"]),
+            "last_update_id": snapshot["lastUpdateId"],
         }
         orders = self._convert_raw_orders(snapshot, "bids", "asks", order_info)
         logging.debug("parsed %d orders in depth snapshot for pair '%s'", len(orders), pair.lower())
         return self._parse_agg_orders(orders)
 
+    def _get_snapshot_time(self, pair, last_update_id):
+        """returns the timestamp in milliseconds of a depth snapshot, which does not have one.
+        A snapshot fetched again without any update in between, e.g. on reconnection, keeps the timestamp it was
+        first received at, so that its orders conflict with the stored ones instead of being inserted again
+        """
+        previous_update_id, timestamp = self._snapshot_times.get(pair, (None, None))
+        if previous_update_id != last_update_id:
+            timestamp = int(time.time() * 1000)
+            self._snapshot_times[pair] = (last_update_id, timestamp)
+        return timestamp
+
     def _parse_depthUpdate(self, update):
         # FIXME: could check for last "U" = "u+1" from previous update
         order_info = {
@@ -175,9 +314,10 @@ class BinanceListener(WebsocketListener):
 
     async def get_markets(self):
         async with aiohttp.ClientSession() as session:
-            symbols = await self.fetch_all_symbols(session)
+            symbols, markets = await asyncio.gather(
+                self.fetch_all_symbols(session),
+                self._fetch(session, self._get_uri(settings.BINANCE_API_MARKETS)))
             self._all_symbols = symbols
-            markets = await self._fetch(session, self._get_uri(settings.BINANCE_API_MARKETS))
             logging.debug("markets retrieved from %s: %s", self.exchange.name, markets)
             actions = self._parse_markets(markets)
             self.on_event(actions)
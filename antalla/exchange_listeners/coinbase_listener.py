@@ -23,8 +23,10 @@ class CoinbaseListener(WebsocketListener):
                  markets=settings.COINBASE_MARKETS,
                  ws_url=settings.COINBASE_WS_URL,
                  session=db.session,
-                 event_type=None):
-        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type)
+                 event_type=None,
+                 cache=None):
+        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type,
+                         cache=cache)
         self._all_symbols = []
         self._format_markets()
         self.running = False
@@ -104,7 +106,7 @@ class CoinbaseListener(WebsocketListener):
         #TODO: remove if statement below
         if market_key not in self.last_update_ids.keys():
             self.last_update_ids[market_key] = 0
-        timestamp = datetime.now()
+        timestamp = parse_date(update["time"]) if "time" in update else datetime.now()
         for order in update["changes"]:
             order[0] = "bid" if order[0] == "buy" else "ask"
             agg_orders.append(
@@ -3,6 +3,7 @@ import logging
 
 from datetime import datetime
 from os import path
+import time
 
 from dateutil.parser import parse as parse_date
 import websockets
@@ -26,9 +27,15 @@ class HitBTCListener(WebsocketListener):
                  markets=settings.HITBTC_MARKETS,
                  ws_url=settings.HITBTC_WS_URL,
                  session=db.session,
-                 event_type=None):
-        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type)
+                 event_type=None,
+                 cache=None):
+        super().__init__(exchange, on_event, markets, ws_url, session=session, event_type=event_type,
+                         cache=cache)
         self._all_symbols = []
+        self._request_id = 0
+        self._pending_subscriptions = {}
+        self._subscribe_started_at = None
+        self.subscription_stats = dict(requests=0, errors=0, time_to_subscribed=None)
 
     def _get_uri(self, endpoint):
         return path.join(settings.HITBTC_API, endpoint)
@@ -47,11 +54,12 @@ class HitBTCListener(WebsocketListener):
 
     async def get_markets(self):
         async with aiohttp.ClientSession() as session:
-            symbols = await self.fetch_all_symbols(session)
-            self._all_symbols = symbols
             markets_uri = self._get_uri(settings.HITBTC_API_MARKETS)
             logging.debug("hitbtc - markets uri - %s", markets_uri)
-            markets = await self._fetch(session, markets_uri)
+            symbols, markets = await asyncio.gather(
+                self.fetch_all_symbols(session),
+                self._fetch(session, markets_uri))
+            self._all_symbols = symbols
             logging.debug("hitbtc - markets retrieved: %s", markets)
             actions = self._parse_markets(markets)
             self.on_event(actions)
@@ -111,6 +119,8 @@ class HitBTCListener(WebsocketListener):
             if func:
                 return func(payload)
             return []
+        elif "id" in message.keys():
+            return self._parse_response(message)
         else:
             logging.warning("unknown message received < '{}'".format(message))
             return []
@@ -171,38 +181,64 @@ class HitBTCListener(WebsocketListener):
         return [actions.InsertAction(orders)]
 
     async def _setup_connection(self, websocket):
+        """sends the subscriptions of all the markets at once without waiting for the responses, which are
+        correlated to their request by id in `_parse_message`. The initial order books and trades are
+        received as notifications and go through the normal parse path
+        """
         async with aiohttp.ClientSession() as session:
             self._all_symbols = await self.fetch_all_symbols(session)           
+        self._subscribe_started_at = time.time()
+        self._pending_subscriptions = {}
+        self.subscription_stats = dict(requests=0, errors=0, time_to_subscribed=None)
+        events = []
         for market in self.markets:
-            logging.info("market: %s", market)
             if self.event_type is None or self.event_type == "depth":
-                orderbook_message = await self._subscribe_orderbook(market, websocket)
-                self._log_event(market, "connect", "agg_order_book")
-                self._parse_message(orderbook_message)
+                await self._subscribe_orderbook(market, websocket)
+                events.append((market, "connect", "agg_order_book"))
             if self.event_type is None or self.event_type == "trade":
-                trades_message = await self._subscribe_trades(market, websocket)
-                self._log_event(market, "connect", "trades")
-                self._parse_message(trades_message)
+                await self._subscribe_trades(market, websocket)
+                events.append((market, "connect", "trades"))
+        logging.info("hitbtc - %s subscriptions sent for %s markets", len(self._pending_subscriptions), len(self.markets))
+        self._log_events(events)
 
     async def _send_suscribe_message(self, method, params, websocket):
-        message = dict(method=method, id=settings.HITBTC_API_KEY)
-        message["params"] = params
+        self._request_id += 1
+        message = dict(method=method, params=params, id=self._request_id)
+        self._pending_subscriptions[self._request_id] = (method, params["symbol"])
+        self.subscription_stats["requests"] += 1
+        logging.debug("> %s", message)
         await websocket.send(json.dumps(message))
-        response = await websocket.recv()
-        logging.debug("< %s", response)
-        return json.loads(response)
     
     async def _subscribe_orderbook(self, market, websocket):
         params = {"symbol": market.upper()}
-        return await self._send_suscribe_message("subscribeOrderbook", params, websocket) 
+        await self._send_suscribe_message("subscribeOrderbook", params, websocket) 
         
     async def _subscribe_trades(self, market, websocket):
         params = {"symbol": market.upper(), "limit": TRADES_LIMIT}
-        return await self._send_suscribe_message("subscribeTrades", params, websocket)
+        await self._send_suscribe_message("subscribeTrades", params, websocket)
+
+    def _parse_response(self, response):
+        request = self._pending_subscriptions.pop(response["id"], None)
+        if request is None:
+            logging.warning("hitbtc - response to unknown request < '%s'", response)
+            return []
+        method, symbol = request
+        if "error" in response:
+            self.subscription_stats["errors"] += 1
+            logging.error("hitbtc - %s failed for '%s': %s", method, symbol, response["error"])
+        if not self._pending_subscriptions:
+            elapsed = time.time() - self._subscribe_started_at
+            self.subscription_stats["time_to_subscribed"] = elapsed
+            logging.info("hitbtc - fully subscribed in %.2f seconds - %s requests, %s errors", elapsed,
+                         self.subscription_stats["requests"], self.subscription_stats["errors"])
+        return []
 
     def _parse_updateTrades(self, trades):
         return self._parse_raw_trades(trades)
 
+    def _parse_snapshotTrades(self, trades):
+        return self._parse_raw_trades(trades)
+
     def _parse_raw_trades(self, snapshot):
         market = self._parse_market_to_symbols(snapshot["symbol"], self._all_symbols)
         trades = []
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+import logging
+import os
+from os import path
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from . import db
+from . import models
+from . import settings
+from .loader import load_arrays, TIMESTAMP_DTYPE, DEFAULT_CHUNK_SIZE
+
+# exported columns of each table with their numpy dtype; null integers are exported as -1
+EXPORT_COLUMNS = {
+    "trades": [
+        ("timestamp", TIMESTAMP_DTYPE),
+        ("exchange_trade_id", str),
+        ("trade_type", str),
+        ("price", float),
+        ("size", float),
+    ],
+    "aggregate_orders": [
+        ("timestamp", TIMESTAMP_DTYPE),
+        ("last_update_id", np.int64),
+        ("order_type", str),
+        ("price", float),
+        ("size", float),
+    ],
+    "order_book_snapshots": [
+        ("timestamp", TIMESTAMP_DTYPE),
+        ("snapshot_type", str),
+        ("mid_price_range", float),
+        ("snapshot_interval", np.int64),
+        ("spread", float),
+        ("bids_volume", float),
+        ("asks_volume", float),
+        ("bids_count", np.int64),
+        ("asks_count", np.int64),
+        ("bids_price_stddev", float),
+        ("asks_price_stddev", float),
+        ("bids_price_mean", float),
+        ("asks_price_mean", float),
+        ("min_ask_price", float),
+        ("min_ask_size", float),
+        ("max_bid_price", float),
+        ("max_bid_size", float),
+        ("bid_price_median", float),
+        ("ask_price_median", float),
+    ],
+}
+
+
+def iter_days(start_time, stop_time):
+    """yields the (start, stop) bounds of every day between `start_time` and `stop_time`
+
+    >>> [(start.hour, stop.day) for start, stop in iter_days(datetime(2019, 5, 15, 12), datetime(2019, 5, 16, 6))]
+    [(12, 16), (0, 16)]
+    """
+    day_start = start_time
+    while day_start < stop_time:
+        day_stop = min(datetime(day_start.year, day_start.month, day_start.day) + timedelta(days=1), stop_time)
+        yield day_start, day_stop
+        day_start = day_stop
+
+
+def load_columns(directory, mmap_mode="r"):
+    """loads the columns of a day exported in the `npy` format, memory mapped by default
+    """
+    return {
+        path.splitext(filename)[0]: np.load(path.join(directory, filename), mmap_mode=mmap_mode)
+        for filename in sorted(os.listdir(directory)) if filename.endswith(".npy")
+    }
+
+
+class Exporter:
+    """exports the rows of a market within a time range to columnar files, one per exchange, market and day,
+    under `<output_dir>/<table>/<exchange>/<BUY>_<SELL>/<YYYY-MM-DD>`. Rows are streamed from a server side
+    cursor in chunks of `chunk_size` and only the columns of the current day are kept in memory.
+    The `npy` format writes one file per column which can be memory mapped with `np.load(..., mmap_mode="r")`
+    """
+    def __init__(self, exchange, buy_sym_id, sell_sym_id, start_time, stop_time, output_dir,
+                 tables=None,
+                 file_format="npy",
+                 session=db.session,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        if file_format not in settings.EXPORT_FORMATS:
+            raise ValueError("unknown export format '{}'".format(file_format))
+        if file_format == "parquet" and pyarrow is None:
+            raise ValueError("pyarrow is required to export to parquet")
+        self.exchange = exchange
+        self.buy_sym_id = buy_sym_id.upper()
+        self.sell_sym_id = sell_sym_id.upper()
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.output_dir = output_dir
+        self.tables = tables or list(settings.EXPORT_TABLES)
+        self.file_format = file_format
+        self.session = session
+        self.chunk_size = chunk_size
+
+    def run(self):
+        """exports all tables and returns the paths written
+        """
+        exchange = self.session.query(models.Exchange).filter_by(name=self.exchange).one()
+        written = []
+        for table in self.tables:
+            for day_start, day_stop in iter_days(self.start_time, self.stop_time):
+                columns = self._fetch_columns(table, exchange.id, day_start, day_stop)
+                n = len(columns["timestamp"])
+                if not n:
+                    continue
+                written.append(self._write(table, day_start, columns))
+                logging.info("exported %s rows of %s - %s - '%s-%s' - %s", n, table, self.exchange.upper(),
+                             self.buy_sym_id, self.sell_sym_id, day_start.date())
+        return written
+
+    def _fetch_columns(self, table, exchange_id, start_time, stop_time):
+        column_types = EXPORT_COLUMNS[table]
+        query = (
+            """
+            select {columns}
+            from {table}
+            where exchange_id = :exchange_id
+            and buy_sym_id = :buy_sym_id
+            and sell_sym_id = :sell_sym_id
+            and timestamp >= :start_time
+            and timestamp < :stop_time
+            order by timestamp asc
+            """.format(columns=", ".join(name for name, _ in column_types), table=table)
+        )
+        return load_arrays(query, {"exchange_id": exchange_id, "buy_sym_id": self.buy_sym_id,
+            "sell_sym_id": self.sell_sym_id, "start_time": start_time, "stop_time": stop_time},
+            column_types, self.session, self.chunk_size)
+
+    def _write(self, table, day, columns):
+        market_dir = path.join(self.output_dir, table, self.exchange,
+                               "{}_{}".format(self.buy_sym_id, self.sell_sym_id))
+        day_path = path.join(market_dir, "{:%Y-%m-%d}".format(day))
+        if self.file_format == "npy":
+            os.makedirs(day_path, exist_ok=True)
+            for name, values in columns.items():
+                np.save(path.join(day_path, name + ".npy"), values)
+            return day_path
+        os.makedirs(market_dir, exist_ok=True)
+        if self.file_format == "npz":
+            np.savez(day_path + ".npz", **columns)
+            return day_path + ".npz"
+        pyarrow.parquet.write_table(pyarrow.Table.from_pydict(columns), day_path + ".parquet")
+        return day_path + ".parquet"
@@ -0,0 +1,391 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import logging
+
+import sqlalchemy
+
+from . import models
+from . import settings
+from .actions import Action, InsertAction, add_order_book_updates
+from .spill import SpillQueue, is_connection_error
+
+DATA_TYPES = ["depth", "trade", "other"]
+OVERFLOW_POLICIES = ["block", "conflate", "spill"]
+# only depth updates can be conflated, as only the latest size of a price level matters to the order book
+CONFLATABLE_DATA_TYPES = ["depth"]
+# only inserts can be serialized to a spill queue
+SPILLABLE_DATA_TYPES = ["depth", "trade"]
+DEFAULT_OVERFLOW_POLICIES = {"depth": "conflate", "trade": "block", "other": "block"}
+
+
+def get_data_type(action):
+    if isinstance(action, InsertAction):
+        if action.item_type is models.AggOrder:
+            return "depth"
+        if action.item_type is models.Trade:
+            return "trade"
+    return "other"
+
+
+def count_rows(action):
+    if isinstance(action, InsertAction):
+        return len(action.items)
+    return 1
+
+
+def conflate_depth_updates(agg_orders, latest=None):
+    """adds `agg_orders`, which are in the order received, to `latest`, the latest update of every price level,
+    and returns it
+    """
+    if latest is None:
+        latest = {}
+    for order in agg_orders:
+        key = (order.exchange_id, order.buy_sym_id, order.sell_sym_id, order.order_type, order.price)
+        latest.pop(key, None)
+        latest[key] = order
+    return latest
+
+
+def parse_overflow_policies(values):
+    """parses a list of `<data type>=<policy>` into a dict
+
+    >>> parse_overflow_policies(["depth=spill", "trade=block"])
+    {'depth': 'spill', 'trade': 'block'}
+    """
+    policies = {}
+    for value in values or []:
+        data_type, _, policy = value.partition("=")
+        policies[data_type] = policy
+    return policies
+
+
+class IngestBuffer:
+    """bounded buffer of the actions parsed by the listeners and not yet written to the db. Once more than
+    `max_rows` rows are buffered, the overflow policy of the data type of the new actions is applied:
+
+    * ``block``: the actions are buffered and the listeners stop reading from their websockets
+      (see `wait_writable`) until the buffer has room again
+    * ``conflate``: the buffered depth updates are merged to keep only the latest update of every price level.
+      The new depth updates are then merged as they are received until the merged updates are written
+    * ``spill``: the actions are appended to a `SpillQueue` in `spill_dir` and read back once the buffer
+      is empty
+
+    When conflating is not enough to get back under `max_rows`, the listeners are blocked as well.
+    """
+    def __init__(self, max_rows=settings.INGEST_BUFFER_ROWS, policies=None, spill_dir=settings.INGEST_SPILL_DIR):
+        policies = dict(DEFAULT_OVERFLOW_POLICIES, **(policies or {}))
+        for data_type, policy in policies.items():
+            if data_type not in DATA_TYPES:
+                raise ValueError("unknown data type '{}'".format(data_type))
+            if policy not in OVERFLOW_POLICIES:
+                raise ValueError("unknown overflow policy '{}'".format(policy))
+            if policy == "conflate" and data_type not in CONFLATABLE_DATA_TYPES:
+                raise ValueError("'{}' updates cannot be conflated".format(data_type))
+            if policy == "spill" and data_type not in SPILLABLE_DATA_TYPES:
+                raise ValueError("'{}' updates cannot be spilled".format(data_type))
+        self.max_rows = max_rows
+        self.policies = policies
+        self.spill_dir = spill_dir
+        self.rows = 0
+        self.stats = dict(max_buffered_rows=0, conflated=0, spilled=0, blocked=0)
+        self._entries = deque()
+        self._spill = None
+        self._spilling = set()
+        # latest update of every price level of the conflated depth updates, which are buffered as
+        # a single entry
+        self._conflated = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def __len__(self):
+        return self.rows + self.spilled_rows
+
+    @property
+    def spilled_rows(self):
+        return len(self._spill) if self._spill is not None else 0
+
+    def put(self, actions):
+        """buffers `actions`, applying the overflow policies
+        """
+        for action in actions:
+            data_type = get_data_type(action)
+            rows = count_rows(action)
+            if not rows:
+                continue
+            if self._should_spill(data_type):
+                self._spill_action(data_type, action)
+                continue
+            if data_type == "depth" and self._conflated is not None:
+                self._merge_depth_updates(action.items)
+                continue
+            self._entries.append((data_type, action, rows))
+            self.rows += rows
+        if self.rows > self.max_rows and self.policies["depth"] == "conflate" and self._conflated is None:
+            self._conflate()
+        self.stats["max_buffered_rows"] = max(self.stats["max_buffered_rows"], self.rows)
+        self._update_events()
+
+    def _should_spill(self, data_type):
+        if self.policies[data_type] != "spill":
+            return False
+        # once spilling, a data type keeps being spilled until the queue is drained to preserve ordering
+        return data_type in self._spilling or self.rows >= self.max_rows
+
+    def _spill_action(self, data_type, action):
+        if self._spill is None:
+            self._spill = SpillQueue(self.spill_dir)
+        if data_type not in self._spilling:
+            logging.warning("ingest buffer full - spilling %s updates to %s", data_type, self.spill_dir)
+            self._spilling.add(data_type)
+        self.stats["spilled"] += self._spill.append(action)
+
+    def _conflate(self):
+        """replaces the buffered depth updates with a single entry, whose updates are kept in `_conflated`
+        """
+        depth_orders = [order for data_type, action, _ in self._entries if data_type == "depth"
+                        for order in action.items]
+        self._entries = deque(entry for entry in self._entries if entry[0] != "depth")
+        self._entries.append(("depth", None, 0))
+        self.rows -= len(depth_orders)
+        self._conflated = {}
+        self._merge_depth_updates(depth_orders)
+
+    def _merge_depth_updates(self, agg_orders):
+        rows = len(self._conflated)
+        conflate_depth_updates(agg_orders, self._conflated)
+        new_rows = len(self._conflated) - rows
+        self.rows += new_rows
+        self.stats["conflated"] += len(agg_orders) - new_rows
+
+    def get_batch(self, max_rows):
+        """removes and returns actions totalling at least `max_rows` rows, or all the buffered actions.
+        Spilled actions are returned once all the buffered ones have been
+        """
+        actions = []
+        rows = 0
+        while self._entries and rows < max_rows:
+            _, action, action_rows = self._entries.popleft()
+            if action is None:
+                action = InsertAction(list(self._conflated.values()))
+                action_rows = len(action.items)
+                self._conflated = None
+                if not action_rows:
+                    continue
+            self.rows -= action_rows
+            rows += action_rows
+            actions.append(action)
+        while not self._entries and self._spill is not None and rows < max_rows:
+            action = self._spill.pop()
+            if action is None:
+                break
+            rows += len(action.items)
+            actions.append(action)
+        if self._spilling and not self.spilled_rows:
+            logging.info("ingest buffer - spilled updates replayed")
+            self._spilling.clear()
+        self._update_events()
+        return actions
+
+    def _update_events(self):
+        if len(self):
+            self._readable.set()
+        else:
+            self._readable.clear()
+        if self.rows < self.max_rows:
+            self._writable.set()
+        elif self._writable.is_set():
+            logging.warning("ingest buffer full - %s rows buffered, blocking listeners", self.rows)
+            self.stats["blocked"] += 1
+            self._writable.clear()
+
+    async def wait_writable(self):
+        """waits until the buffer has room for new actions
+        """
+        await self._writable.wait()
+
+    async def wait_readable(self, timeout):
+        """waits at most `timeout` seconds for actions to be buffered
+        """
+        try:
+            await asyncio.wait_for(self._readable.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+
+class BufferedWriter:
+    """writes the actions of an `IngestBuffer` to the db in a dedicated thread, which owns `session`, and commits
+    every `commit_interval` rows. After a db error caused by the data, the uncommitted actions are written again
+    one by one, dropping the ones which fail. If the db is unavailable, they are spilled to `backlog`, or lost
+    without one, and replayed in order once the db is back
+    """
+    def __init__(self, buffer: IngestBuffer, session, commit_interval, deduplicator=None, backlog=None):
+        self.buffer = buffer
+        self.session = session
+        self.commit_interval = commit_interval
+        self.deduplicator = deduplicator
+        self.backlog = backlog
+        self.running = False
+        self.dropped_actions = 0
+        self._commits = 0
+        self._rows_modified = 0
+        self._uncommitted = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run_in_thread(self, func, *args):
+        """runs `func` in the writer thread
+        """
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def run(self):
+        """writes the buffered actions while running, then until the buffer and the backlog are drained
+        """
+        while self.running or self.buffer or self._can_replay():
+            actions = self.buffer.get_batch(self.commit_interval)
+            if self.backlog is not None and len(self.backlog):
+                # the backlog is written and read in the writer thread so that its disk io does not block
+                # the listeners
+                replayed = await self.run_in_thread(self._spill_and_replay, actions)
+                if not actions and not replayed:
+                    await self.buffer.wait_readable(timeout=1.0)
+                continue
+            if not actions:
+                await self.buffer.wait_readable(timeout=1.0)
+                continue
+            try:
+                await self.run_in_thread(self.execute, actions)
+            except sqlalchemy.exc.DBAPIError as e:
+                logging.error("db error while writing %s actions: %s", len(actions), e)
+                await self.run_in_thread(self.on_db_error, e)
+        await self.run_in_thread(self.flush)
+        self.buffer.close()
+        logging.info("ingest buffer stopped - dropped actions: %s, stats: %s", self.dropped_actions, self.buffer.stats)
+        if self.backlog is not None:
+            await self.run_in_thread(self.backlog.close)
+            logging.info("db backlog stopped - %s rows left, stats: %s", len(self.backlog), self.backlog.stats)
+
+    def execute(self, actions: List[Action]):
+        self._uncommitted.extend(actions)
+        if self.deduplicator is not None:
+            self.deduplicator.track(actions)
+        for action in add_order_book_updates(actions):
+            self._rows_modified += action.execute(self.session)
+        if self._rows_modified >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        logging.info("commit number [%s]: committing %s rows", self._commits, self._rows_modified)
+        logging.info("ingest buffer - buffered rows: %s, spilled rows: %s, dropped actions: %s, stats: %s",
+                     self.buffer.rows, self.buffer.spilled_rows, self.dropped_actions, self.buffer.stats)
+        if self.backlog is not None and len(self.backlog):
+            logging.info("db backlog - %s rows left, draining at %.1f rows/s",
+                         len(self.backlog), self.backlog.drain_rate())
+        if self.deduplicator is not None:
+            logging.info("trade cache - stats: %s", self.deduplicator.stats)
+        self.session.commit()
+        self._committed()
+        self._commits += 1
+
+    def flush(self):
+        """commits the pending rows, handling the db errors
+        """
+        try:
+            self.session.commit()
+            self._committed()
+        except sqlalchemy.exc.DBAPIError as e:
+            logging.error("db error while committing: %s", e)
+            self.on_db_error(e)
+
+    def on_db_error(self, error):
+        """rolls back the session. If the db is unavailable, the uncommitted actions are spilled to the backlog,
+        or lost without one. Otherwise the error is caused by the data and the uncommitted actions are written
+        again one by one, dropping the ones which fail
+        """
+        self._rollback()
+        actions, self._uncommitted = self._uncommitted, []
+        if not is_connection_error(error):
+            try:
+                self._write_isolated(actions)
+                return
+            except sqlalchemy.exc.DBAPIError as e:
+                logging.error("db error while writing %s actions one by one: %s", len(actions), e)
+                self._rollback()
+        if self.backlog is not None:
+            self.backlog.on_db_error()
+            self.backlog.spill(actions)
+
+    def _can_replay(self):
+        return self.backlog is not None and self.backlog.can_replay()
+
+    def _spill_and_replay(self, actions: List[Action]):
+        """appends `actions` to the backlog, after which they are written to preserve their order, then writes
+        the next batch of the backlog if the db should be available and returns whether it succeeded
+        """
+        self.backlog.spill(actions)
+        if not self.backlog.can_replay():
+            return False
+        actions = self.backlog.next_batch(self.commit_interval)
+        try:
+            self._write_batch(actions)
+        except sqlalchemy.exc.DBAPIError as e:
+            logging.error("db error while replaying %s actions: %s", len(actions), e)
+            self.on_db_error(e)
+            return False
+        self.backlog.on_batch_written()
+        return True
+
+    def _write_batch(self, actions: List[Action]):
+        """writes and commits replayed actions, dropping the ones which cannot be written.
+        Raises the errors caused by the db being unavailable
+        """
+        try:
+            self.execute(actions)
+            if self._rows_modified:
+                self.commit()
+        except sqlalchemy.exc.DBAPIError as e:
+            if is_connection_error(e):
+                raise
+            logging.error("db error while replaying %s actions: %s", len(actions), e)
+            self._rollback()
+            self._write_isolated(actions)
+        finally:
+            # the actions are kept by the backlog until they are written
+            self._uncommitted = []
+
+    def _write_isolated(self, actions: List[Action]):
+        """writes every action in its own savepoint and commits, dropping the actions which fail.
+        Raises the errors caused by the db being unavailable
+        """
+        for action in actions:
+            try:
+                with self.session.begin_nested():
+                    for update in add_order_book_updates([action]):
+                        update.execute(self.session)
+                if self.deduplicator is not None:
+                    self.deduplicator.track([action])
+            except sqlalchemy.exc.DBAPIError as e:
+                if is_connection_error(e):
+                    raise
+                self.dropped_actions += 1
+                logging.error("dropping %s which cannot be written: %s", type(action).__name__, e)
+        self.session.commit()
+        self._committed()
+
+    def _committed(self):
+        self._uncommitted = []
+        self._rows_modified = 0
+        if self.deduplicator is not None:
+            self.deduplicator.on_commit()
+
+    def _rollback(self):
+        # the uncommitted actions are kept for on_db_error
+        self.session.rollback()
+        self._rows_modified = 0
+        if self.deduplicator is not None:
+            self.deduplicator.on_rollback()
@@ -0,0 +1,70 @@
+from datetime import datetime
+import logging
+
+from . import models
+from . import settings
+from .actions import InsertAction
+from .order_book import OrderBook, compute_stats
+from .ob_snapshot_generator import create_snapshot
+
+
+
+class LiveSnapshotGenerator:
+    """maintains the order book of every market from the depth updates received by the exchange
+    listeners and creates `OrderBookSnapshot` rows from them, with the same statistics as `OBSnapshotGenerator`.
+    The books of an exchange are discarded when its listener disconnects, as the batch generator only
+    uses the data of a single connection window.
+    """
+
+    def __init__(self, exchange_listeners, mid_price_ranges=None, interval=settings.LIVE_SNAPSHOT_INTERVAL_SECONDS):
+        if not mid_price_ranges:
+            mid_price_ranges = [0]
+        self.mid_price_ranges = sorted(set(float(band or 0) for band in mid_price_ranges))
+        self.interval = interval
+        self._listeners = {listener.exchange.id: listener for listener in exchange_listeners}
+        self._disconnections = {}
+        self._books = {}
+
+    def on_actions(self, actions):
+        """applies the aggregated orders inserted by `actions` to the books.
+        Must be called before the actions are executed, as executing them detaches the inserted items
+        """
+        for action in actions:
+            if not isinstance(action, InsertAction) or action.item_type is not models.AggOrder:
+                continue
+            for order in action.items:
+                self._check_disconnection(order.exchange_id)
+                key = (order.exchange_id, order.buy_sym_id, order.sell_sym_id)
+                book = self._books.get(key)
+                if book is None:
+                    book = self._books[key] = OrderBook()
+                book.apply(order.order_type, order.price, order.size, order.last_update_id)
+
+    def _check_disconnection(self, exchange_id):
+        listener = self._listeners.get(exchange_id)
+        if listener is None or self._disconnections.get(exchange_id, 0) == listener.disconnections:
+            return
+        self._disconnections[exchange_id] = listener.disconnections
+        self._books = {key: book for key, book in self._books.items() if key[0] != exchange_id}
+        logging.debug("live snapshots - discarded order books of exchange %s after disconnection", exchange_id)
+
+    def create_snapshots(self, timestamp=None):
+        """returns the actions inserting a snapshot of every known book for each mid price range
+        """
+        if timestamp is None:
+            timestamp = datetime.now().replace(microsecond=0)
+        for exchange_id in list(self._listeners):
+            self._check_disconnection(exchange_id)
+        snapshots = []
+        for (exchange_id, buy_sym_id, sell_sym_id), book in self._books.items():
+            metadata = dict(timestamp=timestamp, snapshot_interval=self.interval, exchange_id=exchange_id,
+                            buy_sym_id=buy_sym_id, sell_sym_id=sell_sym_id)
+            # the updates of a connection are received in order, so the removed levels cannot be restored
+            book.prune()
+            for band in self.mid_price_ranges:
+                bid_prices, bid_sizes, ask_prices, ask_sizes = book.select(band)
+                if len(bid_prices) and len(ask_prices):
+                    stats = compute_stats(bid_prices, bid_sizes, ask_prices, ask_sizes)
+                    snapshots.append(create_snapshot(stats, metadata, band))
+        logging.debug("live snapshots - %s snapshots created for %s order books", len(snapshots), len(self._books))
+        return [InsertAction(snapshots)]
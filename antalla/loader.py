@@ -0,0 +1,65 @@
+import numpy as np
+from sqlalchemy import text
+
+from . import db
+
+DEFAULT_CHUNK_SIZE = 100000
+TIMESTAMP_DTYPE = "datetime64[us]"
+
+
+def to_array(values, dtype):
+    """converts the values of a column to a numpy array, replacing the nulls of string and integer columns
+
+    >>> to_array([1, None], np.int64).tolist()
+    [1, -1]
+    >>> to_array(["bid", None], str).tolist()
+    ['bid', '']
+    >>> to_array([None, 0.5], float).tolist()
+    [nan, 0.5]
+    """
+    if dtype is str:
+        return np.array(["" if value is None else value for value in values], dtype=str)
+    if dtype is np.int64:
+        return np.array([-1 if value is None else value for value in values], dtype=dtype)
+    return np.array(values, dtype=dtype)
+
+
+def iter_chunks(query, params=None, session=db.session, chunk_size=DEFAULT_CHUNK_SIZE):
+    """executes `query` with a named server side cursor and yields its rows in lists of at most `chunk_size` rows
+    """
+    connection = session.connection().execution_options(stream_results=True)
+    result = connection.execute(text(query), params or {})
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        result.close()
+
+
+def load_arrays(query, params, columns, session=db.session, chunk_size=DEFAULT_CHUNK_SIZE):
+    """loads the result of `query` into one numpy array per column. `columns` is the list of (name, dtype)
+    of the selected columns, in order. Every chunk of rows is converted to arrays as soon as it is fetched,
+    so that at most `chunk_size` rows are held as python objects at any time
+    """
+    chunks = {name: [] for name, _ in columns}
+    for rows in iter_chunks(query, params, session, chunk_size):
+        for i, (name, dtype) in enumerate(columns):
+            chunks[name].append(to_array([row[i] for row in rows], dtype))
+    arrays = {}
+    for name, dtype in columns:
+        column_chunks = chunks.pop(name)
+        arrays[name] = np.concatenate(column_chunks) if column_chunks else to_array([], dtype)
+    return arrays
+
+
+def load_dataframe(query, params, columns, session=db.session, chunk_size=DEFAULT_CHUNK_SIZE, index=None):
+    """loads the result of `query` into a pandas DataFrame built from the arrays of `load_arrays`
+    """
+    import pandas as pd
+    df = pd.DataFrame(load_arrays(query, params, columns, session, chunk_size))
+    if index is not None:
+        df.index = df[index]
+    return df
@@ -1,32 +1,75 @@
 #%%
+import importlib.util
 import json
 import logging
+import os
 from os import path
 import pkg_resources
+import time
 
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+# lxml is optional and only used by BeautifulSoup
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
 
 from . import settings
 
 
 class MarketCrawler:
-    def __init__(self):
+    """fetches the USD prices of all coins from CoinMarketCap. Prices are cached in `cache_path`
+    and only fetched again once the cache is older than `cache_ttl` seconds
+    """
+    def __init__(self, cache_path=settings.PRICE_CACHE_PATH, cache_ttl=settings.PRICE_CACHE_TTL):
         self._http_session = None
         self._marketcap_url = settings.COINMARKETCAP_URL
         coinmarket_filepath = path.join("fixtures", "coinmarketcap-mappings.json")
         file_content = pkg_resources.resource_string(settings.PACKAGE, coinmarket_filepath)
         self._coins = {v["symbol"]: v["name"] for v in json.loads(file_content)}
         self._prices = {}
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
 
     async def get_price(self, symbol):
-        if not self._prices:
-            await self._fetch_prices()
-        price = self._prices.get(symbol, 0)
+        prices = await self.get_prices()
+        price = prices.get(symbol, 0)
         if not price:
             logging.info("coin name not found for: %s", symbol)
         return price
 
+    async def get_prices(self):
+        """returns the USD price of every coin listed, from the cache if it is still valid
+        """
+        if not self._prices:
+            self._prices = self._load_cache()
+        if not self._prices:
+            await self._fetch_prices()
+            self._save_cache()
+        return self._prices
+
+    def _load_cache(self):
+        if not self.cache_path or not path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("could not read price cache %s: %s", self.cache_path, e)
+            return {}
+        if time.time() - cache.get("fetched_at", 0) > self.cache_ttl:
+            return {}
+        logging.debug("using cached USD prices from %s", self.cache_path)
+        return cache.get("prices", {})
+
+    def _save_cache(self):
+        if not self.cache_path or not self._prices:
+            return
+        cache_dir = path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump(dict(fetched_at=time.time(), prices=self._prices), f)
+
     def get_coin_name(self, symbol):
         '''
         returns the full name for a given token symbol using the specified mapping
@@ -46,8 +89,11 @@ class MarketCrawler:
     async def _fetch_prices(self):
         async with aiohttp.ClientSession() as session:
             text = await self._fetch(session, settings.COINMARKETCAP_URL)
-            soup = BeautifulSoup(text, features="html.parser")
-            logging.debug("fetched HTML for all USD prices: %s", soup)
+        self._parse_prices(text)
+
+    def _parse_prices(self, text):
+        # only the table of prices is parsed
+        soup = BeautifulSoup(text, features=HTML_PARSER, parse_only=SoupStrainer("table", {"id": "currencies-all"}))
         tbody = soup.find("table", {"id": "currencies-all"}).tbody
         for row in tbody.find_all("tr"):
             symbol = row.find("td", {"class": "col-symbol"}).text
@@ -0,0 +1,40 @@
+"""create candle table
+
+Revision ID: 2f6d8b0c4e97
+Revises: 9a4c7e2b1d58
+Create Date: 2026-10-19 13:20:44.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6d8b0c4e97'
+down_revision = '9a4c7e2b1d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "candles",
+        sa.Column("exchange_id", sa.Integer, sa.ForeignKey("exchanges.id"), nullable=False, primary_key=True),
+        sa.Column("buy_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("sell_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("resolution", sa.String, nullable=False, primary_key=True),
+        sa.Column("timestamp", sa.DateTime, nullable=False, primary_key=True),
+        sa.Column("open", sa.Float, nullable=False),
+        sa.Column("high", sa.Float, nullable=False),
+        sa.Column("low", sa.Float, nullable=False),
+        sa.Column("close", sa.Float, nullable=False),
+        sa.Column("volume", sa.Float, nullable=False),
+        sa.Column("quote_volume", sa.Float, nullable=False),
+        sa.Column("vwap", sa.Float),
+        sa.Column("trade_count", sa.Integer, nullable=False),
+        sa.Index("candles_resolution_timestamp_index", "resolution", "timestamp"),
+    )
+
+
+def downgrade():
+    op.drop_table("candles")
@@ -0,0 +1,24 @@
+"""add exchange name unique index
+
+Revision ID: 3c7a9d1e5f04
+Revises: 8e1b5a7d3c62
+Create Date: 2026-10-19 15:12:41.503218
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7a9d1e5f04'
+down_revision = '8e1b5a7d3c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # conflict target of the bulk insert of the exchanges fixture
+    op.create_index("exchanges_name_index", "exchanges", ["name"], unique=True)
+
+
+def downgrade():
+    op.drop_index("exchanges_name_index", table_name="exchanges")
@@ -0,0 +1,37 @@
+"""add market scoped aggregate order indexes
+
+Revision ID: 5b8e0f6c3a21
+Revises: 7c2d9e41f0a3
+Create Date: 2026-10-19 11:48:05.902317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0f6c3a21'
+down_revision = '7c2d9e41f0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # both indexes carry all the columns read by the order book queries so they
+    # can be answered with index only scans
+    op.create_index(
+        "aggregate_orders_market_book_index",
+        "aggregate_orders",
+        ["exchange_id", "buy_sym_id", "sell_sym_id", "order_type", "price",
+         sa.text("last_update_id DESC"), "timestamp", "size"],
+    )
+    op.create_index(
+        "aggregate_orders_market_timestamp_index",
+        "aggregate_orders",
+        ["exchange_id", "buy_sym_id", "sell_sym_id", "timestamp", "order_type", "price", "size", "last_update_id"],
+    )
+
+
+def downgrade():
+    op.drop_index("aggregate_orders_market_timestamp_index", table_name="aggregate_orders")
+    op.drop_index("aggregate_orders_market_book_index", table_name="aggregate_orders")
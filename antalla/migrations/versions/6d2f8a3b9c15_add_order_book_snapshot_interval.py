@@ -0,0 +1,46 @@
+"""add the snapshot interval to the order book snapshots primary key
+
+Revision ID: 6d2f8a3b9c15
+Revises: 3c7a9d1e5f04
+Create Date: 2026-10-20 09:42:17.318645
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f8a3b9c15'
+down_revision = '3c7a9d1e5f04'
+branch_labels = None
+depends_on = None
+
+PRIMARY_KEY = ["timestamp", "snapshot_type", "mid_price_range", "buy_sym_id", "sell_sym_id", "exchange_id"]
+
+
+def upgrade():
+    # existing snapshots were generated with the default interval of 1 second
+    op.add_column("order_book_snapshots",
+                  sa.Column("snapshot_interval", sa.Integer, nullable=False, server_default="1"))
+    op.alter_column("order_book_snapshots", "snapshot_interval", server_default=None)
+    # snapshots of different intervals can share the same timestamp
+    op.drop_constraint("order_book_snapshots_pkey", "order_book_snapshots", type_="primary")
+    op.create_primary_key("order_book_snapshots_pkey", "order_book_snapshots",
+                          PRIMARY_KEY + ["snapshot_interval"])
+
+
+def downgrade():
+    op.execute("""
+        delete from order_book_snapshots s
+        using order_book_snapshots other
+        where s.timestamp = other.timestamp
+        and s.snapshot_type = other.snapshot_type
+        and s.mid_price_range = other.mid_price_range
+        and s.buy_sym_id = other.buy_sym_id
+        and s.sell_sym_id = other.sell_sym_id
+        and s.exchange_id = other.exchange_id
+        and s.snapshot_interval > other.snapshot_interval
+    """)
+    op.drop_constraint("order_book_snapshots_pkey", "order_book_snapshots", type_="primary")
+    op.create_primary_key("order_book_snapshots_pkey", "order_book_snapshots", PRIMARY_KEY)
+    op.drop_column("order_book_snapshots", "snapshot_interval")
@@ -0,0 +1,51 @@
+"""create current order book table
+
+Revision ID: 7c2d9e41f0a3
+Revises: e3f1c2a9b7d4
+Create Date: 2026-10-19 11:02:47.130562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d9e41f0a3'
+down_revision = 'e3f1c2a9b7d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "current_order_book",
+        sa.Column("exchange_id", sa.Integer, sa.ForeignKey("exchanges.id"), nullable=False, primary_key=True),
+        sa.Column("first_coin_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("second_coin_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("order_type", sa.String, nullable=False, primary_key=True),
+        sa.Column("price", sa.Float, nullable=False, primary_key=True),
+        sa.Column("buy_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False),
+        sa.Column("sell_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False),
+        sa.Column("size", sa.Float, nullable=False),
+        sa.Column("last_update_id", sa.Integer),
+        sa.Column("timestamp", sa.DateTime, nullable=False),
+    )
+    op.execute(
+        """
+        insert into current_order_book (exchange_id, first_coin_id, second_coin_id, order_type, price,
+                                        buy_sym_id, sell_sym_id, size, last_update_id, timestamp)
+        select exchange_id, first_coin_id, second_coin_id, order_type, price,
+               buy_sym_id, sell_sym_id, size, last_update_id, timestamp
+        from (
+            select distinct on (exchange_id, first_coin_id, second_coin_id, order_type, price) *
+            from aggregate_orders
+            where last_update_id is not null
+            order by exchange_id, first_coin_id, second_coin_id, order_type, price, last_update_id desc
+        ) latest_orders
+        where size > 0
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("current_order_book")
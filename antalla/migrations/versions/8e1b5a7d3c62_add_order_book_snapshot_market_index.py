@@ -0,0 +1,28 @@
+"""add order book snapshot market index
+
+Revision ID: 8e1b5a7d3c62
+Revises: 2f6d8b0c4e97
+Create Date: 2026-10-19 13:52:09.117640
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8e1b5a7d3c62'
+down_revision = '2f6d8b0c4e97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # serves the as-of lookups of the latest snapshot of a market before a given time
+    op.create_index(
+        "order_book_snapshots_market_index",
+        "order_book_snapshots",
+        ["exchange_id", "buy_sym_id", "sell_sym_id", "snapshot_type", "mid_price_range", "timestamp"],
+    )
+
+
+def downgrade():
+    op.drop_index("order_book_snapshots_market_index", table_name="order_book_snapshots")
@@ -0,0 +1,161 @@
+"""partition aggregate orders and trades by timestamp
+
+Revision ID: 9a4c7e2b1d58
+Revises: 5b8e0f6c3a21
+Create Date: 2026-10-19 12:31:20.416093
+
+"""
+from datetime import datetime, timedelta
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from antalla import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c7e2b1d58'
+down_revision = '5b8e0f6c3a21'
+branch_labels = None
+depends_on = None
+
+# the existing rows and the next `PARTITIONS_AHEAD` intervals are partitioned by the `PARTITION_INTERVAL`
+# configured when this revision is applied, which `antalla run` then keeps using to create later partitions
+PARTITIONED_TABLES = ("aggregate_orders", "trades")
+PARTITION_INTERVALS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+PARTITIONS_AHEAD = 7
+# server_version_num from which declarative partitioning supports primary keys,
+# indexes and row triggers on the partitioned table
+MIN_SERVER_VERSION = 110000
+
+# unique constraints of a partitioned table have to contain the partition key
+PRIMARY_KEYS = {
+    "aggregate_orders": ["hash_id"],
+    "trades": ["exchange_trade_id", "exchange_id"],
+}
+
+AGG_ORDERS_COUNT_TRIGGER = """
+    CREATE TRIGGER update_exchange_markets_agg_orders_count
+    AFTER INSERT ON aggregate_orders
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_agg_orders_count();
+"""
+
+
+def _supports_partitioning(conn):
+    return int(conn.execute(sa.text("show server_version_num")).scalar()) >= MIN_SERVER_VERSION
+
+
+def _get_partitioned_tables(conn):
+    query = sa.text("select relname from pg_class where relkind = 'p' and relname in :tables")
+    rows = conn.execute(query.bindparams(sa.bindparam("tables", expanding=True)), {"tables": list(PARTITIONED_TABLES)})
+    return [row[0] for row in rows]
+
+
+def _iter_partition_ranges(start, stop, interval):
+    # weekly partitions start on mondays
+    lower = datetime(start.year, start.month, start.day)
+    if interval == "week":
+        lower -= timedelta(days=lower.weekday())
+    while lower <= stop:
+        yield lower, lower + PARTITION_INTERVALS[interval]
+        lower += PARTITION_INTERVALS[interval]
+
+
+def _set_primary_key(table, columns):
+    op.drop_constraint("{}_pkey".format(table), table, type_="primary")
+    op.create_primary_key("{}_pkey".format(table), table, columns)
+
+
+def _set_latest_orders_index(columns):
+    op.drop_index("latest_orders_index", table_name="aggregate_orders")
+    op.create_index("latest_orders_index", "aggregate_orders", columns, unique=True)
+
+
+def _table_definition(conn, table):
+    """returns the index and foreign key definitions of `table`, except for its primary key
+    """
+    indexes = [row[0] for row in conn.execute(sa.text(
+        "select indexdef from pg_indexes where tablename = :table and indexname != :pkey"
+    ), {"table": table, "pkey": "{}_pkey".format(table)})]
+    foreign_keys = [tuple(row) for row in conn.execute(sa.text(
+        "select conname, pg_get_constraintdef(oid) from pg_constraint where conrelid = cast(:table as regclass) and contype = 'f'"
+    ), {"table": table})]
+    return indexes, foreign_keys
+
+
+def _partition_table(conn, table, interval):
+    indexes, foreign_keys = _table_definition(conn, table)
+    old_table = "{}_unpartitioned".format(table)
+    op.rename_table(table, old_table)
+    op.execute("create table {} (like {} including defaults) partition by range (timestamp)".format(table, old_table))
+
+    start, stop = conn.execute(sa.text("select min(timestamp), max(timestamp) from {}".format(old_table))).first()
+    now = datetime.now()
+    start = min(start or now, now)
+    stop = max(stop or now, now) + PARTITIONS_AHEAD * PARTITION_INTERVALS[interval]
+    for lower, upper in _iter_partition_ranges(start, stop, interval):
+        op.execute("create table {}_p{:%Y%m%d} partition of {} for values from ('{}') to ('{}')".format(
+            table, lower, table, lower.isoformat(), upper.isoformat()))
+    # catches rows outside of the created partitions, e.g. when `antalla run` has not been
+    # running to create them ahead of time
+    op.execute("create table {0}_default partition of {0} default".format(table))
+
+    op.execute("insert into {} select * from {}".format(table, old_table))
+    op.drop_table(old_table)
+    # the primary key and indexes are created after loading the rows and dropping the old table, which
+    # still holds their names, on the partitioned table so that they are created on every partition
+    op.create_primary_key("{}_pkey".format(table), table, PRIMARY_KEYS[table] + ["timestamp"])
+    for index in indexes:
+        op.execute(index)
+    for name, definition in foreign_keys:
+        op.execute("alter table {} add constraint {} {}".format(table, name, definition))
+
+
+def _unpartition_table(conn, table):
+    indexes, foreign_keys = _table_definition(conn, table)
+    partitioned_table = "{}_partitioned".format(table)
+    op.rename_table(table, partitioned_table)
+    op.execute("create table {} (like {} including defaults)".format(table, partitioned_table))
+    op.execute("insert into {} select * from {}".format(table, partitioned_table))
+    op.drop_table(partitioned_table)
+    op.create_primary_key("{}_pkey".format(table), table, PRIMARY_KEYS[table] + ["timestamp"])
+    for index in indexes:
+        op.execute(index)
+    for name, definition in foreign_keys:
+        op.execute("alter table {} add constraint {} {}".format(table, name, definition))
+
+
+def upgrade():
+    for table, columns in PRIMARY_KEYS.items():
+        _set_primary_key(table, columns + ["timestamp"])
+    _set_latest_orders_index(["order_type", "price", "last_update_id", "exchange_id", "timestamp"])
+
+    conn = op.get_bind()
+    if not _supports_partitioning(conn):
+        logging.warning("postgres >= 11 is required to partition %s, keeping regular tables",
+                        ", ".join(PARTITIONED_TABLES))
+        return
+    interval = settings.PARTITION_INTERVAL
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError("unknown partition interval '{}'".format(interval))
+    for table in PARTITIONED_TABLES:
+        _partition_table(conn, table, interval)
+    op.execute(AGG_ORDERS_COUNT_TRIGGER)
+
+
+def downgrade():
+    conn = op.get_bind()
+    partitioned_tables = _get_partitioned_tables(conn)
+    for table in partitioned_tables:
+        _unpartition_table(conn, table)
+    if "aggregate_orders" in partitioned_tables:
+        op.execute(AGG_ORDERS_COUNT_TRIGGER)
+
+    _set_latest_orders_index(["order_type", "price", "last_update_id", "exchange_id"])
+    for table, columns in PRIMARY_KEYS.items():
+        _set_primary_key(table, columns)
@@ -0,0 +1,31 @@
+"""drop the aggregate order index of the latest orders query
+
+Revision ID: b2e7f4a9c831
+Revises: 6d2f8a3b9c15
+Create Date: 2026-10-20 14:05:51.207314
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e7f4a9c831'
+down_revision = '6d2f8a3b9c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the order books are rebuilt by replaying the updates in chronological order,
+    # which is served by aggregate_orders_market_timestamp_index
+    op.drop_index("aggregate_orders_market_book_index", table_name="aggregate_orders")
+
+
+def downgrade():
+    op.create_index(
+        "aggregate_orders_market_book_index",
+        "aggregate_orders",
+        ["exchange_id", "buy_sym_id", "sell_sym_id", "order_type", "price",
+         sa.text("last_update_id DESC"), "timestamp", "size"],
+    )
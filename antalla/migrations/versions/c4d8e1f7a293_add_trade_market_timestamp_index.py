@@ -0,0 +1,29 @@
+"""add trade market timestamp index
+
+Revision ID: c4d8e1f7a293
+Revises: b2e7f4a9c831
+Create Date: 2026-10-21 09:12:37.584210
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e1f7a293'
+down_revision = 'b2e7f4a9c831'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # serves the lookup of the markets of the trades and the scan of the trades
+    # of every market from its latest candle
+    op.create_index(
+        "trades_market_timestamp_index",
+        "trades",
+        ["exchange_id", "buy_sym_id", "sell_sym_id", "timestamp"],
+    )
+
+
+def downgrade():
+    op.drop_index("trades_market_timestamp_index", table_name="trades")
@@ -0,0 +1,39 @@
+"""create order book checkpoint table
+
+Revision ID: e3f1c2a9b7d4
+Revises: 4070698d0213
+Create Date: 2026-10-19 10:12:31.418250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3f1c2a9b7d4'
+down_revision = '4070698d0213'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "order_book_checkpoints",
+        sa.Column("timestamp", sa.DateTime, nullable=False, primary_key=True),
+        sa.Column("buy_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("sell_sym_id", sa.String, sa.ForeignKey("coins.symbol"), nullable=False, primary_key=True),
+        sa.Column("exchange_id", sa.Integer, sa.ForeignKey("exchanges.id"), nullable=False, primary_key=True),
+        sa.Column("connect_time", sa.DateTime, nullable=False),
+        sa.Column("last_update_id", sa.Integer),
+        sa.Column("bid_prices", ARRAY(sa.Float), nullable=False),
+        sa.Column("bid_sizes", ARRAY(sa.Float), nullable=False),
+        sa.Column("bid_update_ids", ARRAY(sa.Integer), nullable=False),
+        sa.Column("ask_prices", ARRAY(sa.Float), nullable=False),
+        sa.Column("ask_sizes", ARRAY(sa.Float), nullable=False),
+        sa.Column("ask_update_ids", ARRAY(sa.Integer), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("order_book_checkpoints")
@@ -2,6 +2,7 @@ import hashlib
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
 from sqlalchemy import PrimaryKeyConstraint, UniqueConstraint, ForeignKeyConstraint, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declared_attr
 from .db import Base as AbstractBase
 
@@ -72,6 +73,10 @@ class Exchange(Base):
     markets_with_data = relationship("ExchangeMarket",
         primaryjoin="and_(Exchange.id == ExchangeMarket.exchange_id, ExchangeMarket.agg_orders_count > 0)")
 
+    __table_args__ = (
+        Index("exchanges_name_index", "name", unique=True),
+    )
+
     def __repr__(self):
         return f"Exchange(name='{self.name}')"
 
@@ -142,7 +147,8 @@ class Trade(Base):
 
     exchange = relationship("Exchange")
 
-    timestamp = Column(DateTime, nullable=False, index=True)
+    # part of the primary key as `trades` is partitioned by timestamp
+    timestamp = Column(DateTime, nullable=False, index=True, primary_key=True)
     trade_type = Column(String)
     buy_sym_id = Column(String,ForeignKey("coins.symbol"), nullable=False, index=True)
     buy_sym = relationship("Coin", foreign_keys=[buy_sym_id])
@@ -160,6 +166,10 @@ class Trade(Base):
     maker_order_id = Column(String, index=True)
     taker_order_id = Column(String, index=True)
 
+    __table_args__ = (
+        Index("trades_market_timestamp_index", "exchange_id", "buy_sym_id", "sell_sym_id", "timestamp"),
+    )
+
     def __repr__(self):
         return f"Trade(id={self.exchange_trade_id})"
 
@@ -181,7 +191,8 @@ class AggOrder(Base):
     
     hash_id = Column(String, primary_key=True)
     last_update_id = Column(Integer)
-    timestamp = Column(DateTime, index=True, nullable=False)
+    # part of the primary key as `aggregate_orders` is partitioned by timestamp
+    timestamp = Column(DateTime, index=True, nullable=False, primary_key=True)
     buy_sym_id = Column(String,ForeignKey("coins.symbol"), nullable=False, index=True)
     buy_sym = relationship("Coin", foreign_keys=[buy_sym_id])
     sell_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, index=True)
@@ -199,19 +210,40 @@ class AggOrder(Base):
 
     __table_args__ = (
         Index("latest_orders_index",
-            "order_type", "price", "last_update_id", "exchange_id", unique=True),
+            "order_type", "price", "last_update_id", "exchange_id", "timestamp", unique=True),
         Index("market_orders_index", "first_coin_id", "second_coin_id", "exchange_id"),
+        Index("aggregate_orders_market_timestamp_index", "exchange_id", "buy_sym_id", "sell_sym_id",
+              "timestamp", "order_type", "price", "size", "last_update_id"),
         ForeignKeyConstraint(["first_coin_id", "second_coin_id", "exchange_id"],
                              ["exchange_markets.first_coin_id", "exchange_markets.second_coin_id", "exchange_markets.exchange_id"])
     )
 
     @classmethod
     def index_elements(cls):
-        return ["order_type", "price", "last_update_id", "exchange_id"]
+        return ["order_type", "price", "last_update_id", "exchange_id", "timestamp"]
 
     def __repr__(self):
         return f"AggOrder(id={self.hash_id})"
 
+class CurrentOrder(Base):
+    __tablename__ = "current_order_book"
+
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), nullable=False, primary_key=True)
+    exchange = relationship("Exchange")
+    first_coin_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    second_coin_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    order_type = Column(String, nullable=False, primary_key=True)
+    price = Column(Float, nullable=False, primary_key=True)
+    buy_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False)
+    sell_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False)
+    size = Column(Float, nullable=False)
+    last_update_id = Column(Integer)
+    timestamp = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return "CurrentOrder(exchange_id={0}, order_type='{1}', price={2})".format(
+            self.exchange_id, self.order_type, self.price)
+
 class Market(Base):
     __tablename__ = "markets"
     first_coin_id = Column(String,ForeignKey("coins.symbol"), nullable=False, index=True, primary_key=True)
@@ -274,7 +306,7 @@ class ExchangeMarket(Base):
     def to_dict(self):
         market = dict(
             quoted_volume=self.quoted_volume,
-            quoted_vol_timestamp=self.quoted_vol_timestamp.isoformat(),
+            quoted_vol_timestamp=self.quoted_vol_timestamp and self.quoted_vol_timestamp.isoformat(),
             quoted_volume_id=self.quoted_volume_id,
             name=self.name,
             original_name=self.original_name,
@@ -306,6 +338,8 @@ class OrderBookSnapshot(Base):
     timestamp = Column(DateTime, nullable=False, primary_key=True)
     snapshot_type = Column(String, nullable=False, primary_key=True)
     mid_price_range = Column(Float, nullable=False, primary_key=True)
+    # interval in seconds of the series of the snapshot, as series of different intervals share timestamps
+    snapshot_interval = Column(Integer, nullable=False, primary_key=True)
     buy_sym_id = Column(String,ForeignKey("coins.symbol"), nullable=False, index=True, primary_key=True)
     buy_sym = relationship("Coin", foreign_keys=[buy_sym_id])
     sell_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, index=True, primary_key=True)
@@ -327,7 +361,62 @@ class OrderBookSnapshot(Base):
     max_bid_size = Column(Float, nullable=False)
     bid_price_median = Column(Float, nullable=False)
     ask_price_median = Column(Float, nullable=False)
-    
+
+    __table_args__ = (
+        Index("order_book_snapshots_market_index", "exchange_id", "buy_sym_id", "sell_sym_id",
+              "snapshot_type", "mid_price_range", "timestamp"),
+    )
+
+
+class OrderBookCheckpoint(Base):
+    __tablename__ = "order_book_checkpoints"
+
+    timestamp = Column(DateTime, nullable=False, primary_key=True)
+    buy_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    sell_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), nullable=False, primary_key=True)
+    exchange = relationship("Exchange", foreign_keys=[exchange_id])
+    connect_time = Column(DateTime, nullable=False)
+    last_update_id = Column(Integer)
+    bid_prices = Column(ARRAY(Float), nullable=False)
+    bid_sizes = Column(ARRAY(Float), nullable=False)
+    bid_update_ids = Column(ARRAY(Integer), nullable=False)
+    ask_prices = Column(ARRAY(Float), nullable=False)
+    ask_sizes = Column(ARRAY(Float), nullable=False)
+    ask_update_ids = Column(ARRAY(Integer), nullable=False)
+
+    def __repr__(self):
+        return "OrderBookCheckpoint(exchange_id={0}, market='{1}-{2}', timestamp='{3}')".format(
+            self.exchange_id, self.buy_sym_id, self.sell_sym_id, self.timestamp)
+
+
+class Candle(Base):
+    __tablename__ = "candles"
+
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), nullable=False, primary_key=True)
+    exchange = relationship("Exchange", foreign_keys=[exchange_id])
+    buy_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    sell_sym_id = Column(String, ForeignKey("coins.symbol"), nullable=False, primary_key=True)
+    resolution = Column(String, nullable=False, primary_key=True)
+    # start of the bar
+    timestamp = Column(DateTime, nullable=False, primary_key=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume = Column(Float, nullable=False)
+    quote_volume = Column(Float, nullable=False)
+    vwap = Column(Float)
+    trade_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("candles_resolution_timestamp_index", "resolution", "timestamp"),
+    )
+
+    def __repr__(self):
+        return "Candle(exchange_id={0}, market='{1}-{2}', resolution='{3}', timestamp='{4}')".format(
+            self.exchange_id, self.buy_sym_id, self.sell_sym_id, self.resolution, self.timestamp)
+
 
 class Event(Base):
     __tablename__ = "events"
@@ -1,13 +1,20 @@
+from functools import lru_cache
 import logging
 import re
 
-import seaborn as sns
-import matplotlib.pyplot as plt
-
 from antalla.db import session
+from antalla.reference_cache import reference_cache
+
 
+@lru_cache(maxsize=None)
+def _get_pyplot():
+    """imports the plotting libraries on first use as they are slow to import
+    """
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    sns.set_style("darkgrid")
+    return plt
 
-sns.set_style("darkgrid")
 
 class OrderBookAnalyser:
     def __init__(self, buy_sym_id, sell_sym_id, exchange):
@@ -20,17 +27,13 @@ class OrderBookAnalyser:
             temp = buy_sym_id
             buy_sym_id = sell_sym_id
             sell_sym_id = temp
-        original_market_result = list(session.execute("""
-        select original_name from exchange_markets
-        inner join exchanges e on exchange_markets.exchange_id = e.id
-        where e.name = :exchange and first_coin_id= :buy_sym_id and second_coin_id= :sell_sym_id
-        """, {"exchange": self.exchange, "buy_sym_id": buy_sym_id, "sell_sym_id": sell_sym_id}))
-        if not len(original_market_result):
+        original_name = reference_cache.get_original_market(self.exchange, buy_sym_id, sell_sym_id)
+        if original_name is None:
             self.running = False
             logging.info("No market '{}-{}' registered for '{}'".format(buy_sym_id, sell_sym_id, self.exchange))
             return None, None
         else:
-            original_market = re.split("[_-]", (original_market_result[0]["original_name"]))
+            original_market = re.split("[_-]", original_name)
             if len(original_market) > 1:
                 return original_market
             elif buy_sym_id+sell_sym_id == original_market[0]:
@@ -70,6 +73,7 @@ class OrderBookAnalyser:
         )
 
     def visualise_ob(self):
+        plt = _get_pyplot()
         ob_data = self.generate_depth_data()
         logging.info("order book size: %s - asks: %s - bids: %s",
                      ob_data["size"],
@@ -107,10 +111,6 @@ class OrderBookAnalyser:
         query = (
         """
         with order_book as (
-                  with latest_orders as (
-                      select order_type, price, max(last_update_id) max_update_id
-                      from aggregate_orders
-                      group by aggregate_orders.price, aggregate_orders.order_type)
                   select order_type,
                          price,
                          size,
@@ -119,13 +119,13 @@ class OrderBookAnalyser:
                          name,
                          buy_sym_id,
                          sell_sym_id
-                  from aggregate_orders
-                           inner join exchanges on aggregate_orders.exchange_id = exchanges.id
-                  where (order_type, price, last_update_id) in (select * from latest_orders)
-                    and size > 0
+                  from current_order_book
+                           inner join exchanges on current_order_book.exchange_id = exchanges.id
+                  where name = :exchange
+                    and first_coin_id = :first_coin_id
+                    and second_coin_id = :second_coin_id
                     and buy_sym_id = :buy_sym_id
                     and sell_sym_id = :sell_sym_id
-                    and name = :exchange
                   order by price asc
         ) select * from order_book where (order_book.order_type = 'bid' and order_book.price >= (
             select percentile_disc(0.75) within group (order by order_book.price)
@@ -139,20 +139,16 @@ class OrderBookAnalyser:
         ))
         """
         )
-        return session.execute(query, {"buy_sym_id": self.buy_sym_id.upper(), "sell_sym_id": self.sell_sym_id.upper(), "exchange": self.exchange.lower()})
+        return session.execute(query, self._get_query_params())
 
     def _get_ob_mid_price(self):
-        """ queries the database for the latest orderbook for the given pair
+        """ queries the `current_order_book` table for the latest orderbook for the given pair
         - for visualisation purposes not all orders are retrieved
         - orders are only retrieved if ask/bid prices lie below/above the median price, respectively
         """
         query = (
         """
         with order_book as (
-            with latest_orders as (
-                select order_type, price, max(last_update_id) max_update_id, exchange_id
-                from aggregate_orders ag
-                group by ag.price, ag.order_type, ag.exchange_id)
             select order_type,
                 price,
                 buy_sym_id,
@@ -161,13 +157,13 @@ class OrderBookAnalyser:
                 timestamp,
                 name,
                 sell_sym_id
-            from aggregate_orders
-                    inner join exchanges on aggregate_orders.exchange_id = exchanges.id
-            where (order_type, price, last_update_id, exchange_id) in (select * from latest_orders)
-            and size > 0
+            from current_order_book
+                    inner join exchanges on current_order_book.exchange_id = exchanges.id
+            where name = :exchange
+            and first_coin_id = :first_coin_id
+            and second_coin_id = :second_coin_id
             and buy_sym_id = :buy_sym_id
             and sell_sym_id = :sell_sym_id
-            and name = :exchange
             order by price asc
         ),
             mid_price as (
@@ -194,7 +190,13 @@ class OrderBookAnalyser:
         or (order_book.order_type = 'ask' and order_book.price <= 1.01 * mid_price.mid) order by timestamp desc
         """
         )
-        return session.execute(query, {"buy_sym_id": self.buy_sym_id.upper(), "sell_sym_id": self.sell_sym_id.upper(), "exchange": self.exchange.lower()})
+        return session.execute(query, self._get_query_params())
+
+    def _get_query_params(self):
+        buy_sym_id, sell_sym_id = self.buy_sym_id.upper(), self.sell_sym_id.upper()
+        first_coin_id, second_coin_id = sorted([buy_sym_id, sell_sym_id])
+        return {"buy_sym_id": buy_sym_id, "sell_sym_id": sell_sym_id, "exchange": self.exchange.lower(),
+                "first_coin_id": first_coin_id, "second_coin_id": second_coin_id}
 
     def _parse_ob(self, raw_ob):
         ob = []
@@ -1,36 +1,68 @@
-from datetime import datetime
 from datetime import timedelta
 from collections import defaultdict
+import heapq
+import multiprocessing
+import time
 
-import numpy as np
 import logging
 
 from . import db
 from . import models
+from . import settings
 from . import actions
+from .order_book import OrderBook, compute_stats
+
+REPLAY_CHUNK_SECONDS = 600
+
+# depth updates of a market within a time range in chronological order, served by the
+# 'aggregate_orders_market_timestamp_index' index
+ORDER_UPDATES_QUERY = """
+    select order_type, price, size, last_update_id, timestamp
+    from aggregate_orders
+    where exchange_id = :exchange_id
+    and buy_sym_id = :buy_sym_id
+    and sell_sym_id = :sell_sym_id
+    and timestamp >= :start_time
+    and timestamp < :stop_time
+    order by timestamp asc
+"""
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
 
-SNAPSHOT_INTERVAL_SECONDS = 1
-DEFAULT_COMMIT_INTERVAL = 100
 
 class OBSnapshotGenerator:
+    """ generates order book snapshots for every combination of the given mid price ranges and snapshot intervals.
+    A mid price range of 0 (or None) stands for quartile snapshots. All combinations are computed from a single
+    replay of the order book of each market. With `checkpoints_only`, only the order book checkpoints are generated,
+    every `checkpoint_interval` seconds and resuming from the latest checkpoint of each market.
+    """
     def __init__(self, exchanges, timestamp,
-                mid_price_range=None,
-                snapshot_interval=SNAPSHOT_INTERVAL_SECONDS,
+                mid_price_ranges=None,
+                snapshot_intervals=settings.SNAPSHOT_INTERVAL_SECONDS,
                 session=db.session,
-                commit_interval=DEFAULT_COMMIT_INTERVAL):
+                flush_size=settings.SNAPSHOT_FLUSH_SIZE,
+                checkpoint_interval=settings.SNAPSHOT_CHECKPOINT_INTERVAL_SECONDS,
+                checkpoints_only=False):
         self.exchanges = exchanges
         self.stop_time = timestamp
-        self.commit_interval = commit_interval
-        self.snapshot_interval = snapshot_interval
-        self.actions_buffer = []
-        self.commit_counter = 0  
+        self.flush_size = flush_size
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints_only = checkpoints_only
+        if checkpoints_only:
+            # a single timeline stepping from checkpoint to checkpoint
+            mid_price_ranges, snapshot_intervals = None, checkpoint_interval
+        self.snapshot_intervals = sorted(set(_as_list(snapshot_intervals)))
+        self.snapshots_buffer = []
+        self.checkpoints_buffer = []
+        self._last_checkpoint_time = None
+        self.commit_counter = 0
+        self.rows_written = 0
         self.session = session
-        self.mid_price_range = mid_price_range
-        if self.mid_price_range:
-            self._query_order_book = self._query_order_book_mid_price
-        else:
-            self.mid_price_range = 0
-            self._query_order_book = self._query_order_book_quartile
+        self.mid_price_ranges = sorted(set(float(band or 0) for band in _as_list(mid_price_ranges)))
 
     def _get_connection_window(self, last_update, key):
         connect_time = None
@@ -50,26 +82,81 @@ class OBSnapshotGenerator:
                     disconnect_time = con["timestamp"]
         return connect_time, disconnect_time
 
-    def run(self):
+    def run(self, jobs=1):
+        start_time = time.time()
+        work_units = self._get_work_units()
+        if jobs > 1 and len(work_units) > 1:
+            self._run_parallel(work_units, jobs)
+        else:
+            for work_unit in work_units:
+                self._snapshot_market(*work_unit)
+        self._flush_snapshots()
+        elapsed = time.time() - start_time
+        logging.info("completed order book snapshots - total commits: {} - rows: {} - {:.1f} rows/sec".format(
+            self.commit_counter, self.rows_written, self.rows_written / elapsed if elapsed > 0 else 0))
+
+    def _get_work_units(self):
+        """ returns the list of (exchange, market, last snapshot time per mid price range and interval) tuples for which
+        snapshots should be generated, in a deterministic order
+        """
         exchange_markets = self._query_exchange_markets()
-        parsed_exchange_markets = self._parse_exchange_markets(exchange_markets)  
+        parsed_exchange_markets = self._parse_exchange_markets(exchange_markets) or {}
         connection_events = self._query_connection_events()
         self._parse_connection_events(connection_events)
-        for exchange in parsed_exchange_markets:
-            snapshot_times = self._query_latest_snapshot(exchange)
-            parsed_snapshot_times = self._parse_snapshot_times(snapshot_times) 
+        work_units = []
+        for exchange in sorted(parsed_exchange_markets):
+            if self.checkpoints_only:
+                checkpoint_times = self._parse_checkpoint_times(self._query_latest_checkpoint(exchange))
+            else:
+                parsed_snapshot_times = self._parse_snapshot_times(self._query_latest_snapshot(exchange))
             for market in parsed_exchange_markets[exchange]:
                 market_key = exchange+market["buy_sym_id"]+market["sell_sym_id"]
-                last_update_time = self._get_last_update_time(market_key, parsed_snapshot_times)
-                logging.debug("last snapshot update: {}".format(last_update_time))
+                if self.checkpoints_only:
+                    last_update_times = {(0.0, self.checkpoint_interval): checkpoint_times.get(market_key)}
+                else:
+                    last_update_times = {
+                        (band, interval): self._get_last_update_time(market_key, parsed_snapshot_times, band, interval)
+                        for band in self.mid_price_ranges for interval in self.snapshot_intervals}
+                work_units.append((exchange, market, last_update_times))
+        return work_units
+
+    def _snapshot_market(self, exchange, market, last_update_times):
+        market_key = exchange+market["buy_sym_id"]+market["sell_sym_id"]
+        logging.info("order book snapshot - {} - '{}-{}'".format(exchange.upper(), market["buy_sym_id"], market["sell_sym_id"]))
+        timelines = []
+        for band in self.mid_price_ranges:
+            for interval in self.snapshot_intervals:
+                last_update_time = last_update_times.get((band, interval))
+                logging.debug("last snapshot update ({}, {}s): {}".format(band, interval, last_update_time))
                 connect_time, disconnect_time = self._get_connection_window(last_update_time, market_key)
-                logging.info("order book snapshot - {} - '{}-{}'".format(exchange.upper(), market["buy_sym_id"], market["sell_sym_id"]))
                 logging.debug("snapshot window - start time: {} - end time: {}".format(connect_time, disconnect_time))
-                self._generate_all_snapshots(connect_time, disconnect_time, last_update_time, market, exchange)
-        if len(self.actions_buffer) > 0:
-            self.session.commit()
-            self.commit_counter += 1
-        logging.info("completed order book snapshots - total commits: {}".format(self.commit_counter))
+                timelines.append(self._iter_snapshot_times(
+                    connect_time, disconnect_time, last_update_time, market_key, band, interval))
+        self._generate_series(exchange, market, timelines)
+
+    def _run_parallel(self, work_units, jobs):
+        """ distributes the work units across a pool of `jobs` processes, each with its own session.
+        Every market is generated independently from the others, so the persisted snapshots are
+        identical to the ones of a serial run
+        """
+        generator_kwargs = dict(
+            exchanges=self.exchanges,
+            timestamp=self.stop_time,
+            mid_price_ranges=self.mid_price_ranges,
+            snapshot_intervals=self.snapshot_intervals,
+            flush_size=self.flush_size,
+            checkpoint_interval=self.checkpoint_interval,
+            checkpoints_only=self.checkpoints_only,
+        )
+        logging.info("generating snapshots for %s markets using %s processes", len(work_units), jobs)
+        with multiprocessing.Pool(jobs, initializer=_init_worker,
+                                  initargs=(generator_kwargs, self.event_log)) as pool:
+            results = pool.imap_unordered(_run_work_unit, work_units)
+            for completed, (exchange, market, commits, rows) in enumerate(results, 1):
+                self.commit_counter += commits
+                self.rows_written += rows
+                logging.info("order book snapshot [%s/%s] - completed %s - '%s-%s'", completed, len(work_units),
+                             exchange.upper(), market["buy_sym_id"], market["sell_sym_id"])
 
     def _generate_all_snapshots(self, connect_time, disconnect_time, snapshot_time, market, exchange):
         """ call the snapshot generator method for order book states following a prespecified interval (seconds).
@@ -79,32 +166,22 @@ class OBSnapshotGenerator:
         the next time of a disconnection or the final stopping time is met.
         """
         market_key = exchange+market["buy_sym_id"]+market["sell_sym_id"]
+        timelines = [self._iter_snapshot_times(connect_time, disconnect_time, snapshot_time, market_key, band, interval)
+                     for band in self.mid_price_ranges for interval in self.snapshot_intervals]
+        self._generate_series(exchange, market, timelines)
+
+    def _iter_snapshot_times(self, connect_time, disconnect_time, snapshot_time, market_key, mid_price_range, interval):
+        """ yields the (snapshot time, mid price range, interval, connect time, disconnect time) of every snapshot to generate
+        at the given interval, moving on to the next connection window once a disconnection is reached
+        """
         if snapshot_time is not None:
-            snapshot_time += timedelta(seconds=self.snapshot_interval)
+            snapshot_time += timedelta(seconds=interval)
         else:
-            snapshot_time = connect_time + timedelta(seconds=self.snapshot_interval)
+            snapshot_time = connect_time + timedelta(seconds=interval)
         logging.debug("initial times - current snapshot: {} - connect: {} - disconnect: {}".format(snapshot_time, connect_time, disconnect_time))
         while snapshot_time < self.stop_time:
-            start_time = datetime.strftime(connect_time, '%Y-%m-%d %H:%M:%S.%f')
-            stop_time = datetime.strftime(snapshot_time, '%Y-%m-%d %H:%M:%S.%f')
-            logging.debug("start: {}, end: {}".format(connect_time, snapshot_time))
-            order_book = self._query_order_book(exchange, market["buy_sym_id"], market["sell_sym_id"], start_time, stop_time)
-            full_ob = self._parse_order_book(order_book)
-            if full_ob is None:
-                snapshot_time += timedelta(seconds=self.snapshot_interval)
-                continue
-            metadata = dict(timestamp=snapshot_time, exchange_id=market["exchange_id"], buy_sym_id=market["buy_sym_id"], sell_sym_id=market["sell_sym_id"])
-            snapshot = self._generate_snapshot(full_ob, metadata)
-            action = actions.InsertAction([snapshot])
-            action.execute(self.session)
-            if len(self.actions_buffer) >= self.commit_interval:
-                self.session.commit()
-                self.commit_counter += 1
-                logging.debug(" {}-{} - order book snapshot commit[{}]".format(market["buy_sym_id"], market["sell_sym_id"],self.commit_counter))
-            else:
-                self.actions_buffer.append(action)
-            logging.debug("order book snapshot created - {}".format(snapshot_time))
-            snapshot_time += timedelta(seconds=self.snapshot_interval)
+            yield snapshot_time, mid_price_range, interval, connect_time, disconnect_time
+            snapshot_time += timedelta(seconds=interval)
             if snapshot_time >= disconnect_time:
                 snapshot_time, disconnect_time = self._get_connection_window(snapshot_time, market_key)
                 connect_time = snapshot_time
@@ -112,6 +189,125 @@ class OBSnapshotGenerator:
                     snapshot_time = self.stop_time
                 logging.debug("new snapshot window - connect time: {} - disconnect time: {}".format(connect_time, disconnect_time))
 
+    def _generate_series(self, exchange, market, timelines):
+        """ generates the snapshots of all timelines from a single replay of the order book.
+        The order book of a connection window is rebuilt in memory by replaying its updates, starting from the latest
+        checkpoint of the window if there is one, and a new checkpoint is persisted every 'checkpoint_interval' seconds.
+        Timelines are merged chronologically so that every update is applied once, whatever the number of mid price
+        ranges and intervals.
+        """
+        book, updates, window_connect_time = None, None, None
+        last_snapshot_times = {}
+        for snapshot_time, band, interval, connect_time, disconnect_time in heapq.merge(*timelines):
+            if last_snapshot_times.get((band, interval)) == snapshot_time:
+                continue
+            last_snapshot_times[(band, interval)] = snapshot_time
+            if book is None or connect_time != window_connect_time or snapshot_time < book.timestamp:
+                book, updates = self._start_replay(exchange, market, connect_time, disconnect_time, snapshot_time)
+                window_connect_time = connect_time
+            if snapshot_time > book.timestamp:
+                logging.debug("start: {}, end: {}".format(connect_time, snapshot_time))
+                self._replay_updates(book, updates, snapshot_time)
+                if book.timestamp - self._last_checkpoint_time >= timedelta(seconds=self.checkpoint_interval):
+                    self._buffer_checkpoint(book, market, connect_time)
+            if self.checkpoints_only:
+                continue
+            bid_prices, bid_sizes, ask_prices, ask_sizes = book.select(band)
+            if len(bid_prices) and len(ask_prices):
+                metadata = dict(timestamp=snapshot_time, snapshot_interval=interval, exchange_id=market["exchange_id"],
+                                buy_sym_id=market["buy_sym_id"], sell_sym_id=market["sell_sym_id"])
+                stats = compute_stats(bid_prices, bid_sizes, ask_prices, ask_sizes)
+                self._buffer_snapshot(self._generate_snapshot(stats, metadata, band))
+                logging.debug("order book snapshot created - {}".format(snapshot_time))
+        self._flush_snapshots()
+
+    def _start_replay(self, exchange, market, connect_time, disconnect_time, snapshot_time):
+        """ returns the order book of the connection window starting at 'connect_time', restored from the latest
+        checkpoint before 'snapshot_time' if one exists, along with an iterator over the updates left to replay
+        """
+        book = self._restore_order_book(market, connect_time, snapshot_time)
+        self._last_checkpoint_time = book.timestamp
+        updates = self._iter_order_updates(exchange, market, book.timestamp, disconnect_time)
+        return book, _Peekable(updates)
+
+    def _replay_updates(self, book, updates, until):
+        while updates.peek() is not None and updates.peek()[4] <= until:
+            order_type, price, size, last_update_id, _timestamp = next(updates)
+            book.apply(order_type, price, size, last_update_id)
+        # the updates are replayed in chronological order, so the levels removed so far cannot be restored
+        book.prune()
+        book.timestamp = until
+
+    def _iter_order_updates(self, exchange, market, start_time, stop_time):
+        """ yields the depth updates of a market between 'start_time' (inclusive) and 'stop_time' (exclusive)
+        in chronological order, querying the db in chunks of 'REPLAY_CHUNK_SECONDS'
+        """
+        chunk_start = start_time
+        while chunk_start < stop_time:
+            chunk_stop = min(chunk_start + timedelta(seconds=REPLAY_CHUNK_SECONDS), stop_time)
+            yield from self._query_order_updates(market["exchange_id"], market["buy_sym_id"], market["sell_sym_id"], chunk_start, chunk_stop)
+            chunk_start = chunk_stop
+
+    def _query_order_updates(self, exchange_id, buy_sym_id, sell_sym_id, start_time, stop_time):
+        return list(self.session.execute(ORDER_UPDATES_QUERY, {"start_time": start_time, "stop_time": stop_time,
+            "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper(), "exchange_id": exchange_id}))
+
+    def _restore_order_book(self, market, connect_time, snapshot_time):
+        checkpoint = self.session.query(models.OrderBookCheckpoint).filter(
+            models.OrderBookCheckpoint.exchange_id == market["exchange_id"],
+            models.OrderBookCheckpoint.buy_sym_id == market["buy_sym_id"],
+            models.OrderBookCheckpoint.sell_sym_id == market["sell_sym_id"],
+            models.OrderBookCheckpoint.connect_time == connect_time,
+            models.OrderBookCheckpoint.timestamp <= snapshot_time,
+        ).order_by(models.OrderBookCheckpoint.timestamp.desc()).first()
+        if checkpoint is None:
+            return OrderBook(connect_time)
+        logging.debug("resuming order book replay from checkpoint - {}".format(checkpoint.timestamp))
+        return OrderBook.from_arrays(
+            checkpoint.timestamp,
+            checkpoint.last_update_id,
+            (checkpoint.bid_prices, checkpoint.bid_sizes, checkpoint.bid_update_ids),
+            (checkpoint.ask_prices, checkpoint.ask_sizes, checkpoint.ask_update_ids),
+        )
+
+    def _buffer_checkpoint(self, book, market, connect_time):
+        bid_prices, bid_sizes, bid_update_ids = book.to_arrays("bid")
+        ask_prices, ask_sizes, ask_update_ids = book.to_arrays("ask")
+        self.checkpoints_buffer.append(models.OrderBookCheckpoint(
+            timestamp=book.timestamp,
+            exchange_id=market["exchange_id"],
+            buy_sym_id=market["buy_sym_id"],
+            sell_sym_id=market["sell_sym_id"],
+            connect_time=connect_time,
+            last_update_id=book.last_update_id,
+            bid_prices=bid_prices,
+            bid_sizes=bid_sizes,
+            bid_update_ids=bid_update_ids,
+            ask_prices=ask_prices,
+            ask_sizes=ask_sizes,
+            ask_update_ids=ask_update_ids,
+        ))
+        self._last_checkpoint_time = book.timestamp
+
+    def _buffer_snapshot(self, snapshot):
+        self.snapshots_buffer.append(snapshot)
+        if len(self.snapshots_buffer) >= self.flush_size:
+            self._flush_snapshots()
+
+    def _flush_snapshots(self):
+        """ writes all buffered snapshots and checkpoints with multi-row inserts and commits them
+        """
+        if not self.snapshots_buffer and not self.checkpoints_buffer:
+            return
+        rows = actions.InsertAction(self.snapshots_buffer).execute(self.session)
+        actions.InsertAction(self.checkpoints_buffer).execute(self.session)
+        self.session.commit()
+        self.snapshots_buffer = []
+        self.checkpoints_buffer = []
+        self.rows_written += rows
+        self.commit_counter += 1
+        logging.debug("order book snapshot commit[{}] - {} rows".format(self.commit_counter, rows))
+
     def _query_exchange_markets(self):
         query = (
             """
@@ -127,11 +323,24 @@ class OBSnapshotGenerator:
     def _query_latest_snapshot(self, exchange):
         query = (
             """
-            select max(timestamp), buy_sym_id, sell_sym_id, exchange_id, e.name, mid_price_range, snapshot_type
+            select max(timestamp), buy_sym_id, sell_sym_id, exchange_id, e.name, mid_price_range, snapshot_type,
+                snapshot_interval
             from order_book_snapshots
             inner join exchanges e on order_book_snapshots.exchange_id = e.id
             where e.name = :exchange
-            group by buy_sym_id, sell_sym_id, exchange_id, e.name, mid_price_range, snapshot_type;
+            group by buy_sym_id, sell_sym_id, exchange_id, e.name, mid_price_range, snapshot_type, snapshot_interval;
+            """
+        )
+        return self.session.execute(query, {"exchange": exchange.lower()})
+
+    def _query_latest_checkpoint(self, exchange):
+        query = (
+            """
+            select max(timestamp), buy_sym_id, sell_sym_id, e.name
+            from order_book_checkpoints
+            inner join exchanges e on order_book_checkpoints.exchange_id = e.id
+            where e.name = :exchange
+            group by buy_sym_id, sell_sym_id, e.name;
             """
         )
         return self.session.execute(query, {"exchange": exchange.lower()})
@@ -149,9 +358,9 @@ class OBSnapshotGenerator:
         )
         return self.session.execute(query)
 
-    def _get_last_update_time(self, key, updates):
-        snapshot_type = "mid_price_range" if self.mid_price_range else "quartile"
-        key = key + str(self.mid_price_range) + snapshot_type
+    def _get_last_update_time(self, key, updates, mid_price_range, interval):
+        snapshot_type = "mid_price_range" if mid_price_range else "quartile"
+        key = key + str(mid_price_range) + snapshot_type + str(interval)
         if key in updates.keys():
             return updates[key]
         else:
@@ -160,9 +369,12 @@ class OBSnapshotGenerator:
     def _parse_snapshot_times(self, snapshot_updates):
         update_times = {}
         for update in list(snapshot_updates):
-            update_times[str(update[4])+str(update[1])+str(update[2])+str(update[5])+str(update[6])] = update[0]
+            update_times[str(update[4])+str(update[1])+str(update[2])+str(update[5])+str(update[6])+str(update[7])] = update[0]
         return update_times
 
+    def _parse_checkpoint_times(self, checkpoint_updates):
+        return {str(update[3])+str(update[1])+str(update[2]): update[0] for update in checkpoint_updates}
+
     def _parse_connection_events(self, events):
         self.event_log = defaultdict(list)
         for event in list(events):
@@ -181,195 +393,73 @@ class OBSnapshotGenerator:
             all_markets[market[0]].append(dict(buy_sym_id=market[1], sell_sym_id=market[2], exchange=market[0], exchange_id=market[3]))
         return all_markets
 
-    def _query_order_book_quartile(self, exchange, buy_sym_id, sell_sym_id, start_time, stop_time):
-        logging.debug("QUERY - quartile - order book")
-        query = (
-            """
-            with order_book as (
-            with latest_orders as (
-            select order_type, price, max(last_update_id) max_update_id, exchange_id
-            from aggregate_orders
-            where timestamp <= :stop_time
-            and timestamp >= :start_time
-            group by aggregate_orders.price,
-                        aggregate_orders.order_type, 
-                        aggregate_orders.exchange_id)
-            select order_type,
-                price,
-                size,
-                last_update_id,
-                timestamp,
-                name,
-                buy_sym_id,
-                sell_sym_id
-            from aggregate_orders
-                    inner join exchanges on aggregate_orders.exchange_id = exchanges.id
-            where (order_type, price, last_update_id, exchange_id) in (select * from latest_orders)
-            and size > 0
-            and buy_sym_id = :buy_sym_id
-            and sell_sym_id = :sell_sym_id
-            and name = :exchange
-            and timestamp <= :stop_time
-            and timestamp >= :start_time
-            )
-            select *
-            from order_book where (order_book.order_type = 'bid' and order_book.price >= (
-                select percentile_disc(0.75) within group (order by order_book.price)
-                from order_book
-                    where order_book.order_type = 'bid'
-            )) or (order_book.order_type = 'ask' and order_book.price <= (
-                select percentile_disc(0.25) within group (order by order_book.price)
-                from order_book
-                    where order_book.order_type = 'ask'
-            ))
-            """
-        )
-        return self.session.execute(query, {"stop_time": stop_time, "start_time": start_time, "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper(), "exchange": exchange.lower()})
+    def _generate_snapshot(self, full_ob_stats, metadata, mid_price_range):
+        return create_snapshot(full_ob_stats, metadata, mid_price_range)
 
 
-    def _query_order_book_mid_price(self, exchange, buy_sym_id, sell_sym_id, start_time, stop_time):
-        logging.debug("QUERY - mid price - order book")
-        query = (
-        """
-        with order_book as (
-            with latest_orders as (
-                select order_type, price, max(last_update_id) max_update_id, exchange_id
-                from aggregate_orders
-                where timestamp >= :start_time
-                and timestamp <= :stop_time
-                group by aggregate_orders.price, aggregate_orders.order_type, aggregate_orders.exchange_id)
-            select order_type,
-                price,
-                size,
-                last_update_id,
-                timestamp,
-                name,
-                buy_sym_id,
-                sell_sym_id
-            from aggregate_orders
-                    inner join exchanges on aggregate_orders.exchange_id = exchanges.id
-            where (order_type, price, last_update_id, exchange_id) in (select * from latest_orders)
-            and size > 0
-            and buy_sym_id = :buy_sym_id
-            and sell_sym_id = :sell_sym_id
-            and name = :exchange
-            and timestamp >= :start_time
-            and timestamp <= :stop_time
-            order by price asc
-        ),
-            mid_price as (
-                with max_min_prices as (
-                    with max_bid_price as (
-                        select max(price) max_bid
-                        from order_book
-                        where (order_book.order_type = 'bid')
-                    ),
-                        min_ask_price as (
-                            select min(price) min_ask
-                            from order_book
-                            where (order_book.order_type = 'ask')
-                        )
-                    select *
-                    from max_bid_price,
-                        min_ask_price)
-                select ((max_min_prices.min_ask + max_min_prices.max_bid) / 2) mid, max_bid, min_ask
-                from max_min_prices
-            )
-        select *
-        from order_book, mid_price
-        where (order_book.order_type = 'bid' and order_book.price >= (1- :range)* mid_price.mid)
-        or (order_book.order_type = 'ask' and order_book.price <= (1+ :range)* mid_price.mid)
-        order by timestamp desc
-        """
-        )
-        return self.session.execute(query, {"range": self.mid_price_range, "stop_time": stop_time, "start_time": start_time,
-        "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper(), "exchange": exchange.lower()})
+def create_snapshot(full_ob_stats, metadata, mid_price_range):
+    """ creates the snapshot row of an order book from its statistics (see `order_book.compute_stats`)
+    """
+    snapshot_type = "mid_price_range" if mid_price_range else "quartile"
+    return models.OrderBookSnapshot(
+        mid_price_range=mid_price_range,
+        snapshot_type=snapshot_type,
+        snapshot_interval=metadata["snapshot_interval"],
+        exchange_id=metadata["exchange_id"],
+        sell_sym_id=metadata["sell_sym_id"],
+        buy_sym_id=metadata["buy_sym_id"],
+        timestamp=metadata["timestamp"],
+        spread=full_ob_stats["spread"],
+        bids_volume=full_ob_stats["bids_volume"],
+        asks_volume=full_ob_stats["asks_volume"],
+        bids_count=full_ob_stats["bids_count"],
+        asks_count=full_ob_stats["asks_count"],
+        bids_price_stddev=full_ob_stats["bids_price_stddev"],
+        asks_price_stddev=full_ob_stats["asks_price_stddev"],
+        bids_price_mean=full_ob_stats["bids_price_mean"],
+        asks_price_mean=full_ob_stats["asks_price_mean"],
+        min_ask_price=full_ob_stats["min_ask_price"],
+        min_ask_size=full_ob_stats["min_ask_size"],
+        max_bid_price=full_ob_stats["max_bid_price"],
+        max_bid_size=full_ob_stats["max_bid_size"],
+        bid_price_median=full_ob_stats["bid_price_median"],
+        ask_price_median=full_ob_stats["ask_price_median"],
+    )
 
 
-    def _parse_order_book(self, order_book):
-        full_order_book = []
-        order_book = list(order_book)
-        logging.debug("ORDER BOOK: {}".format(order_book))
-        if len(order_book) == 0:
-            logging.debug("empty order book to be parsed")
-            return None
-        for order in order_book:
-            full_order_book.append(dict(
-                order_type=order[0],
-                price=order[1],
-                size=order[2]
-            ))
-        logging.debug("ob_snapshot_generator - parsed order books: 'full order book' ({} orders)".format(len(full_order_book)))
-        return full_order_book
-        
-    def _generate_snapshot(self, full_ob, metadata):
-        full_ob_stats = self._compute_stats(full_ob)
-        #quartile_ob_stats = self._compute_stats(quartile_ob)
-        snapshot_type = "mid_price_range" if self.mid_price_range else "quartile"
-        return models.OrderBookSnapshot(
-            mid_price_range=self.mid_price_range,
-            snapshot_type=snapshot_type,
-            exchange_id=metadata["exchange_id"],
-            sell_sym_id=metadata["sell_sym_id"],
-            buy_sym_id=metadata["buy_sym_id"],
-            timestamp=metadata["timestamp"],
-            spread=full_ob_stats["spread"],
-            bids_volume=full_ob_stats["bids_volume"], 
-            asks_volume=full_ob_stats["asks_volume"],
-            bids_count=full_ob_stats["bids_count"],
-            asks_count=full_ob_stats["asks_count"],
-            bids_price_stddev=full_ob_stats["bids_price_stddev"], 
-            asks_price_stddev=full_ob_stats["asks_price_stddev"], 
-            bids_price_mean=full_ob_stats["bids_price_mean"],
-            asks_price_mean= full_ob_stats["asks_price_mean"],
-            min_ask_price=full_ob_stats["min_ask_price"],
-            min_ask_size=full_ob_stats["min_ask_size"],
-            max_bid_price=full_ob_stats["max_bid_price"], 
-            max_bid_size=full_ob_stats["max_bid_size"], 
-            bid_price_median=full_ob_stats["bid_price_median"], 
-            ask_price_median=full_ob_stats["ask_price_median"], 
-            #bid_price_upper_quartile=quartile_ob_stats["bid_price_upper_quartile"],
-            #ask_price_lower_quartile=quartile_ob_stats["ask_price_lower_quartile"],
-            #bids_volume_upper_quartile=quartile_ob_stats["bids_volume"],
-            #asks_volume_lower_quartile=quartile_ob_stats["asks_volume"],
-            #bids_count_upper_quartile=quartile_ob_stats["bids_count"],
-            #asks_count_lower_quartile=quartile_ob_stats["asks_count"],
-            #bids_price_stddev_upper_quartile=quartile_ob_stats["bids_price_stddev"],
-            #asks_price_stddev_lower_quartile=quartile_ob_stats["asks_price_stddev"],
-            #bids_price_mean_upper_quartile=quartile_ob_stats["bids_price_mean"],
-            #asks_price_mean_lower_quartile=quartile_ob_stats["asks_price_mean"]
-        )
+class _Peekable:
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._next = next(iterator, None)
 
-    def _compute_stats(self, order_book):
-        bids = list(filter(lambda x: x["order_type"] == "bid", order_book))
-        asks = list(filter(lambda x: x["order_type"] == "ask", order_book))
-        bid_prices = list(map(lambda x: x["price"], bids))
-        ask_prices = list(map(lambda x: x["price"], asks))
-        avg_bid_price = 0 
-        if len(bids):
-            avg_bid_price = float(sum(d['price'] for d in bids)) / len(bids)
-        avg_ask_price = 0
-        if len(asks):
-            avg_ask_price = float(sum(d['price'] for d in asks)) / len(asks)
-        bids_volume = float(sum(d['price']*d['size'] for d in bids))
-        asks_volume = float(sum(d['price']*d['size'] for d in asks))
-        min_ask_size = max(list(d['size'] if d['price'] == min(ask_prices) else 0 for d in asks))
-        max_bid_size = max(list(d['size'] if d['price'] == max(bid_prices) else 0 for d in bids))
-        spread = float(float(min(ask_prices)) - float(max(bid_prices)))
-        return dict(
-            spread=spread,
-            min_ask_price=min(ask_prices),
-            min_ask_size=min_ask_size,
-            max_bid_price=max(bid_prices),
-            max_bid_size=max_bid_size,
-            bids_volume=bids_volume,
-            asks_volume=asks_volume,
-            bids_count = len(bids),
-            asks_count = len(asks),
-            bids_price_stddev = np.std(bid_prices),
-            asks_price_stddev = np.std(ask_prices),
-            bids_price_mean = avg_bid_price,
-            asks_price_mean = avg_ask_price,
-            bid_price_median = np.median(bid_prices),
-            ask_price_median = np.median(ask_prices)
-        )
+    def peek(self):
+        return self._next
+
+    def __next__(self):
+        value = self._next
+        self._next = next(self._iterator, None)
+        return value
+
+
+_worker_generator = None
+
+
+def _init_worker(generator_kwargs, event_log):
+    global _worker_generator
+    # connections inherited from the parent process must not be shared
+    db.get_engine().dispose()
+    _worker_generator = OBSnapshotGenerator(session=db.Session(), **generator_kwargs)
+    _worker_generator.event_log = event_log
+
+
+def _run_work_unit(work_unit):
+    generator = _worker_generator
+    generator.commit_counter = 0
+    generator.rows_written = 0
+    try:
+        generator._snapshot_market(*work_unit)
+    except Exception:
+        generator.session.rollback()
+        raise
+    exchange, market, _last_update_time = work_unit
+    return exchange, market, generator.commit_counter, generator.rows_written
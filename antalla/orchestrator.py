@@ -2,22 +2,34 @@ import asyncio
 from typing import List, Dict
 import logging
 
+import sqlalchemy
+
 from .exchange_listener import ExchangeListener
 from . import db
-from . import models
-from .actions import Action, InsertAction, UpdateAction
+from . import partitions
+from . import settings
+from .actions import Action, InsertAction, UpdateAction, add_order_book_updates
+from .ingest_buffer import IngestBuffer, BufferedWriter
+from .spill import Backlog
+from .reference_cache import get_reference_cache
+from .trade_dedup import TradeDeduplicator
+from .live_snapshots import LiveSnapshotGenerator
 
 DEFAULT_COMMIT_INTERVAL = 100
 
-import aiohttp
-
 class Orchestrator:
     def __init__(self,
                  exchange_names,
                  session=None,
                  commit_interval=DEFAULT_COMMIT_INTERVAL,
                  event_type=None,
-                 markets: Dict[str, List[str]] = None):
+                 markets: Dict[str, List[str]] = None,
+                 live_snapshots=False,
+                 snapshot_depths: List[float] = None,
+                 snapshot_interval=settings.LIVE_SNAPSHOT_INTERVAL_SECONDS,
+                 buffer: IngestBuffer = None,
+                 deduplicator: TradeDeduplicator = None,
+                 backlog: Backlog = None):
         if session is None:
             session = db.session
         if markets is None:
@@ -26,47 +38,154 @@ class Orchestrator:
         self.commit_interval = commit_interval
         self._rows_modified = 0
         self._stats = dict(commits=0, inserts=0, updates=0)
+        self.cache = get_reference_cache(session)
+        exchanges = self.cache.load_exchanges(exchange_names)
         self.exchange_listeners = [
-            self._create_exchange_listener(name, event_type, markets=markets.get(name))
-            for name in exchange_names
+            self._create_exchange_listener(exchange, event_type, markets=markets.get(exchange.name))
+            for exchange in exchanges
         ]
+        self._running = False
+        # with a buffer, the actions are written by a dedicated thread so that a slow db does not stop the
+        # listeners from reading their websockets
+        self.writer = None
+        if buffer is not None:
+            self.writer = BufferedWriter(buffer, session, commit_interval, deduplicator=deduplicator,
+                                         backlog=backlog)
+            for exchange_listener in self.exchange_listeners:
+                exchange_listener.backpressure = buffer
+        else:
+            # without a buffer, the listeners roll the session back after a db error
+            for exchange_listener in self.exchange_listeners:
+                exchange_listener.on_rollback = self._on_rollback
+        self.deduplicator = deduplicator
+        self.snapshot_generator = None
+        if live_snapshots:
+            self.snapshot_generator = LiveSnapshotGenerator(
+                self.exchange_listeners, snapshot_depths, snapshot_interval)
 
-    def _create_exchange_listener(self, name, event_type, markets: List[str] = None):
-        exchange = self.session.query(models.Exchange).filter_by(name=name).one()
+    def _create_exchange_listener(self, exchange, event_type, markets: List[str] = None):
         logging.info("creating exchange listener for '%s': %s (event_type=%s)",
-                     name, exchange, event_type)
-        kwargs = dict(event_type=event_type)
+                     exchange.name, exchange, event_type)
+        kwargs = dict(event_type=event_type, cache=self.cache)
         if markets is not None:
             kwargs["markets"] = markets
-        return ExchangeListener.create(name, exchange, self._on_event, **kwargs)
+        return ExchangeListener.create(exchange.name, exchange, self._on_event, **kwargs)
 
     async def start(self):
-        await asyncio.gather(*[e.listen() for e in self.exchange_listeners])
+        self._running = True
+        if self.deduplicator is not None:
+            exchange_ids = [e.exchange.id for e in self.exchange_listeners]
+            await self._run_in_writer(self.deduplicator.seed, exchange_ids)
+        partitioned_tables = partitions.get_partitioned_tables(self.session)
+        if partitioned_tables:
+            # created before listening so that a wrong partition interval stops the run right away
+            await self._run_in_writer(self._create_partitions, partitioned_tables)
+        tasks = [e.listen() for e in self.exchange_listeners]
+        if self.snapshot_generator is not None:
+            tasks.append(self._generate_live_snapshots())
+        if partitioned_tables:
+            tasks.append(self._create_future_partitions(partitioned_tables))
+        if self.writer is not None:
+            self.writer.running = True
+            tasks.append(self.writer.run())
+        await asyncio.gather(*tasks)
+
+    async def _run_in_writer(self, func, *args):
+        """runs `func` in the writer thread, which owns the session, when actions are buffered
+        """
+        if self.writer is None:
+            return func(*args)
+        return await self.writer.run_in_thread(func, *args)
+
+    def _on_rollback(self):
+        self._rows_modified = 0
+        if self.deduplicator is not None:
+            self.deduplicator.on_rollback()
+
+    async def _generate_live_snapshots(self):
+        while self._running:
+            await asyncio.sleep(self.snapshot_generator.interval)
+            if self._running:
+                self._on_event(self.snapshot_generator.create_snapshots())
+
+    async def _create_future_partitions(self, tables):
+        while self._running:
+            await asyncio.sleep(settings.PARTITION_CHECK_INTERVAL)
+            try:
+                await self._run_in_writer(self._create_partitions, tables)
+            except sqlalchemy.exc.DBAPIError as e:
+                logging.error("db error while creating partitions: %s", e)
+                await self._run_in_writer(self._on_db_error, e)
+
+    def _on_db_error(self, error):
+        if self.writer is not None:
+            self.writer.on_db_error(error)
+        else:
+            self.session.rollback()
+            self._on_rollback()
+
+    def _create_partitions(self, tables):
+        # pending rows are committed first as creating a partition locks the parent table
+        if self.writer is not None:
+            self.writer.commit()
+        else:
+            self._commit()
+        partitions.create_future_partitions(self.session, tables=tables)
 
     async def get_markets(self):
         await asyncio.gather(*[e.get_markets() for e in self.exchange_listeners])
+        # new exchange markets may have been inserted
+        self.cache.invalidate()
 
     def stop(self):
+        self._running = False
         for exchange_listener in self.exchange_listeners:
             exchange_listener.stop()
             logging.info("stop exchange listener: %s", exchange_listener.exchange)
-        self.session.commit()
+        if self.writer is None:
+            self.session.commit()
+            self._committed()
+        else:
+            self.writer.running = False
+            logging.info("writing the %s buffered rows", len(self.writer.buffer))
 
     def _on_event(self, actions: List[Action]):
-        for action in actions:
+        if self.deduplicator is not None:
+            actions = self.deduplicator.filter(actions)
+        if self.snapshot_generator is not None:
+            self.snapshot_generator.on_actions(actions)
+        if self.writer is not None:
+            self.writer.buffer.put(actions)
+        else:
+            self._execute_actions(actions)
+
+    def _execute_actions(self, actions: List[Action]):
+        if self.deduplicator is not None:
+            self.deduplicator.track(actions)
+        for action in add_order_book_updates(actions):
             self._track_actions(action)
             self._rows_modified += action.execute(self.session)
 
         if self._rows_modified >= self.commit_interval:
-            logging.info(("commit number [%s]: committing changes "
-                "Insert Actions: %s, Update Actions: %s"), 
-                self._stats["commits"], self._stats["inserts"], self._stats["updates"])
-            self.session.commit()
-            self._rows_modified = 0
-            self._stats["commits"] += 1
-            self._stats["inserts"] = 0
-            self._stats["updates"] = 0
-            
+            self._commit()
+
+    def _commit(self):
+        logging.info(("commit number [%s]: committing changes "
+            "Insert Actions: %s, Update Actions: %s"), 
+            self._stats["commits"], self._stats["inserts"], self._stats["updates"])
+        if self.deduplicator is not None:
+            logging.info("trade cache - stats: %s", self.deduplicator.stats)
+        self.session.commit()
+        self._committed()
+        self._rows_modified = 0
+        self._stats["commits"] += 1
+        self._stats["inserts"] = 0
+        self._stats["updates"] = 0
+
+    def _committed(self):
+        if self.deduplicator is not None:
+            self.deduplicator.on_commit()
+
     def _track_actions(self, action):
         if isinstance(action, InsertAction):
             self._stats["inserts"] += 1
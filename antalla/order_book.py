@@ -0,0 +1,166 @@
+import math
+
+import numpy as np
+
+ORDER_TYPES = ("bid", "ask")
+
+
+class OrderBook:
+    """in-memory aggregated order book of a single market, rebuilt by replaying the rows of
+    `aggregate_orders`.
+
+    For every price level the update with the highest `last_update_id` is kept, including levels
+    which have been removed (size 0), so that updates can be applied in any order and replaying
+    the same update twice has no effect. This matches the `max(last_update_id)` semantics used
+    by the order book queries. The removed levels are dropped by `prune` once older updates can no
+    longer be applied.
+    """
+
+    def __init__(self, timestamp=None):
+        # time up to which all updates have been applied
+        self.timestamp = timestamp
+        self.last_update_id = None
+        self._levels = {order_type: {} for order_type in ORDER_TYPES}
+        # (order type, price) of the levels set to a size of 0 since the last prune
+        self._removed = set()
+
+    def apply(self, order_type, price, size, last_update_id):
+        """applies a single price level update
+
+        >>> book = OrderBook()
+        >>> book.apply("bid", 0.5, 10, 2)
+        >>> book.apply("bid", 0.5, 0, 1)
+        >>> book.side("bid")[1].tolist()
+        [10.0]
+        >>> book.apply("bid", 0.5, 0, 3)
+        >>> book.side("bid")[1].tolist()
+        []
+        """
+        if last_update_id is None:
+            return
+        levels = self._levels[order_type]
+        current = levels.get(price)
+        if current is None or last_update_id >= current[1]:
+            levels[price] = (size, last_update_id)
+            if not size:
+                self._removed.add((order_type, price))
+        if self.last_update_id is None or last_update_id > self.last_update_id:
+            self.last_update_id = last_update_id
+
+    def prune(self):
+        """drops the removed levels, which are only kept to ignore the older updates of their price.
+        Must only be called once no update older than the applied ones can be applied anymore,
+        e.g. between chronological batches of updates
+
+        >>> book = OrderBook()
+        >>> book.apply("bid", 0.5, 10, 1)
+        >>> book.apply("bid", 0.5, 0, 2)
+        >>> book.prune()
+        >>> book.to_arrays("bid")
+        ([], [], [])
+        """
+        for order_type, price in self._removed:
+            levels = self._levels[order_type]
+            if price in levels and not levels[price][0]:
+                del levels[price]
+        self._removed.clear()
+
+    def side(self, order_type):
+        """returns the prices and sizes of all non-empty levels of one side sorted by price
+        """
+        levels = [(price, size) for price, (size, _) in self._levels[order_type].items() if size > 0]
+        levels.sort()
+        prices = np.fromiter((price for price, _ in levels), dtype=float, count=len(levels))
+        sizes = np.fromiter((size for _, size in levels), dtype=float, count=len(levels))
+        return prices, sizes
+
+    def select_quartile(self):
+        """returns the upper quartile of bids and the lower quartile of asks, using the same
+        discrete percentiles as `percentile_disc` in postgres
+
+        >>> book = OrderBook()
+        >>> for i, price in enumerate([0.1, 0.2, 0.3, 0.4]):
+        ...     book.apply("bid", price, 1, i)
+        ...     book.apply("ask", price + 1, 1, i)
+        >>> bid_prices, _, ask_prices, _ = book.select_quartile()
+        >>> bid_prices.tolist(), ask_prices.tolist()
+        ([0.3, 0.4], [1.1])
+        """
+        bid_prices, bid_sizes = self.side("bid")
+        ask_prices, ask_sizes = self.side("ask")
+        if len(bid_prices):
+            is_selected = bid_prices >= bid_prices[math.ceil(0.75 * len(bid_prices)) - 1]
+            bid_prices, bid_sizes = bid_prices[is_selected], bid_sizes[is_selected]
+        if len(ask_prices):
+            is_selected = ask_prices <= ask_prices[math.ceil(0.25 * len(ask_prices)) - 1]
+            ask_prices, ask_sizes = ask_prices[is_selected], ask_sizes[is_selected]
+        return bid_prices, bid_sizes, ask_prices, ask_sizes
+
+    def select_mid_price_range(self, mid_price_range):
+        """returns the bids and asks whose price lies within `mid_price_range` (relative) of the mid price
+        """
+        bid_prices, bid_sizes = self.side("bid")
+        ask_prices, ask_sizes = self.side("ask")
+        if not len(bid_prices) or not len(ask_prices):
+            empty = np.array([], dtype=float)
+            return empty, empty, empty, empty
+        mid_price = (bid_prices[-1] + ask_prices[0]) / 2
+        is_selected_bid = bid_prices >= (1 - mid_price_range) * mid_price
+        is_selected_ask = ask_prices <= (1 + mid_price_range) * mid_price
+        return (bid_prices[is_selected_bid], bid_sizes[is_selected_bid],
+                ask_prices[is_selected_ask], ask_sizes[is_selected_ask])
+
+    def select(self, mid_price_range=0):
+        """returns the levels within `mid_price_range` of the mid price, or the quartile levels if it is 0
+        """
+        if mid_price_range:
+            return self.select_mid_price_range(mid_price_range)
+        return self.select_quartile()
+
+    def to_arrays(self, order_type):
+        """returns the prices, sizes and update ids of all levels of one side, including removed levels
+        """
+        levels = self._levels[order_type]
+        prices = list(levels.keys())
+        sizes = [size for size, _ in levels.values()]
+        update_ids = [update_id for _, update_id in levels.values()]
+        return prices, sizes, update_ids
+
+    @classmethod
+    def from_arrays(cls, timestamp, last_update_id, bids, asks):
+        book = cls(timestamp)
+        book.last_update_id = last_update_id
+        for order_type, (prices, sizes, update_ids) in zip(ORDER_TYPES, (bids, asks)):
+            book._levels[order_type] = {
+                price: (size, update_id) for price, size, update_id in zip(prices, sizes, update_ids)
+            }
+            book._removed.update((order_type, price) for price, size in zip(prices, sizes) if not size)
+        return book
+
+
+def compute_stats(bid_prices, bid_sizes, ask_prices, ask_sizes):
+    """computes the snapshot statistics of an order book given as price and size arrays
+
+    >>> stats = compute_stats(np.array([0.4, 0.5]), np.array([1.0, 2.0]), np.array([0.6]), np.array([3.0]))
+    >>> round(stats["spread"], 2), float(stats["max_bid_size"]), stats["bids_count"]
+    (0.1, 2.0, 2)
+    """
+    max_bid_price = bid_prices.max()
+    min_ask_price = ask_prices.min()
+    return dict(
+        spread=float(min_ask_price - max_bid_price),
+        min_ask_price=min_ask_price,
+        min_ask_size=ask_sizes[ask_prices == min_ask_price].max(),
+        max_bid_price=max_bid_price,
+        max_bid_size=bid_sizes[bid_prices == max_bid_price].max(),
+        bids_volume=float(np.dot(bid_prices, bid_sizes)),
+        asks_volume=float(np.dot(ask_prices, ask_sizes)),
+        bids_count=len(bid_prices),
+        asks_count=len(ask_prices),
+        bids_price_stddev=np.std(bid_prices),
+        asks_price_stddev=np.std(ask_prices),
+        bids_price_mean=float(bid_prices.mean()),
+        asks_price_mean=float(ask_prices.mean()),
+        bid_price_median=np.median(bid_prices),
+        ask_price_median=np.median(ask_prices)
+    )
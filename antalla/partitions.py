@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta
+import logging
+import re
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError
+
+from . import settings
+
+PARTITIONED_TABLES = ("aggregate_orders", "trades")
+PARTITION_INTERVALS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+PARTITION_LOCK_TIMEOUT = "10s"
+# server_version_num from which declarative partitioning supports primary keys,
+# indexes and row triggers on the partitioned table
+MIN_SERVER_VERSION = 110000
+RANGE_BOUND_PATTERN = re.compile(r"FOR VALUES FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_range(timestamp, interval="day"):
+    """returns the bounds of the partition containing `timestamp`. Weekly partitions start on mondays.
+
+    >>> partition_range(datetime(2019, 5, 15, 19, 30))
+    (datetime.datetime(2019, 5, 15, 0, 0), datetime.datetime(2019, 5, 16, 0, 0))
+    >>> partition_range(datetime(2019, 5, 15, 19, 30), "week")
+    (datetime.datetime(2019, 5, 13, 0, 0), datetime.datetime(2019, 5, 20, 0, 0))
+    """
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError("unknown partition interval '{}'".format(interval))
+    start = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if interval == "week":
+        start -= timedelta(days=start.weekday())
+    return start, start + PARTITION_INTERVALS[interval]
+
+
+def partition_name(table, start):
+    """returns the name of the partition of `table` starting at `start`
+
+    >>> partition_name("trades", datetime(2019, 5, 13))
+    'trades_p20190513'
+    """
+    return "{}_p{:%Y%m%d}".format(table, start)
+
+
+def iter_partition_ranges(start, stop, interval="day"):
+    """yields the bounds of all partitions overlapping [start, stop]
+
+    >>> [lower.day for lower, _ in iter_partition_ranges(datetime(2019, 5, 15, 12), datetime(2019, 5, 17))]
+    [15, 16, 17]
+    """
+    lower, upper = partition_range(start, interval)
+    while lower <= stop:
+        yield lower, upper
+        lower, upper = upper, upper + PARTITION_INTERVALS[interval]
+
+
+def supports_partitioning(session):
+    server_version = session.execute(text("show server_version_num")).scalar()
+    return int(server_version) >= MIN_SERVER_VERSION
+
+
+def get_partitioned_tables(session, tables=PARTITIONED_TABLES):
+    """returns the tables in `tables` which are range partitioned in the database
+    """
+    query = text("select relname from pg_class where relkind = 'p' and relname in :tables")
+    rows = session.execute(query.bindparams(bindparam("tables", expanding=True)), {"tables": list(tables)})
+    return [row[0] for row in rows]
+
+
+def parse_partition_bound(bound):
+    """returns the (start, stop) of a range partition from its bound, as returned by `pg_get_expr`,
+    or None for the default partition
+
+    >>> parse_partition_bound("FOR VALUES FROM ('2019-05-13 00:00:00') TO ('2019-05-20 00:00:00')")
+    (datetime.datetime(2019, 5, 13, 0, 0), datetime.datetime(2019, 5, 20, 0, 0))
+    >>> parse_partition_bound("DEFAULT") is None
+    True
+    """
+    match = RANGE_BOUND_PATTERN.match(bound)
+    if match is None:
+        return None
+    return tuple(datetime.strptime(value, "%Y-%m-%d %H:%M:%S") for value in match.groups())
+
+
+def _query_partitions(session, table):
+    rows = session.execute(text(
+        "select c.relname, pg_get_expr(c.relpartbound, c.oid) from pg_inherits i "
+        "inner join pg_class c on i.inhrelid = c.oid "
+        "where i.inhparent = cast(:table as regclass) order by c.relname"
+    ), {"table": table})
+    return [(name, parse_partition_bound(bound)) for name, bound in rows]
+
+
+def get_partitions(session, table):
+    """returns the (name, start, stop) of the range partitions of `table`, skipping the default partition
+    """
+    return [(name, bounds[0], bounds[1]) for name, bounds in _query_partitions(session, table) if bounds]
+
+
+def get_default_partition(session, table):
+    """returns the name of the default partition of `table`, or None if it does not have one
+    """
+    return next((name for name, bounds in _query_partitions(session, table) if bounds is None), None)
+
+
+def get_partition_interval(table, table_partitions):
+    """returns the interval of the partitions of `table`, or None if it does not have any
+
+    :raise ValueError: if the partitions do not all span the same interval
+    """
+    lengths = {stop - start for _name, start, stop in table_partitions}
+    if not lengths:
+        return None
+    if len(lengths) > 1:
+        raise ValueError("the partitions of {} have mixed intervals".format(table))
+    length = lengths.pop()
+    for interval, interval_length in PARTITION_INTERVALS.items():
+        if interval_length == length:
+            return interval
+    raise ValueError("the partitions of {} have an unknown interval of {}".format(table, length))
+
+
+def create_partitions(session, start, stop, interval="day", tables=PARTITIONED_TABLES):
+    """creates the missing partitions of `tables` covering [start, stop] and returns their names.
+    Each partition is committed separately and skipped with a warning if the lock on the
+    parent table cannot be acquired in time, so that it is retried on the next call.
+    The rows of the new partitions which were stored in the default partition are moved to them.
+
+    :raise ValueError: if the existing partitions of a table have another interval than `interval`
+    """
+    existing = {}
+    for table in tables:
+        table_partitions = get_partitions(session, table)
+        table_interval = get_partition_interval(table, table_partitions)
+        if table_interval not in (None, interval):
+            raise ValueError("{} is partitioned by {} and cannot have partitions by {}: PARTITION_INTERVAL "
+                             "must not change once the tables are partitioned".format(table, table_interval, interval))
+        existing[table] = {partition_start for _name, partition_start, _stop in table_partitions}
+    created = []
+    for lower, upper in iter_partition_ranges(start, stop, interval):
+        for table in tables:
+            if lower in existing[table]:
+                continue
+            name = partition_name(table, lower)
+            try:
+                session.execute(text("set local lock_timeout = '{}'".format(PARTITION_LOCK_TIMEOUT)))
+                moved = _create_partition(session, table, name, lower, upper)
+                session.commit()
+            except DBAPIError as e:
+                session.rollback()
+                logging.warning("could not create partition %s: %s", name, e)
+                continue
+            if moved:
+                logging.warning("moved %s rows of %s from the default partition to %s", moved, table, name)
+            logging.info("created partition %s", name)
+            created.append(name)
+    return created
+
+
+def _create_partition(session, table, name, lower, upper):
+    """creates the partition `name` of `table` and returns the number of rows moved to it from the default
+    partition. Postgres refuses to create a partition for rows stored in the default partition, so these rows
+    are first moved to a regular table which is then attached as the partition
+    """
+    bounds = dict(lower=lower, upper=upper)
+    default_partition = get_default_partition(session, table)
+    has_default_rows = default_partition is not None and session.execute(text(
+        "select exists (select 1 from {} where timestamp >= :lower and timestamp < :upper)".format(default_partition)
+    ), bounds).scalar()
+    if not has_default_rows:
+        session.execute(text(
+            "create table if not exists {} partition of {} for values from ('{}') to ('{}')"
+            .format(name, table, lower.isoformat(), upper.isoformat())
+        ))
+        return 0
+    # no row of the range may be added to the default partition until the new partition is attached
+    session.execute(text("lock table {} in share row exclusive mode".format(default_partition)))
+    session.execute(text("create table {} (like {} including defaults)".format(name, table)))
+    moved = session.execute(text(
+        "with moved as (delete from {} where timestamp >= :lower and timestamp < :upper returning *) "
+        "insert into {} select * from moved".format(default_partition, name)
+    ), bounds).rowcount
+    session.execute(text(
+        "alter table {} attach partition {} for values from ('{}') to ('{}')"
+        .format(table, name, lower.isoformat(), upper.isoformat())
+    ))
+    return moved
+
+
+def create_future_partitions(session, interval=None, ahead=None, now=None, tables=PARTITIONED_TABLES):
+    """creates the partitions of `tables` for the current and the next `ahead` intervals
+    """
+    if interval is None:
+        interval = settings.PARTITION_INTERVAL
+    if ahead is None:
+        ahead = settings.PARTITIONS_AHEAD
+    if now is None:
+        now = datetime.now()
+    stop = now + ahead * PARTITION_INTERVALS[interval]
+    return create_partitions(session, now, stop, interval, tables)
+
+
+def drop_empty_partitions(session, table, before):
+    """drops the empty partitions of `table` ending before `before` and returns their names
+    """
+    dropped = []
+    for name, _start, stop in get_partitions(session, table):
+        if stop > before:
+            continue
+        if session.execute(text("select exists (select 1 from {})".format(name))).scalar():
+            continue
+        try:
+            session.execute(text("set local lock_timeout = '{}'".format(PARTITION_LOCK_TIMEOUT)))
+            session.execute(text("drop table {}".format(name)))
+            session.commit()
+        except DBAPIError as e:
+            session.rollback()
+            logging.warning("could not drop partition %s: %s", name, e)
+            continue
+        logging.info("dropped partition %s", name)
+        dropped.append(name)
+    return dropped
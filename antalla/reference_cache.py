@@ -0,0 +1,132 @@
+import logging
+import time
+
+from . import db
+from . import models
+from . import settings
+
+
+# values kept with the markets for the lookups of the cache, which are not part of `ExchangeMarket.to_dict`
+INTERNAL_MARKET_KEYS = {"agg_orders_count", "sort_volume_usd"}
+
+
+def get_market_key(exchange_name, market):
+    """returns the key of the exchange market of a `market` name, whose coins are sorted
+
+    >>> get_market_key("binance", "ETH_BTC")
+    ('binance', 'BTC', 'ETH')
+    """
+    first_coin, second_coin = sorted(market.split("_"))
+    return (exchange_name, first_coin, second_coin)
+
+
+class ReferenceCache:
+    """process-wide cache of the reference data: coin symbols, exchanges and exchange markets.
+    Everything is loaded at once, with one query per table, on first use and again once `ttl` seconds have
+    elapsed or after `invalidate` was called. Only plain values are kept so that reads never trigger a query,
+    even after the objects of the session have been expired by a commit.
+    Processes which do not insert markets themselves, such as the websocket server, are only refreshed by the `ttl`
+    """
+    def __init__(self, session=db.session, ttl=settings.REFERENCE_CACHE_TTL, clock=time.monotonic):
+        self.session = session
+        self.ttl = ttl
+        self.clock = clock
+        self._loaded_at = None
+        self._coins = frozenset()
+        self._exchanges = {}
+        self._markets = {}
+
+    def refresh(self):
+        """reloads all the reference data
+        """
+        start = time.time()
+        coins = frozenset(symbol for symbol, in self.session.query(models.Coin.symbol))
+        exchanges = {exchange.name: dict(id=exchange.id, name=exchange.name)
+                     for exchange in self.session.query(models.Exchange).order_by(models.Exchange.id)}
+        exchange_names = {exchange["id"]: name for name, exchange in exchanges.items()}
+        markets = {}
+        for exchange_market in self.session.query(models.ExchangeMarket):
+            exchange_name = exchange_names[exchange_market.exchange_id]
+            key = (exchange_name, exchange_market.first_coin_id, exchange_market.second_coin_id)
+            market = exchange_market.to_dict()
+            market["agg_orders_count"] = exchange_market.agg_orders_count
+            market["sort_volume_usd"] = exchange_market.volume_usd or 0
+            markets[key] = market
+        self._coins, self._exchanges, self._markets = coins, exchanges, markets
+        self._loaded_at = self.clock()
+        logging.debug("reference cache - loaded %s coins, %s exchanges and %s markets in %.2f seconds",
+                      len(coins), len(exchanges), len(markets), time.time() - start)
+
+    def invalidate(self):
+        """forces the reference data to be reloaded on next access
+        """
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or self.clock() - self._loaded_at >= self.ttl:
+            self.refresh()
+
+    def get_coin_symbols(self):
+        self._ensure_loaded()
+        return self._coins
+
+    def load_exchanges(self, names):
+        """returns the exchanges with the given names in the same order, as `Exchange` objects which are not
+        attached to the session
+
+        :raise ValueError: if an exchange does not exist
+        """
+        self._ensure_loaded()
+        missing = [name for name in names if name not in self._exchanges]
+        if missing:
+            raise ValueError("unknown exchanges: {}".format(", ".join(missing)))
+        return [models.Exchange(**self._exchanges[name]) for name in names]
+
+    def get_exchanges(self, include_markets=False):
+        """returns all the exchanges as dicts, in the format of `Exchange.to_dict`
+        """
+        self._ensure_loaded()
+        if not include_markets:
+            return [dict(exchange) for exchange in self._exchanges.values()]
+        markets_with_data = {}
+        for (exchange_name, _, _), market in self._markets.items():
+            if market["agg_orders_count"] > 0:
+                markets_with_data.setdefault(exchange_name, []).append(_to_market_dict(market))
+        return [dict(exchange, markets=markets_with_data.get(name, []))
+                for name, exchange in self._exchanges.items()]
+
+    def load_markets(self, exchange, markets, max_markets=None):
+        """returns the markets of `exchange` matching the `markets` names (e.g. ``ETH_BTC``) as dicts,
+        in the order of `markets` and without the ones which do not exist.
+        With `max_markets`, only the markets with the highest volume in USD are returned, by decreasing volume
+        """
+        self._ensure_loaded()
+        keys = [get_market_key(exchange.name, market) for market in markets]
+        found = [self._markets[key] for key in keys if key in self._markets]
+        if max_markets is not None:
+            found = sorted(found, key=lambda market: market["sort_volume_usd"], reverse=True)[:max_markets]
+        return [_to_market_dict(market) for market in found]
+
+    def get_original_market(self, exchange_name, buy_sym_id, sell_sym_id):
+        """returns the name of a market on `exchange_name` whatever the order of its coins,
+        or None if the market does not exist
+        """
+        self._ensure_loaded()
+        first_coin, second_coin = sorted([buy_sym_id, sell_sym_id])
+        market = self._markets.get((exchange_name, first_coin, second_coin))
+        return market and market["original_name"]
+
+
+def _to_market_dict(market):
+    return {key: value for key, value in market.items() if key not in INTERNAL_MARKET_KEYS}
+
+
+reference_cache = ReferenceCache()
+
+
+def get_reference_cache(session):
+    """returns the process-wide cache, or a cache of its own for a session other than the default one
+    """
+    if session is db.session:
+        return reference_cache
+    return ReferenceCache(session)
@@ -30,6 +30,12 @@ BINANCE_MARKETS = MARKETS
 BINANCE_STREAMS = ["depth", "trade"]
 BINANCE_SINGLE_STREAM = "wss://stream.binance.com:9443/ws/"
 BINANCE_COMBINED_STREAM = "wss://stream.binance.com:9443/stream?streams="
+# binance accepts at most 1024 streams per connection; busy streams are spread over more connections
+BINANCE_MAX_STREAMS_PER_CONNECTION = int(os.environ.get("BINANCE_MAX_STREAMS_PER_CONNECTION", 100))
+BINANCE_SHARD_STATS_INTERVAL = 60
+# depth snapshot requests shared by all the connections: 10 requests every 4 seconds
+BINANCE_SNAPSHOT_REQUESTS_PER_SECOND = 2.5
+BINANCE_SNAPSHOT_REQUESTS_BURST = 10
 BINANCE_API_KEY = ""
 BINANCE_SECRET_KEY = ""
 BINANCE_API = "https://api.binance.com"
@@ -47,6 +53,48 @@ else:
 
 PACKAGE = "antalla"
 
+# time partitioning of `aggregate_orders` and `trades` (postgres >= 11)
+PARTITION_INTERVAL = os.environ.get("PARTITION_INTERVAL", "day")
+PARTITIONS_AHEAD = int(os.environ.get("PARTITIONS_AHEAD", 7))
+PARTITION_CHECK_INTERVAL = 3600
+
+# rows parsed by the listeners and buffered before being written to the db, and directory of the actions
+# spilled to disk when the buffer is full
+INGEST_BUFFER_ROWS = int(os.environ.get("INGEST_BUFFER_ROWS", 100000))
+INGEST_SPILL_DIR = os.environ.get("INGEST_SPILL_DIR", os.path.expanduser("~/.antalla/spill"))
+
+# directory of the rows which could not be written while the db was unavailable, and seconds between attempts
+# to write them
+DB_BACKLOG_DIR = os.environ.get("DB_BACKLOG_DIR", os.path.expanduser("~/.antalla/backlog"))
+DB_RETRY_INTERVAL = int(os.environ.get("DB_RETRY_INTERVAL", 5))
+
+# number of recent trade ids kept in memory per market to drop the trades resent by the exchanges, and period
+# of the trades loaded from the db on start
+TRADE_CACHE_SIZE = int(os.environ.get("TRADE_CACHE_SIZE", 5000))
+TRADE_CACHE_SEED_SECONDS = int(os.environ.get("TRADE_CACHE_SEED_SECONDS", 86400))
+
+# seconds after which the in-memory coins, exchanges and markets are reloaded. This is the only refresh of the
+# processes which do not insert markets themselves, such as the websocket server
+REFERENCE_CACHE_TTL = int(os.environ.get("REFERENCE_CACHE_TTL", 300))
+
+# defaults of the snapshot, compaction, candles and export commands, kept here so that the cli does not need to
+# import the modules of the commands
+SNAPSHOT_INTERVAL_SECONDS = 1
+SNAPSHOT_FLUSH_SIZE = 500
+SNAPSHOT_CHECKPOINT_INTERVAL_SECONDS = 3600
+LIVE_SNAPSHOT_INTERVAL_SECONDS = 1
+COMPACT_RETENTION_DAYS = 30
+COMPACT_BATCH_SIZE = 10000
+# resolutions of the candles with their length in seconds, finest first
+CANDLE_RESOLUTIONS = {
+    "1m": 60,
+    "5m": 300,
+    "1h": 3600,
+    "1d": 86400,
+}
+EXPORT_TABLES = ["trades", "aggregate_orders", "order_book_snapshots"]
+EXPORT_FORMATS = ["npy", "npz", "parquet"]
+
 COINBASE_WS_URL = "wss://ws-feed.pro.coinbase.com"
 
 COINBASE_MARKETS = MARKETS
@@ -63,6 +111,8 @@ COINBASE_API_PRODUCTS = "products"
 COINBASE_API_TICKER =  "ticker"
 
 COINMARKETCAP_URL = "https://coinmarketcap.com/all/views/all/"
+PRICE_CACHE_PATH = os.environ.get("PRICE_CACHE_PATH", os.path.expanduser("~/.antalla/prices.json"))
+PRICE_CACHE_TTL = int(os.environ.get("PRICE_CACHE_TTL", 3600))
 
 HITBTC_MARKETS = MARKETS
 HITBTC_WS_URL = "wss://api.hitbtc.com/api/2/ws"
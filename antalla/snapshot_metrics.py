@@ -0,0 +1,111 @@
+import numpy as np
+
+from . import db
+from . import loader
+
+SNAPSHOT_METRICS = [
+    "spread",
+    "bids_volume",
+    "asks_volume",
+    "bids_count",
+    "asks_count",
+    "bids_price_stddev",
+    "asks_price_stddev",
+    "bids_price_mean",
+    "asks_price_mean",
+    "min_ask_price",
+    "min_ask_size",
+    "max_bid_price",
+    "max_bid_size",
+    "bid_price_median",
+    "ask_price_median",
+]
+DEFAULT_ALIGNMENT_INTERVAL_SECONDS = 60
+
+# as-of join of the latest snapshot of every exchange at each time of a regular grid, served by the
+# 'order_book_snapshots_market_index' index
+ALIGNED_METRICS_QUERY = """
+    select grid.timestamp, e.name, {outer_metrics}
+    from generate_series(cast(:start_time as timestamp), cast(:stop_time as timestamp),
+                         :interval * interval '1 second') grid(timestamp)
+    cross join (select id, name from exchanges where name = any(:exchanges)) e
+    left join lateral (
+        select {metrics}
+        from order_book_snapshots s
+        where s.exchange_id = e.id
+        and s.buy_sym_id = :buy_sym_id
+        and s.sell_sym_id = :sell_sym_id
+        and s.snapshot_type = :snapshot_type
+        and s.mid_price_range = :mid_price_range
+        and s.timestamp <= grid.timestamp
+        {staleness_filter}
+        order by s.timestamp desc
+        limit 1
+    ) latest_snapshot on true
+    order by grid.timestamp, e.name
+"""
+STALENESS_FILTER = "and s.timestamp > grid.timestamp - :max_staleness * interval '1 second'"
+
+
+def _get_exchanges(session, exchanges=None):
+    if exchanges is None:
+        rows = session.execute("select name from exchanges order by name")
+    else:
+        rows = session.execute("select name from exchanges where name = any(:exchanges) order by name",
+                               {"exchanges": list(exchanges)})
+    return [row[0] for row in rows]
+
+
+def load_aligned_metrics(buy_sym_id, sell_sym_id, start_time, stop_time,
+                         interval=DEFAULT_ALIGNMENT_INTERVAL_SECONDS,
+                         metrics=("spread",),
+                         exchanges=None,
+                         mid_price_range=0,
+                         max_staleness=None,
+                         session=db.session,
+                         chunk_size=loader.DEFAULT_CHUNK_SIZE):
+    """returns the snapshot metrics of a market on all `exchanges` aligned on a grid of `interval` seconds
+    between `start_time` and `stop_time`, as a tuple (timestamps, exchanges, values) where `values` has the
+    shape (len(timestamps), len(exchanges), len(metrics)). Every value is the one of the latest snapshot at or
+    before the grid time (forward-filled), or NaN if there is none, or none within `max_staleness` seconds.
+    The alignment is computed by the db and only the grid rows are transferred.
+    """
+    metrics = list(metrics)
+    unknown_metrics = set(metrics) - set(SNAPSHOT_METRICS)
+    if unknown_metrics:
+        raise ValueError("unknown snapshot metrics: {}".format(", ".join(sorted(unknown_metrics))))
+    exchanges = _get_exchanges(session, exchanges)
+    query = ALIGNED_METRICS_QUERY.format(
+        outer_metrics=", ".join("latest_snapshot." + metric for metric in metrics),
+        metrics=", ".join("s." + metric for metric in metrics),
+        staleness_filter=STALENESS_FILTER if max_staleness is not None else "",
+    )
+    params = {
+        "start_time": start_time,
+        "stop_time": stop_time,
+        "interval": interval,
+        "exchanges": exchanges,
+        "buy_sym_id": buy_sym_id.upper(),
+        "sell_sym_id": sell_sym_id.upper(),
+        "snapshot_type": "mid_price_range" if mid_price_range else "quartile",
+        "mid_price_range": mid_price_range,
+        "max_staleness": max_staleness,
+    }
+    # counts are loaded as floats so that missing snapshots are NaN
+    columns = [("timestamp", loader.TIMESTAMP_DTYPE), ("exchange", str)] + [(metric, float) for metric in metrics]
+    arrays = loader.load_arrays(query, params, columns, session, chunk_size)
+    # rows are ordered by grid time and exchange name, with one row per exchange for every grid time
+    timestamps = arrays["timestamp"][::len(exchanges)] if exchanges else arrays["timestamp"]
+    values = np.stack([arrays[metric] for metric in metrics], axis=-1)
+    return timestamps, exchanges, values.reshape(len(timestamps), len(exchanges), len(metrics))
+
+
+def load_aligned_metrics_frame(buy_sym_id, sell_sym_id, start_time, stop_time, **kwargs):
+    """returns the result of `load_aligned_metrics` as a DataFrame indexed by time, with (metric, exchange) columns
+    """
+    import pandas as pd
+    metrics = list(kwargs.get("metrics", ("spread",)))
+    timestamps, exchanges, values = load_aligned_metrics(buy_sym_id, sell_sym_id, start_time, stop_time, **kwargs)
+    columns = pd.MultiIndex.from_product([metrics, exchanges], names=["metric", "exchange"])
+    data = values.transpose(0, 2, 1).reshape(len(timestamps), len(metrics) * len(exchanges))
+    return pd.DataFrame(data, index=pd.DatetimeIndex(timestamps, name="timestamp"), columns=columns)
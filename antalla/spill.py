@@ -0,0 +1,245 @@
+import logging
+import os
+from os import path
+import pickle
+import time
+
+import sqlalchemy
+
+from . import models
+from . import settings
+from .actions import InsertAction
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+SEGMENT_FORMAT = "segment-{:012d}.pickle"
+
+
+def is_connection_error(error):
+    """returns whether a db error is caused by the db being unavailable rather than by the data written
+    """
+    return isinstance(error, (sqlalchemy.exc.OperationalError, sqlalchemy.exc.InterfaceError))
+
+
+def _segment_number(filename):
+    return int(filename[len("segment-"):-len(".pickle")])
+
+
+def _is_segment(filename):
+    return filename.startswith("segment-") and filename.endswith(".pickle")
+
+
+class SpillQueue:
+    """append-only queue of insert actions stored on disk in `directory`. Actions are appended to segment
+    files of about `segment_size` bytes and read back in the order they were appended; a segment file is
+    removed once all its actions were read. Segments left by a previous process are read first, so that
+    spilled data survives a restart
+    """
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self._segments = sorted(_segment_number(filename) for filename in os.listdir(directory)
+                                if _is_segment(filename))
+        self._write_file = None
+        self._read_file = None
+        self.rows = sum(rows for segment in self._segments for _, rows in self._iter_records(segment))
+        if self.rows:
+            logging.info("spill queue - %s rows to replay from %s", self.rows, directory)
+
+    def __len__(self):
+        return self.rows
+
+    def _segment_path(self, segment):
+        return path.join(self.directory, SEGMENT_FORMAT.format(segment))
+
+    def _iter_records(self, segment):
+        with open(self._segment_path(segment), "rb") as f:
+            while True:
+                try:
+                    model_name, rows = pickle.load(f)
+                except EOFError:
+                    return
+                yield model_name, len(rows)
+
+    def append(self, action):
+        """appends an insert action to the queue and returns its number of rows
+        """
+        if not isinstance(action, InsertAction):
+            raise ValueError("only insert actions can be spilled")
+        if not action.items:
+            return 0
+        if self._write_file is None or self._write_file.tell() >= self.segment_size:
+            self._open_segment()
+        pickle.dump(self._to_record(action), self._write_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write_file.flush()
+        self.rows += len(action.items)
+        return len(action.items)
+
+    def _to_record(self, action):
+        rows = []
+        for item in action.items:
+            data = dict(vars(item))
+            data.pop("_sa_instance_state", None)
+            rows.append(data)
+        return action.item_type.__name__, rows
+
+    def push_front(self, actions):
+        """puts actions which were popped back at the head of the queue, along with the actions not read yet
+        of the segment being read
+        """
+        records = [self._to_record(action) for action in actions if action.items]
+        head = self._segments[0] - 1 if self._segments else 0
+        if self._read_file is not None:
+            while True:
+                try:
+                    records.append(pickle.load(self._read_file))
+                except EOFError:
+                    break
+            self._read_file.close()
+            self._read_file = None
+            if self._write_file is not None and len(self._segments) == 1:
+                # the segment being read was also being written
+                self._write_file.close()
+                self._write_file = None
+            os.remove(self._segment_path(self._segments.pop(0)))
+        if not records:
+            return
+        with open(self._segment_path(head), "wb") as f:
+            for record in records:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._segments.insert(0, head)
+        self.rows += sum(len(action.items) for action in actions)
+
+    def _open_segment(self):
+        if self._write_file is not None:
+            self._write_file.close()
+        segment = self._segments[-1] + 1 if self._segments else 0
+        self._segments.append(segment)
+        self._write_file = open(self._segment_path(segment), "ab")
+
+    def pop(self):
+        """returns the oldest action of the queue, or None if it is empty
+        """
+        while self._segments:
+            segment = self._segments[0]
+            if self._read_file is None:
+                self._read_file = open(self._segment_path(segment), "rb")
+            try:
+                model_name, rows = pickle.load(self._read_file)
+            except EOFError:
+                if self._write_file is not None and segment == self._segments[-1]:
+                    # the segment being written is kept until the next one is opened
+                    return None
+                self._read_file.close()
+                self._read_file = None
+                os.remove(self._segment_path(segment))
+                self._segments.pop(0)
+                continue
+            self.rows -= len(rows)
+            Model = getattr(models, model_name)
+            return InsertAction([Model(**row) for row in rows])
+        return None
+
+    def close(self):
+        for f in (self._write_file, self._read_file):
+            if f is not None:
+                f.close()
+        self._write_file = self._read_file = None
+
+
+class Backlog:
+    """actions which could not be written because the db was unavailable. They are spilled to a `SpillQueue` in
+    `directory` and replayed in order once the db is back, which is retried every `retry_interval` seconds.
+    A backlog left by a previous process is replayed on start
+    """
+    def __init__(self, directory, retry_interval=settings.DB_RETRY_INTERVAL, clock=time.monotonic):
+        self.directory = directory
+        self.retry_interval = retry_interval
+        self.stats = dict(outages=0, spilled=0, replayed=0, dropped=0)
+        self._clock = clock
+        self._queue = None
+        self._pending = []
+        self._next_retry = None
+        self._replay_started_at = None
+        self._replayed_rows = 0
+        if path.isdir(directory) and any(_is_segment(filename) for filename in os.listdir(directory)):
+            self._queue = SpillQueue(directory)
+
+    def __len__(self):
+        rows = sum(len(action.items) for action in self._pending)
+        if self._queue is not None:
+            rows += len(self._queue)
+        return rows
+
+    @property
+    def db_available(self):
+        return self._next_retry is None
+
+    def spill(self, actions):
+        """appends `actions` to the backlog; only insert actions can be spilled and the others are dropped
+        """
+        for action in actions:
+            if not isinstance(action, InsertAction):
+                self.stats["dropped"] += 1
+                logging.warning("db backlog - dropping %s which cannot be spilled", type(action).__name__)
+                continue
+            if self._queue is None:
+                self._queue = SpillQueue(self.directory)
+            self.stats["spilled"] += self._queue.append(action)
+
+    def on_db_error(self):
+        """delays the next write to the db by `retry_interval`
+        """
+        if self.db_available:
+            self.stats["outages"] += 1
+            logging.warning("db unavailable - spilling to %s", self.directory)
+        else:
+            logging.warning("db still unavailable - %s rows in backlog, retrying in %s seconds",
+                            len(self), self.retry_interval)
+        self._next_retry = self._clock() + self.retry_interval
+        self._replay_started_at = None
+
+    def can_replay(self):
+        """returns whether the backlog is not empty and should be written to the db
+        """
+        return len(self) > 0 and (self.db_available or self._clock() >= self._next_retry)
+
+    def next_batch(self, max_rows):
+        """returns the next actions to replay, totalling at least `max_rows` rows. The same actions are returned
+        until `on_batch_written` is called
+        """
+        if self._replay_started_at is None:
+            self._replay_started_at = self._clock()
+            self._replayed_rows = 0
+        rows = sum(len(action.items) for action in self._pending)
+        while rows < max_rows and self._queue is not None:
+            action = self._queue.pop()
+            if action is None:
+                break
+            self._pending.append(action)
+            rows += len(action.items)
+        return list(self._pending)
+
+    def on_batch_written(self):
+        rows = sum(len(action.items) for action in self._pending)
+        self._pending = []
+        self._next_retry = None
+        self._replayed_rows += rows
+        self.stats["replayed"] += rows
+        if not len(self):
+            logging.info("db backlog replayed - %s rows at %.1f rows/s", self._replayed_rows, self.drain_rate())
+            self._replay_started_at = None
+
+    def drain_rate(self):
+        """returns the number of rows replayed per second since the db is available again
+        """
+        if self._replay_started_at is None:
+            return 0.0
+        return self._replayed_rows / max(self._clock() - self._replay_started_at, 1e-6)
+
+    def close(self):
+        if self._queue is not None:
+            # the actions being replayed were removed from the queue and are written back to be replayed first
+            self._queue.push_front(self._pending)
+            self._pending = []
+            self._queue.close()
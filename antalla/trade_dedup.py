@@ -0,0 +1,130 @@
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+import logging
+import threading
+
+from . import db
+from . import models
+from . import settings
+from .actions import InsertAction
+
+# most recent trade ids of every market of the given exchanges, oldest first
+RECENT_TRADE_IDS_QUERY = """
+    select exchange_id, buy_sym_id, sell_sym_id, exchange_trade_id
+    from (
+        select exchange_id, buy_sym_id, sell_sym_id, exchange_trade_id, timestamp,
+            row_number() over (partition by exchange_id, buy_sym_id, sell_sym_id order by timestamp desc) trade_rank
+        from trades
+        where exchange_id = any(:exchange_ids)
+        and timestamp >= :start_time
+    ) recent_trades
+    where trade_rank <= :max_ids
+    order by timestamp
+"""
+
+
+def get_trade_market(trade):
+    # read the column values directly as executed actions detach their items
+    data = vars(trade)
+    return (data["exchange_id"], data["buy_sym_id"], data["sell_sym_id"])
+
+
+class TradeDeduplicator:
+    """drops the trades which were already stored before they are written to the db. Exchanges resend
+    trades after a reconnection (e.g. HitBTC replays up to 1000 trades per market on every subscription),
+    which would otherwise only be discarded by the db after looking up the primary key index.
+    The ids of the latest `max_ids_per_market` trades of every market are kept in a LRU, which is seeded
+    with the trades stored in the last `seed_period`. The trades being written are tracked with `track` and
+    only added to the LRU by `on_commit`, so that the trades lost by a rollback are written again when resent.
+    `filter` and the other methods can be called from different threads.
+    """
+    def __init__(self, max_ids_per_market=settings.TRADE_CACHE_SIZE, session=db.session,
+                 seed_period=timedelta(seconds=settings.TRADE_CACHE_SEED_SECONDS)):
+        self.max_ids_per_market = max_ids_per_market
+        self.session = session
+        self.seed_period = seed_period
+        self.stats = dict(trades=0, suppressed=0)
+        self.suppressed = Counter()
+        self._trade_ids = {}
+        self._uncommitted = []
+        self._lock = threading.Lock()
+
+    def seed(self, exchange_ids):
+        """loads the ids of the latest trades of every market of `exchange_ids` and returns their number
+        """
+        rows = self.session.execute(RECENT_TRADE_IDS_QUERY, {
+            "exchange_ids": list(exchange_ids),
+            "start_time": datetime.now() - self.seed_period,
+            "max_ids": self.max_ids_per_market,
+        })
+        count = 0
+        with self._lock:
+            for exchange_id, buy_sym_id, sell_sym_id, trade_id in rows:
+                self._add((exchange_id, buy_sym_id, sell_sym_id), trade_id)
+                count += 1
+        logging.info("trade cache - %s trade ids loaded for %s markets", count, len(self._trade_ids))
+        return count
+
+    def _add(self, market, trade_id):
+        trade_ids = self._trade_ids.setdefault(market, OrderedDict())
+        trade_ids[str(trade_id)] = True
+        trade_ids.move_to_end(str(trade_id))
+        if len(trade_ids) > self.max_ids_per_market:
+            trade_ids.popitem(last=False)
+
+    def is_duplicate(self, trade):
+        """returns whether `trade` is already stored
+        """
+        trade_id = str(vars(trade)["exchange_trade_id"])
+        with self._lock:
+            trade_ids = self._trade_ids.get(get_trade_market(trade))
+            if trade_ids is None or trade_id not in trade_ids:
+                return False
+            trade_ids.move_to_end(trade_id)
+            return True
+
+    def filter(self, actions):
+        """returns `actions` without the trades already stored
+        """
+        filtered_actions = []
+        for action in actions:
+            if _is_trade_insert(action):
+                trades = [trade for trade in action.items if not self._check(trade)]
+                if not trades:
+                    continue
+                if len(trades) < len(action.items):
+                    action = InsertAction(trades)
+            filtered_actions.append(action)
+        return filtered_actions
+
+    def _check(self, trade):
+        self.stats["trades"] += 1
+        if not self.is_duplicate(trade):
+            return False
+        self.stats["suppressed"] += 1
+        self.suppressed[get_trade_market(trade)] += 1
+        return True
+
+    def track(self, actions):
+        """records the trades of `actions`, which are being written, until the next commit or rollback
+        """
+        trades = [(get_trade_market(trade), vars(trade)["exchange_trade_id"])
+                  for action in actions if _is_trade_insert(action) for trade in action.items]
+        with self._lock:
+            self._uncommitted.extend(trades)
+
+    def on_commit(self):
+        """adds the trades written since the last commit to the stored trades
+        """
+        with self._lock:
+            for market, trade_id in self._uncommitted:
+                self._add(market, trade_id)
+            self._uncommitted = []
+
+    def on_rollback(self):
+        with self._lock:
+            self._uncommitted = []
+
+
+def _is_trade_insert(action):
+    return isinstance(action, InsertAction) and action.item_type is models.Trade
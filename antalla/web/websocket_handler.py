@@ -3,17 +3,14 @@ import logging
 
 import asyncio
 import websockets
-from sqlalchemy.orm import joinedload
 
 
-from .. import db
-from .. import models
 from ..ob_analyser import OrderBookAnalyser
+from ..reference_cache import reference_cache
 
 
 def get_exchanges():
-    exchanges = db.session.query(models.Exchange).options(joinedload("markets_with_data")).all()
-    return [exchange.to_dict(include_markets=True) for exchange in exchanges]
+    return reference_cache.get_exchanges(include_markets=True)
 
 
 class ConnectionHandler:
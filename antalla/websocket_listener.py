@@ -8,8 +8,10 @@ from .exchange_listener import ExchangeListener
 from . import db
 
 class WebsocketListener(ExchangeListener):
-    def __init__(self, exchange, on_event, markets, ws_url, session=db.session, event_type=None):
-        super().__init__(exchange, on_event, markets, session=session, event_type=event_type)
+    def __init__(self, exchange, on_event, markets, ws_url, session=db.session, event_type=None, cache=None,
+                 max_markets=None):
+        super().__init__(exchange, on_event, markets, session=session, event_type=event_type, cache=cache,
+                         max_markets=max_markets)
         self._running = False
         self._ws_url = ws_url
 
@@ -19,7 +21,7 @@ class WebsocketListener(ExchangeListener):
             try:
                 await self._listen()
             except sqlalchemy.exc.DBAPIError as e:
-                self.session.rollback()
+                self._rollback()
                 logging.error("db error in db: %s", e)
                 self._log_disconnection()
             except Exception as e:
@@ -31,14 +33,26 @@ class WebsocketListener(ExchangeListener):
         async with websockets.connect(self._ws_url) as websocket: 
             await self._setup_connection(websocket)
             self._connected = True
-            while self.running:
-                try:
-                    data = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    continue
-                logging.debug("received %s from %s", data, self.exchange)
-                actions = self._parse_message(json.loads(data))
-                self.on_event(actions)
+            await self._receive(websocket)
+
+    async def _receive(self, websocket, stats=None):
+        """parses the messages received on `websocket` until the listener is stopped, counting them in `stats`
+        """
+        while self.running:
+            if self.backpressure is not None:
+                await self.backpressure.wait_writable()
+            try:
+                data = await asyncio.wait_for(websocket.recv(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            self._handle_message(data, stats)
+
+    def _handle_message(self, data, stats=None):
+        logging.debug("received %s from %s", data, self.exchange)
+        if stats is not None:
+            stats["messages"] += 1
+        actions = self._parse_message(json.loads(data))
+        self.on_event(actions)
 
     async def _setup_connection(self, websocket):
         raise NotImplementedError()
@@ -0,0 +1,47 @@
+"""benchmarks the startup time of the cli with `python -X importtime`
+
+usage: python benchmarks/cli_import_benchmark.py [--repeat N] [--top N] [--module MODULE] [--max-ms MS]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_imports(module):
+    """imports `module` in a new interpreter and returns the (self, cumulative, name) of every top level
+    import, in microseconds
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            imports.append((int(match.group(1)), int(match.group(2)), len(match.group(3)), match.group(4)))
+    return imports
+
+
+def run(module, repeat, top, max_ms):
+    runs = [measure_imports(module) for _ in range(repeat)]
+    totals = [sum(cumulative for _, cumulative, depth, _ in imports if depth == 1) for imports in runs]
+    best = min(range(repeat), key=lambda i: totals[i])
+    print("{:>12} {:>12}  {}".format("self (ms)", "cumul. (ms)", "module"))
+    for self_time, cumulative, _, name in sorted(runs[best], key=lambda i: -i[1])[:top]:
+        print("{:>12.1f} {:>12.1f}  {}".format(self_time / 1000, cumulative / 1000, name))
+    total_ms = totals[best] / 1000
+    print("import {}: {:.1f} ms (best of {})".format(module, total_ms, repeat))
+    if max_ms is not None and total_ms > max_ms:
+        sys.exit("import time above {} ms".format(max_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="cli_import_benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="number of slowest imports to report")
+    parser.add_argument("--module", default="antalla.cli")
+    parser.add_argument("--max-ms", type=float, help="fails if the import takes longer than this")
+    args = parser.parse_args()
+    run(args.module, args.repeat, args.top, args.max_ms)
@@ -0,0 +1,45 @@
+"""benchmarks `order_book.compute_stats` on the sides of synthetic order books
+
+usage: python benchmarks/ob_stats_benchmark.py [--repeat N]
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from antalla.order_book import OrderBook, compute_stats
+
+BOOK_LEVELS = [10, 100, 1000, 10000, 100000]
+MID_PRICE = 100.0
+
+
+def generate_order_book(levels, seed=42):
+    random = np.random.RandomState(seed)
+    bid_count = levels // 2
+    ask_count = levels - bid_count
+    bid_prices = MID_PRICE - random.uniform(0.01, MID_PRICE / 2, bid_count)
+    ask_prices = MID_PRICE + random.uniform(0.01, MID_PRICE / 2, ask_count)
+    sizes = random.uniform(0.1, 50, levels)
+    book = OrderBook()
+    for i, (price, size) in enumerate(zip(bid_prices, sizes[:bid_count])):
+        book.apply("bid", float(price), float(size), i)
+    for i, (price, size) in enumerate(zip(ask_prices, sizes[bid_count:])):
+        book.apply("ask", float(price), float(size), bid_count + i)
+    return book
+
+
+def run(repeat):
+    print("{:>10} {:>14} {:>14}".format("levels", "best (ms)", "levels/s"))
+    for levels in BOOK_LEVELS:
+        book = generate_order_book(levels)
+        # includes extracting the sorted sides of the book, as done for every snapshot
+        timer = timeit.Timer(lambda: compute_stats(*book.side("bid"), *book.side("ask")))
+        number = max(1, 10000 // levels)
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        print("{:>10} {:>14.3f} {:>14.0f}".format(levels, best * 1000, levels / best))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="ob_stats_benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args().repeat)
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 import seaborn as sns
 import matplotlib
 import matplotlib.pyplot as plt
@@ -11,65 +10,51 @@ import logging
 from datetime import datetime
 from antalla.db import session
 from antalla import models
+from antalla import loader
 
 sns.set_style("darkgrid")
 
-def query_orders(buy_sym_id, sell_sym_id):
+ORDER_COLUMNS = [
+    ("exchange", str),
+    ("exchange_order_id", str),
+    ("timestamp", loader.TIMESTAMP_DTYPE),
+    ("filled_at", loader.TIMESTAMP_DTYPE),
+    ("expiry", loader.TIMESTAMP_DTYPE),
+    ("cancelled_at", loader.TIMESTAMP_DTYPE),
+    ("buy_sym_id", str),
+    ("sell_sym_id", str),
+    ("user", str),
+    ("price", float),
+]
+
+def query_orders(buy_sym_id, sell_sym_id, exchange):
     query = (
-        "select exchanges.name, orders.exchange_order_id, orders.timestamp, orders.filled_at, orders.expiry,"+
-        " orders.cancelled_at, orders.buy_sym_id, orders.sell_sym_id, orders.user, orders.price from orders" +
-        " inner join exchanges on exchanges.id = orders.exchange_id where buy_sym_id = '"+buy_sym_id.upper() +"' and" +
-        " sell_sym_id = '" +sell_sym_id.upper()+"' order by timestamp asc"
+        """
+        select exchanges.name, orders.exchange_order_id, orders.timestamp, orders.filled_at, orders.expiry,
+            orders.cancelled_at, orders.buy_sym_id, orders.sell_sym_id, orders.user, orders.price
+        from orders inner join exchanges on exchanges.id = orders.exchange_id
+        where exchanges.name = :exchange and buy_sym_id = :buy_sym_id and sell_sym_id = :sell_sym_id
+        order by timestamp asc
+        """
     )
-    return session.execute(query)
-
-def parse_orders(raw_orders):
-    orders = [] 
-    for order in raw_orders:
-        new_order = dict(
-            exchange=order[0],
-            exchange_order_id=order[1],
-            timestamp=order[2],
-            filled_at=order[3],
-            exipry=order[4],
-            cancelled_at=order[5],
-            buy_sym_id=order[6],
-            sell_sym_id=order[7],
-            user=order[8],
-            price=order[9]
-        )
-        # check if order has been cancelled (for DEXs, e.g. IDEX: regardless whether it has been filled)
-        if order[5] != None:
-            new_order["order_time"] = order[5] - order[2]
-        # check if order has been filled and not been cancelled
-        elif order[3] != None:
-            new_order["order_time"] = order[3] - order[2]
-        else:
-            new_order["order_time"] = None
-        orders.append(new_order)
-    return orders
+    params = {"exchange": exchange.lower(), "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper()}
+    return loader.load_dataframe(query, params, ORDER_COLUMNS, session=session)
 
 def get_times(orders):
-    fill_times = []
-    cancel_times = []
-    for order in orders:
-        if order["cancelled_at"] is not None:
-            cancel_times.append(order["order_time"])
-        elif order["filled_at"] is not None and order["cancelled_at"] is None:
-            fill_times.append(order["order_time"])
-    return dict(fill_times=fill_times, cancel_times=cancel_times)
+    # orders cancelled (for DEXs, e.g. IDEX: regardless whether they have been filled) and orders filled without being cancelled
+    is_cancelled = orders["cancelled_at"].notna()
+    is_filled = orders["filled_at"].notna() & ~is_cancelled
+    return dict(
+        fill_times=orders["filled_at"][is_filled] - orders["timestamp"][is_filled],
+        cancel_times=orders["cancelled_at"][is_cancelled] - orders["timestamp"][is_cancelled],
+    )
     
 def plot_order_time_densities(buy_sym_id, sell_sym_id, exchange):
     # get times until filled and cancelled
-    raw_orders = query_orders(buy_sym_id, sell_sym_id)
-    parsed_orders = parse_orders(raw_orders)
-    filtered_orders = list(filter(lambda x: x["exchange"] == exchange, parsed_orders))
-    times = get_times(filtered_orders)
-    df = pd.DataFrame()
-    df["cancel_times"] = times["cancel_times"]
-    cancels = df["cancel_times"].dt.total_seconds() / 60
-    df["fill_times"] = pd.Series(times["fill_times"])
-    fills = df["fill_times"].dt.total_seconds() / 60
+    orders = query_orders(buy_sym_id, sell_sym_id, exchange)
+    times = get_times(orders)
+    cancels = times["cancel_times"].dt.total_seconds() / 60
+    fills = times["fill_times"].dt.total_seconds() / 60
 
     style.use('seaborn')
     fig, (ax1, ax2) = plt.subplots(2)
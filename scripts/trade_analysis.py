@@ -10,38 +10,58 @@ import logging
 from datetime import datetime
 from antalla.db import session
 from antalla import models
-
-def get_exchange_trades(buy_sym_id, sell_sym_id, exchange): 
-    query = ("select exchange_trade_id, name, timestamp, trade_type, buy_sym_id, sell_sym_id, price,"+
-    " size from trades inner join exchanges on exchanges.id = trades.exchange_id" +
-    " where name = '" + exchange.lower() +"' and buy_sym_id = '" + buy_sym_id.upper() + 
-    "' and sell_sym_id = '" + sell_sym_id.upper() + "' order by timestamp asc")
-    print(query)
-    return session.execute(query)
-
-def parse_raw_trades(raw_trades):
-    trades = []
-    for trade in list(raw_trades):
-        trades.append(dict(
-            exchange=trade[1],
-            timestamp=trade[2],
-            type=trade[3],
-            buy_sym_id=trade[4],
-            sell_sym_id=trade[5],
-            price=trade[6],
-            size=trade[7],
-            volume=float(trade[6]*trade[7])
-        ))
+from antalla import loader
+from antalla.reference_cache import reference_cache
+
+TRADE_COLUMNS = [
+    ("exchange_trade_id", str),
+    ("exchange", str),
+    ("timestamp", loader.TIMESTAMP_DTYPE),
+    ("type", str),
+    ("buy_sym_id", str),
+    ("sell_sym_id", str),
+    ("price", float),
+    ("size", float),
+]
+
+def get_exchange_trades(buy_sym_id, sell_sym_id, exchange):
+    query = (
+        """
+        select exchange_trade_id, name, timestamp, trade_type, buy_sym_id, sell_sym_id, price, size
+        from trades inner join exchanges on exchanges.id = trades.exchange_id
+        where name = :exchange and buy_sym_id = :buy_sym_id and sell_sym_id = :sell_sym_id
+        order by timestamp asc
+        """
+    )
+    params = {"exchange": exchange.lower(), "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper()}
+    trades = loader.load_dataframe(query, params, TRADE_COLUMNS, session=session, index="timestamp")
+    trades["volume"] = trades["price"] * trades["size"]
     return trades
 
+CANDLE_COLUMNS = [
+    ("timestamp", loader.TIMESTAMP_DTYPE),
+    ("quote_volume", float),
+]
+
+def get_hourly_candles(buy_sym_id, sell_sym_id, exchange):
+    query = (
+        """
+        select timestamp, quote_volume
+        from candles inner join exchanges on exchanges.id = candles.exchange_id
+        where name = :exchange and buy_sym_id = :buy_sym_id and sell_sym_id = :sell_sym_id and resolution = '1h'
+        order by timestamp asc
+        """
+    )
+    params = {"exchange": exchange.lower(), "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper()}
+    return loader.load_dataframe(query, params, CANDLE_COLUMNS, session=session, index="timestamp")
+
 def plot_hourly_trade_vol(buy_sym_id, sell_sym_id, exchanges):
-    t = []
+    # reads the hourly candles maintained by 'antalla candles'
     formatter = DateFormatter('%Y-%m-%d %H:%M')
     fig, ax = plt.subplots()
     for exchange in exchanges:
-        raw_trades = get_exchange_trades(buy_sym_id, sell_sym_id, exchange)
-        parsed_trades = parse_raw_trades(raw_trades)
-        plot_individual_trades(parsed_trades, ax, exchange)
+        candles = get_hourly_candles(buy_sym_id, sell_sym_id, exchange)
+        ax.plot(candles.index, candles["quote_volume"], label=exchange, linewidth=2)
     ax.set(xlabel="Timestamp", ylabel="Trade volume ("+buy_sym_id+")",
             title="Sum of Trade Volume Per Hour: "+buy_sym_id+"-"+sell_sym_id)
     ax.xaxis.set_major_formatter(formatter)
@@ -50,17 +70,6 @@ def plot_hourly_trade_vol(buy_sym_id, sell_sym_id, exchanges):
     plt.xticks(rotation="vertical")
     plt.show()
     
-def plot_individual_trades(all_trades, ax, exchange):
-    trades = list(filter(lambda x: x["exchange"] == exchange, all_trades))
-    times = list(map(lambda x: x["timestamp"], trades))
-    volumes = list(map(lambda x: x["volume"], trades))
-    df = pd.DataFrame()
-    df["timestamp"] =  pd.to_datetime(times)
-    df["volumes"] = volumes
-    df.index = df["timestamp"]
-    df_bins = df.resample('H').sum()
-    ax.plot(df_bins.index, df_bins["volumes"], label=exchange, linewidth=2)
-    
 def parse_market(raw_market, sym_1, sym_2):
     """
     >>> raw_market = 'BTCETH'
@@ -78,76 +87,41 @@ def parse_market(raw_market, sym_1, sym_2):
         return (sym_2, sym_1) 
 
 def is_original_market(buy_sym_id, sell_sym_id, exchange):
-    query = (
-        "select name, first_coin_id, second_coin_id, original_name from exchange_markets inner join exchanges on exchanges.id" +
-        " = exchange_markets.exchange_id where name = '" + exchange.lower() + "'"
-    )
-    all_markets = session.execute(query)
-    for row in list(all_markets):
-        if row[1] == buy_sym_id and row[2] == sell_sym_id:
-            market = parse_market(row[3], buy_sym_id, sell_sym_id)
-            return market
-        elif row[1] == sell_sym_id and row[2] == buy_sym_id:
-            market = parse_market(row[3], sell_sym_id, buy_sym_id)
-            return market
-    return None
-
-def invert_trades(raw_trades):
-    trades = []
-    for trade in list(raw_trades):
-        modified_trade = dict(
-            exchange=trade[1],
-            timestamp=trade[2],
-            )
-        if trade[3] == "sell":
-            modified_trade["type"]="sell"
-        else:
-            modified_trade["type"]="buy"
-        modified_trade["buy_sym_id"]=trade[5]
-        modified_trade["sell_sym_id"]=trade[4]
-        price = float(1.0/trade[6])
-        modified_trade["price"]=price
-        modified_trade["size"]=float((trade[6]*trade[7])*(float(1.0/trade[6])))*trade[6]
-        modified_trade["volume"]=float((trade[6]*trade[7])*(float(1.0/trade[6])))
-        trades.append(modified_trade)
-    return trades
+    original_name = reference_cache.get_original_market(exchange.lower(), buy_sym_id, sell_sym_id)
+    if original_name is None:
+        return None
+    first_coin, second_coin = sorted([buy_sym_id, sell_sym_id])
+    return parse_market(original_name, first_coin, second_coin)
+
+def invert_trades(trades):
+    inverted = trades.copy()
+    inverted["type"] = np.where(trades["type"] == "sell", "sell", "buy")
+    inverted["buy_sym_id"] = trades["sell_sym_id"]
+    inverted["sell_sym_id"] = trades["buy_sym_id"]
+    inverted["price"] = 1.0 / trades["price"]
+    inverted["size"] = trades["price"] * trades["size"]
+    inverted["volume"] = trades["size"]
+    return inverted
 
 def plot_volume_bar_chart(buy_sym_id, sell_sym_id, exchange, plot_id):
     # check if market is original market
     original_market = is_original_market(buy_sym_id, sell_sym_id, exchange)
-    trades = []
     if original_market is None:
         return
     elif original_market[0] == sell_sym_id and original_market[1] == buy_sym_id:
-        raw_trades = get_exchange_trades(sell_sym_id, buy_sym_id, exchange)
-        trades = invert_trades(raw_trades)
+        trades = invert_trades(get_exchange_trades(sell_sym_id, buy_sym_id, exchange))
     else:
-        raw_trades = get_exchange_trades(buy_sym_id, sell_sym_id, exchange)
-        trades = parse_raw_trades(raw_trades)
-
-    times = list(map(lambda x: x["timestamp"], trades))
-    volumes = list(map(lambda x: x["volume"], trades))
-    prices = list(map(lambda x: x["price"], trades))
-    sell_volume = list(map(lambda x: x["volume"] if x["type"] == "sell" else 0, trades))
-    buy_volume = list(map(lambda x: x["volume"] if x["type"] == "buy" else 0, trades))
-    
-    sells = list(filter(lambda x: x["type"] == "sell", trades))
-    sell_times = list(map(lambda x: x["timestamp"], sells))
-    sell_prices = list(map(lambda x: x["price"], sells))
+        trades = get_exchange_trades(buy_sym_id, sell_sym_id, exchange)
 
-    buys = list(filter(lambda x: x["type"] == "buy", trades))
-    buy_times = list(map(lambda x: x["timestamp"], buys))
-    buy_prices = list(map(lambda x: x["price"], buys))
+    sells = trades[trades["type"] == "sell"]
+    buys = trades[trades["type"] == "buy"]
 
     fig, axs = plt.subplots(2, sharex=True)
 
-    df = pd.DataFrame()
-    df["timestamp"] =  pd.to_datetime(times)
-    df["volumes"] = volumes
-    df["prices"] = prices
-    df["sell_volume"] = sell_volume
-    df["buy_volume"] = buy_volume
-    df.index = df["timestamp"]
+    df = pd.DataFrame(index=trades.index)
+    df["volumes"] = trades["volume"]
+    df["sell_volume"] = trades["volume"].where(trades["type"] == "sell", 0)
+    df["buy_volume"] = trades["volume"].where(trades["type"] == "buy", 0)
     # bin trades in 1 hour bins
     df_bins = df.resample('30T').sum()
     
@@ -167,20 +141,12 @@ def plot_volume_bar_chart(buy_sym_id, sell_sym_id, exchange, plot_id):
         plt.xticks(rotation="vertical")
         plt.figure(plot_id)
         return
-    df_sells = pd.DataFrame()
-    df_sells["timestamp"] = sell_times
-    df_sells["prices"] = sell_prices
-    df_sells.index = df_sells["timestamp"]
-    sell_bins = df_sells.resample('30T').mean().fillna(0)
+    sell_bins = sells[["price"]].resample('30T').mean().fillna(0)
     # avg sell price
-    ps = axs[1].plot(sell_bins.index, sell_bins["prices"])
-    df_buys = pd.DataFrame()
-    df_buys["timestamp"] = buy_times
-    df_buys["prices"] = buy_prices
-    df_buys.index = df_buys["timestamp"]
-    buy_bins = df_buys.resample('30T').mean().fillna(0)
+    ps = axs[1].plot(sell_bins.index, sell_bins["price"])
+    buy_bins = buys[["price"]].resample('30T').mean().fillna(0)
     # avg buy price
-    pb = axs[1].plot(buy_bins.index, buy_bins["prices"])
+    pb = axs[1].plot(buy_bins.index, buy_bins["price"])
     axs[1].set(xlabel='Time')
     axs[1].xaxis.set_major_formatter(formatter)
     axs[1].grid()
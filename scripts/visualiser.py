@@ -15,34 +15,34 @@ from scipy.stats.stats import pearsonr
 from datetime import datetime
 from antalla.db import session
 from antalla import models
+from antalla import loader
 
 sns.set_style("darkgrid")
 
 class Visualiser:
 
+    TRADE_COLUMNS = [
+        ("timestamp", loader.TIMESTAMP_DTYPE),
+        ("buy_sym_id", str),
+        ("sell_sym_id", str),
+        ("price", float),
+        ("size", float),
+    ]
+
     def _get_all_trades(self, exchange, buy_sym_id, sell_sym_id):
-        return session.execute(
+        return loader.load_dataframe(
             """
             select timestamp, buy_sym_id, sell_sym_id, price, size from trades join exchanges ex on trades.exchange_id=ex.id \
                 where buy_sym_id= :buy_sym_id and sell_sym_id= :sell_sym_id and ex.name = :exchange 
-            """, {"exchange": exchange.lower(), "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper()}
+            """, {"exchange": exchange.lower(), "buy_sym_id": buy_sym_id.upper(), "sell_sym_id": sell_sym_id.upper()},
+            self.TRADE_COLUMNS, session=session, index="timestamp"
         )
 
     def plot_single_trade_size_cdf(self, exchange, buy_sym_id, sell_sym_id):
         # plot trade size cdf for one pair of given exchange
-        result = self._get_all_trades(exchange, buy_sym_id, sell_sym_id)
-        trades = []
-        for row in list(result):
-            trades.append(dict(
-                timestamp=row["timestamp"],
-                buy_sym_id=row["buy_sym_id"],
-                sell_sym_id=row["sell_sym_id"],
-                size=row["size"],
-                price=["price"]
-            ))
-        trade_sizes = list(map(lambda x: x["size"], trades))
-
-        x = np.sort(trade_sizes)
+        trades = self._get_all_trades(exchange, buy_sym_id, sell_sym_id)
+
+        x = np.sort(trades["size"].values)
         y = np.arange(len(x))/float(len(x))
        
         f, ax = plt.subplots(figsize=(8, 8))
@@ -61,17 +61,18 @@ class Visualiser:
             """, {"symbol": symbol, "exchange":exchange})
 
     def _normalise_trade_size(self, market_trades, symbol):
-        norm_trades = []
-        for trade in market_trades:
-            norm_trade = dict(trade)
-            if trade["buy_sym_id"] == symbol:
-                trade_size = trade["size"]
-            else:
-                trade_size = trade["size"] * trade["price"]
-            norm_trade["size"] = trade_size
-            norm_trades.append(norm_trade)
+        norm_trades = market_trades.copy()
+        norm_trades["size"] = market_trades["size"].where(
+            market_trades["buy_sym_id"] == symbol, market_trades["size"] * market_trades["price"])
         return norm_trades
 
+    def _get_normalised_trades(self, exchange, markets, symbol):
+        market_trades = [self._get_all_trades(exchange, market["buy_sym_id"], market["sell_sym_id"]) for market in markets]
+        market_trades = [self._normalise_trade_size(trades, symbol) for trades in market_trades if len(trades)]
+        if not market_trades:
+            return pd.DataFrame({"size": []}, index=pd.DatetimeIndex([]))
+        return pd.concat(market_trades)
+
     def plot_trade_size_cdf(self, exchanges, symbol):
         # plot trade size cdf for one coin (taking into account all markets) for a given exchange
         exchange_markets = defaultdict(list)
@@ -93,15 +94,8 @@ class Visualiser:
         f, ax = plt.subplots(figsize=(8, 8))
         plt.title("Trade Size Emperical CDF (" + symbol + ")")
         for exchange in exchanges:
-            all_trades = []
-            for market in exchange_markets[exchange]:
-                market_trades_proxy = self._get_all_trades(exchange, market["buy_sym_id"], market["sell_sym_id"])
-                market_trades = list(market_trades_proxy)
-                if len(market_trades) == 0:
-                    continue
-                market_trades = self._normalise_trade_size(market_trades, symbol)
-                all_trades.extend(market_trades)
-            x = np.sort([trade["size"] for trade in all_trades])
+            all_trades = self._get_normalised_trades(exchange, exchange_markets[exchange], symbol)
+            x = np.sort(all_trades["size"].values)
             y = np.arange(len(x))/float(len(x))
             line, = ax.plot(x,y, label=exchange)
             line.set_label(exchange)
@@ -136,17 +130,8 @@ class Visualiser:
         plt.title("Trade Sizes Histogram (" + symbol + ")")
         n = 311
         for exchange in exchanges:
-            all_trades = []
-            for market in exchange_markets[exchange]:
-                market_trades_proxy = self._get_all_trades(exchange, market["buy_sym_id"], market["sell_sym_id"])
-                market_trades = list(market_trades_proxy)
-                if len(market_trades) == 0:
-                    continue
-                market_trades = self._normalise_trade_size(market_trades, symbol)
-                all_trades.extend(market_trades)
-            df = pd.DataFrame(all_trades)
-            df.index = df["timestamp"]
-            df_bins = df.resample('1T').sum()
+            all_trades = self._get_normalised_trades(exchange, exchange_markets[exchange], symbol)
+            df_bins = all_trades[["size"]].resample('1T').sum()
             plt.subplot(n)
             #plt.bar(df_bins.index, df_bins["size"], width=0.001, label=exchange, color=next(colors))
             plt.plot(df_bins.index, df_bins["size"], label=exchange, color=next(colors))
@@ -16,6 +16,7 @@ setup(
     ],
     extras_require={
         "plots": ["pandas==0.24.2"],
+        "parquet": ["pyarrow"],
         "dev": [
             "Sphinx==2.2.1",
             "sphinx-rtd-theme==0.4.3",
@@ -1,7 +1,8 @@
 import unittest
 from unittest.mock import MagicMock, call
+from datetime import datetime
 
-from antalla.actions import InsertAction, UpdateAction
+from antalla.actions import InsertAction, UpdateAction, UpdateOrderBookAction
 from antalla import models
 
 
@@ -26,3 +27,21 @@ class ActionsTest(unittest.TestCase):
         for result in results:
             self.assertEqual(result.name, "new_name")
 
+    def test_update_order_book_action(self):
+        def agg_order(price, size, last_update_id):
+            return models.AggOrder(timestamp=datetime(2019, 5, 15), exchange_id=1, buy_sym_id="ETH",
+                                   sell_sym_id="BTC", order_type="bid", price=price, size=size,
+                                   last_update_id=last_update_id)
+        orders = [agg_order(0.5, 1, 1), agg_order(0.5, 2, 3), agg_order(0.5, 4, 2),
+                  agg_order(0.6, 0, 3), agg_order(0.7, 1, None)]
+        action = UpdateOrderBookAction(orders)
+        levels = sorted(action._latest_levels(), key=lambda level: level["price"])
+        self.assertEqual([(l["price"], l["size"], l["last_update_id"]) for l in levels], [(0.5, 2, 3), (0.6, 0, 3)])
+        self.assertEqual(levels[0]["first_coin_id"], "BTC")
+        self.assertEqual(action.execute(self.mock_session), 2)
+        self.assertEqual(self.mock_session.execute.call_count, 2)
+        # the delete is guarded by the last update id like the upsert
+        delete_query, params = self.mock_session.execute.call_args[0]
+        self.assertIn("c.last_update_id <= deleted_levels.last_update_id", str(delete_query))
+        self.assertEqual(params, dict(exchange_id_0=1, first_coin_id_0="BTC", second_coin_id_0="ETH",
+                                      order_type_0="bid", price_0=0.6, last_update_id_0=3))
@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta
+
+from antalla import candles
+
+
+class CandleBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.session.execute.return_value.rowcount = 2
+
+    def _upserts(self):
+        return [call[0] for call in self.session.execute.call_args_list if len(call[0]) > 1]
+
+    def test_unknown_resolution(self):
+        with self.assertRaises(ValueError):
+            candles.CandleBuilder(["2m"], session=self.session)
+
+    def test_base_resolution_always_built(self):
+        builder = candles.CandleBuilder(["1h"], session=self.session)
+        self.assertEqual(builder.resolutions, ["1m", "1h"])
+
+    def test_upserts_per_resolution(self):
+        stop_time = datetime(2019, 5, 15, 19, 34)
+        rows = candles.CandleBuilder(session=self.session).run(stop_time)
+        upserts = self._upserts()
+        self.assertEqual(rows, 8)
+        self.assertEqual([params["resolution"] for _, params in upserts], ["1m", "5m", "1h", "1d"])
+        self.assertIn("from trades", upserts[0][0])
+        self.assertIn("from candles base_candles", upserts[1][0])
+        for _, params in upserts:
+            self.assertEqual(params["stop_time"], stop_time)
+        self.assertEqual(upserts[2][1]["seconds"], 3600)
+        self.session.commit.assert_called_once()
+
+    def test_scan_from_market_start_times(self):
+        builder = candles.CandleBuilder(["1m", "1h"], session=self.session, lookback=timedelta(minutes=5))
+        builder.run(datetime(2019, 5, 15, 19, 34))
+        (trades_query, params), (rollup_query, _params) = self._upserts()
+        self.assertEqual(params["lookback"], 300)
+        self.assertNotIn("start_time", params)
+        # the rows of every market are only read from its own start time on
+        self.assertIn("market_start_times using (exchange_id, buy_sym_id, sell_sym_id)", trades_query)
+        self.assertIn("and trades.timestamp >= coalesce(market_start_times.start_time, '-infinity')", trades_query)
+        self.assertIn("with recursive trade_markets", trades_query)
+        self.assertIn("and base_candles.timestamp >= coalesce(market_start_times.start_time, '-infinity')",
+                      rollup_query)
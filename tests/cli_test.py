@@ -0,0 +1,25 @@
+import subprocess
+import sys
+import unittest
+
+from antalla.exchange_listener import ExchangeListener
+
+
+# dependencies which must only be imported by the commands using them
+LAZY_MODULES = ["seaborn", "matplotlib", "pandas", "numpy", "bs4", "aiohttp", "websockets", "alembic",
+                "pkg_resources", "psycopg2", "antalla.commands", "antalla.exchange_listeners.binance_listener",
+                "antalla.ob_snapshot_generator", "antalla.live_snapshots", "antalla.compactor", "antalla.exporter",
+                "antalla.candles"]
+
+
+class CliTest(unittest.TestCase):
+    def test_lazy_imports(self):
+        code = "import sys, antalla.cli; print(' '.join(m for m in {!r} if m in sys.modules))".format(LAZY_MODULES)
+        output = subprocess.check_output([sys.executable, "-c", code], universal_newlines=True)
+        self.assertEqual(output.split(), [])
+
+    def test_listeners_loaded_on_demand(self):
+        self.assertTrue({"binance", "coinbase", "hitbtc", "idex"} <= set(ExchangeListener.registered()))
+        self.assertEqual(ExchangeListener.get("hitbtc").__name__, "HitBTCListener")
+        with self.assertRaises(ValueError):
+            ExchangeListener.get("unknown")
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+
+from antalla import commands
+
+
+class CommandsTest(unittest.TestCase):
+    def test_update_coin_prices(self):
+        session = MagicMock()
+        session.execute.return_value.rowcount = 2
+        timestamp = datetime(2019, 5, 15)
+        n = commands.update_coin_prices(session, [("BTC", 8000.5, "Bitcoin"), ("XYZ", 0, None)], timestamp)
+        self.assertEqual(n, 2)
+        session.execute.assert_called_once()
+        query, params = session.execute.call_args[0]
+        self.assertIn("update coins", query)
+        self.assertIn("(:symbol_1, cast(:price_1 as float), cast(:name_1 as varchar))", query)
+        self.assertEqual(params["symbol_0"], "BTC")
+        self.assertEqual(params["price_0"], 8000.5)
+        self.assertIsNone(params["name_1"])
+        self.assertEqual(params["timestamp"], timestamp)
+
+    @patch("antalla.commands._init_data", new=MagicMock())
+    @patch("antalla.commands.asyncio")
+    @patch("antalla.commands.db")
+    def test_init_data(self, db, asyncio):
+        commands.init_data({"exchange": [], "fetch_prices": False})
+        self.assertEqual(db.session.execute.call_count, 2)
+        coins_stmt, exchanges_stmt = [call[0][0] for call in db.session.execute.call_args_list]
+        self.assertEqual(coins_stmt.table.name, "coins")
+        self.assertEqual(exchanges_stmt.table.name, "exchanges")
+        self.assertIn("ON CONFLICT (name) DO NOTHING", str(exchanges_stmt.compile(dialect=postgresql.dialect())))
+        db.session.commit.assert_called_once()
+        asyncio.get_event_loop.return_value.run_until_complete.assert_called_once()
+
+    def test_update_coin_prices_empty(self):
+        session = MagicMock()
+        self.assertEqual(commands.update_coin_prices(session, [], datetime(2019, 5, 15)), 0)
+        session.execute.assert_not_called()
+
+    @patch("antalla.commands.db")
+    def test_norm_volume(self, db):
+        db.session.execute.side_effect = [
+            [("binance",), ("hitbtc",)],
+            [(1, "BTC", "ETH", "ETH", True, False), (1, "BTC", "XYZ", "XYZ", False, True)],
+            [("binance",), ("binance",), ("hitbtc",)],
+        ]
+        with self.assertLogs(level="DEBUG") as logs:
+            commands.norm_volume({"exchange": ["hitbtc", "binance", "unknown"]})
+        self.assertEqual(db.session.execute.call_count, 3)
+        query, params = db.session.execute.call_args[0]
+        self.assertIn("update exchange_markets", query)
+        self.assertEqual(params["exchanges"], ["binance", "hitbtc"])
+        db.session.commit.assert_called_once()
+        output = "\n".join(logs.output)
+        self.assertIn("exchange 'unknown' not found in db", output)
+        self.assertIn("no quoted volume for pair 'BTC-ETH' on exchange id '1'", output)
+        self.assertIn("no USD price for symbol 'XYZ' in db", output)
+        self.assertIn("usd volume computed for exchange: 'binance' - 2 markets", output)
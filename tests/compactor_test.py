@@ -0,0 +1,68 @@
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta
+
+from antalla.compactor import Compactor, AGG_ORDER_COLUMNS
+
+
+MARKET = dict(exchange="hitbtc", exchange_id=1, buy_sym_id="ETH", sell_sym_id="BTC",
+              cutoff=datetime(2019, 5, 15, 19, 30))
+
+
+class CompactorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.compactor = Compactor(["hitbtc"], session=self.session, batch_size=3, generate_checkpoints=False)
+
+    def _deletes(self, counts):
+        results = []
+        for count in counts:
+            result = MagicMock()
+            result.rowcount = count
+            results.append(result)
+        self.session.execute.side_effect = results
+
+    def test_compact_market_in_batches(self):
+        self._deletes([3, 3, 1])
+        self.assertEqual(self.compactor._compact_market(MARKET), 7)
+        self.assertEqual(self.session.execute.call_count, 3)
+        self.assertEqual(self.session.commit.call_count, 3)
+        query, params = self.session.execute.call_args[0]
+        self.assertIn("delete from aggregate_orders", query)
+        self.assertNotIn("returning", query)
+        self.assertEqual(params["cutoff"], MARKET["cutoff"])
+        self.assertEqual(params["batch_size"], 3)
+
+    def test_compact_market_archive(self):
+        row = ("hash", 1, datetime(2019, 5, 15), "ETH", "BTC", "BTC", "ETH", 1, "bid", 0.5, 2.0)
+        self.session.execute.side_effect = [[row] * 3, [row]]
+        with tempfile.TemporaryDirectory() as archive_dir:
+            self.compactor.archive_dir = archive_dir
+            self.assertEqual(self.compactor._compact_market(MARKET), 4)
+            self.assertIn("returning", self.session.execute.call_args[0][0])
+            filename = os.path.join(archive_dir, "hitbtc-ETH-BTC-20190515T193000.csv.gz")
+            with gzip.open(filename, "rt", newline="") as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows[0], AGG_ORDER_COLUMNS)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][0], "hash")
+
+    @patch("antalla.compactor.partitions")
+    @patch("antalla.compactor.OBSnapshotGenerator")
+    def test_run(self, generator, partitions):
+        partitions.get_partitioned_tables.return_value = []
+        self.compactor.generate_checkpoints = True
+        now = datetime(2019, 6, 14, 19, 30)
+        with patch.object(self.compactor, "_query_markets", return_value=[MARKET, MARKET]) as query_markets, \
+                patch.object(self.compactor, "_compact_market", return_value=5):
+            report = self.compactor.run(now)
+        cutoff = now - timedelta(days=30)
+        generator.assert_called_once_with(["hitbtc"], cutoff, session=self.session, checkpoints_only=True)
+        generator.return_value.run.assert_called_once()
+        query_markets.assert_called_once_with(cutoff)
+        partitions.drop_empty_partitions.assert_not_called()
+        self.assertEqual(report["rows"], 10)
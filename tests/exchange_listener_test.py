@@ -3,23 +3,40 @@ from unittest.mock import MagicMock
 
 from antalla import models
 from antalla.exchange_listener import ExchangeListener
+from tests.support import mock_reference_data
 
 
 class DummyListener(ExchangeListener):
-    def _find_market(self, market):
-        if market == "ETH_BTC":
-            return models.ExchangeMarket(
-                original_name="ETH_BTC"
-            )
-        return False
+    pass
 
 
 class ExchangeListenerTest(unittest.TestCase):
     def setUp(self):
-        self.exchange = models.Exchange(name="foo")
+        self.exchange = models.Exchange(id=1, name="foo")
         self.on_event = MagicMock()
+        self.session = MagicMock()
+        mock_reference_data(self.session, [self.exchange], [
+            models.ExchangeMarket(first_coin_id="BTC", second_coin_id="ETH", exchange_id=1, original_name="ETH_BTC")
+        ])
 
     def test_initalization(self):
         markets = ["ETH_BTC", "BTC_LTC"]
-        listener = DummyListener(self.exchange, self.on_event, markets)
+        listener = DummyListener(self.exchange, self.on_event, markets, session=self.session)
         self.assertEqual(listener.markets, ["ETH_BTC"])
+        # the markets are resolved through the reference cache, loaded with one query per table
+        self.assertEqual(listener.cache.get_original_market("foo", "BTC", "ETH"), "ETH_BTC")
+        self.assertEqual(self.session.query.call_count, 3)
+
+    def test_log_events(self):
+        listener = DummyListener(self.exchange, self.on_event, ["ETH_BTC"], session=self.session)
+        listener._all_symbols = [("ETH", "BTC")]
+        listener._parse_market_to_symbols = MagicMock(return_value=("ETH", "BTC"))
+        listener._log_event("ETH_BTC", "connect", "all")
+        self.session.execute.assert_called_once()
+        self.session.commit.assert_called_once()
+        # with an ingest buffer, the events are written by the orchestrator
+        listener.backpressure = MagicMock()
+        listener._log_event("ETH_BTC", "disconnect", "all")
+        self.session.execute.assert_called_once()
+        action, = self.on_event.call_args[0][0]
+        self.assertEqual([event.connection_event for event in action.items], ["disconnect"])
@@ -1,15 +1,19 @@
+import asyncio
 from datetime import datetime
 from dateutil.parser import parse as parse_date
 from decimal import Decimal
 from os import path
 import json
+import time
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from antalla import db
+from antalla import settings
 from antalla import models
 from antalla import actions
-from antalla.exchange_listeners.binance_listener import BinanceListener
+from antalla.exchange_listeners.binance_listener import BinanceListener, RateLimiter
+from tests.support import mock_reference_data
 
 FIXTURES_PATH = path.join(path.dirname(path.dirname(__file__)), "fixtures")
 
@@ -79,6 +83,17 @@ class BinanceListenerTest(unittest.TestCase):
         self.assertEqual(order_4.size, 60.00000000)
         self.assertEqual(order_4.order_type, "ask")
         
+    def test_parse_snapshot_again(self):
+        snapshot = json.loads(self.raw_fixture("binance/binance-snapshot.json"))
+        first_orders = self.binance_listener._parse_snapshot(snapshot, "BNBBTC")[0].items
+        self.assertGreater(first_orders[0].timestamp.year, 2000)
+        # the same snapshot fetched again yields the same rows, which are not stored twice
+        resent_orders = self.binance_listener._parse_snapshot(dict(snapshot), "BNBBTC")[0].items
+        self.assertEqual([order.timestamp for order in resent_orders], [order.timestamp for order in first_orders])
+        with patch("time.time", return_value=time.time() + 10):
+            new_orders = self.binance_listener._parse_snapshot(dict(snapshot, lastUpdateId=1027025), "BNBBTC")[0].items
+        self.assertGreater(new_orders[0].timestamp, first_orders[0].timestamp)
+
     def test_parse_trade(self):
         payload = self.raw_fixture("binance/binance-trade.json")
         parsed_actions = self.binance_listener._parse_trade(json.loads(payload))
@@ -135,3 +150,104 @@ class BinanceListenerTest(unittest.TestCase):
     def raw_fixture(self, fixture_name):
         with open(path.join(FIXTURES_PATH, fixture_name)) as f:
             return f.read()
+
+
+class BinanceShardingTest(unittest.TestCase):
+    def setUp(self):
+        self.dummy_exchange = models.Exchange(id=1338, name="dummy")
+        self.on_event_mock = MagicMock()
+
+    def create_sharded_listener(self, markets, max_streams_per_connection):
+        session = MagicMock()
+        mock_reference_data(session, [self.dummy_exchange], [
+            models.ExchangeMarket(first_coin_id=min(market.split("_")), second_coin_id=max(market.split("_")),
+                                  exchange_id=self.dummy_exchange.id, original_name=market, agg_orders_count=0)
+            for market in markets
+        ])
+        return BinanceListener(self.dummy_exchange, self.on_event_mock, markets=markets, session=session,
+                               max_streams_per_connection=max_streams_per_connection)
+
+    def test_create_shards(self):
+        markets = ["ETH_BTC", "BNB_BTC", "LTC_BTC", "EOS_ETH", "XRP_BTC"]
+        listener = self.create_sharded_listener(markets, 4)
+        self.assertEqual([shard.markets for shard in listener.shards],
+                         [["ETH_BTC", "BNB_BTC"], ["LTC_BTC", "EOS_ETH"], ["XRP_BTC"]])
+        self.assertEqual(listener.shards[0].url, settings.BINANCE_COMBINED_STREAM +
+                         "ethbtc@depth/ethbtc@trade/bnbbtc@depth/bnbbtc@trade")
+        listener.event_type = "trade"
+        self.assertEqual(len(listener._create_shards()), 2)
+
+    def test_shard_stats(self):
+        listener = self.create_sharded_listener(["ETH_BTC"], 1)
+        shard, = listener.shards
+        listener.running = True
+        messages = [json.dumps({"data": {"e": "unknown"}})] * 3
+        websocket = MagicMock()
+
+        async def recv():
+            if not messages:
+                listener.running = False
+                raise asyncio.TimeoutError()
+            return messages.pop()
+        websocket.recv = recv
+        asyncio.get_event_loop().run_until_complete(listener._receive(websocket, shard.stats))
+        self.assertEqual(shard.stats["messages"], 3)
+        self.assertGreater(shard.message_rate(), 0)
+        self.assertEqual(self.on_event_mock.call_count, 3)
+
+    def test_stream_read_during_resync(self):
+        listener = self.create_sharded_listener(["ETH_BTC"], 2)
+        shard, = listener.shards
+        listener.running = True
+        messages = [json.dumps({"data": {"e": "unknown"}})] * 2
+        initial_actions = [MagicMock()]
+        setup_done = []
+
+        async def setup_listener(markets):
+            # the snapshots only complete once the stream has been read
+            while messages:
+                await asyncio.sleep(0)
+            setup_done.append(markets)
+            listener._all_symbols = {"ETH", "BTC"}
+            return initial_actions
+
+        async def recv():
+            while not messages:
+                # stops once the snapshots and the messages read in the meantime have been handled
+                if self.on_event_mock.call_count:
+                    listener.running = False
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(0)
+            return messages.pop(0)
+        websocket = MagicMock()
+        websocket.recv = recv
+        connection = MagicMock()
+        connection.__aenter__ = AsyncMock(return_value=websocket)
+        connection.__aexit__ = AsyncMock(return_value=False)
+        with patch("websockets.connect", return_value=connection), \
+             patch.object(listener, "_setup_listener", setup_listener):
+            asyncio.get_event_loop().run_until_complete(listener._listen_to_shard(shard))
+        self.assertEqual(setup_done, [["ETH_BTC"]])
+        self.assertEqual(shard.stats["messages"], 2)
+        self.assertTrue(shard.connected)
+        events = [call[0][0] for call in self.on_event_mock.call_args_list]
+        # the messages read during the resynchronisation are handled after the snapshots
+        self.assertIs(events[0], initial_actions)
+        self.assertEqual(events[-2:], [[], []])
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_acquire(self):
+        now = [0.0]
+        sleeps = []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        limiter = RateLimiter(2.5, 10, clock=lambda: now[0])
+        with patch("asyncio.sleep", sleep):
+            for _ in range(12):
+                asyncio.get_event_loop().run_until_complete(limiter.acquire())
+        # the first 10 requests are made at once, then one every 0.4 seconds
+        self.assertEqual(len(sleeps), 2)
+        self.assertAlmostEqual(now[0], 0.8)
@@ -2,6 +2,7 @@ from datetime import datetime
 from dateutil.parser import parse as parse_date
 from decimal import Decimal
 from os import path
+import asyncio
 import json
 import unittest
 from unittest.mock import MagicMock
@@ -9,6 +10,7 @@ from unittest.mock import MagicMock
 
 from antalla import models
 from antalla import actions
+from antalla.exchange_listeners import hitbtc_listener
 from antalla.exchange_listeners.hitbtc_listener import HitBTCListener
 
 FIXTURES_PATH = path.join(path.dirname(path.dirname(__file__)), "fixtures")
@@ -160,3 +162,65 @@ class HitBTCListenerTest(unittest.TestCase):
         self.assertEqual(insert_action.items[2].price, 0.054591)
         self.assertEqual(insert_action.items[2].size, 0)
         self.assertEqual(insert_action.items[2].timestamp, parse_date("2018-11-19T05:00:28.700Z"))
+
+
+class HitBTCSubscriptionTest(unittest.TestCase):
+    def setUp(self):
+        self.dummy_exchange = models.Exchange(id=1338, name="dummy")
+        self.on_event_mock = MagicMock()
+        markets = ["ETH_BTC", "LTC_BTC"]
+        session = MagicMock()
+        session.query.return_value.filter.return_value.all.return_value = [
+            models.ExchangeMarket(first_coin_id="BTC", second_coin_id="ETH", exchange_id=1338, original_name="ETHBTC"),
+            models.ExchangeMarket(first_coin_id="BTC", second_coin_id="LTC", exchange_id=1338, original_name="LTCBTC"),
+        ]
+        self.session = session
+        self.hitbtc_listener = HitBTCListener(self.dummy_exchange, self.on_event_mock,
+                                              markets=markets, session=session)
+        self.hitbtc_listener._all_symbols = [
+            dict(id="ETHBTC", baseCurrency="ETH", quoteCurrency="BTC"),
+            dict(id="LTCBTC", baseCurrency="LTC", quoteCurrency="BTC"),
+        ]
+
+    def setup_connection(self):
+        sent = []
+        websocket = MagicMock()
+        async def send(message):
+            sent.append(json.loads(message))
+        websocket.send = send
+        websocket.recv.side_effect = AssertionError("responses must not be awaited")
+        async def fetch_all_symbols(session):
+            return self.hitbtc_listener._all_symbols
+        self.hitbtc_listener.fetch_all_symbols = fetch_all_symbols
+        asyncio.get_event_loop().run_until_complete(self.hitbtc_listener._setup_connection(websocket))
+        return sent
+
+    def test_setup_connection(self):
+        sent = self.setup_connection()
+        self.assertEqual([message["method"] for message in sent],
+                         ["subscribeOrderbook", "subscribeTrades"] * 2)
+        self.assertEqual([message["id"] for message in sent], [1, 2, 3, 4])
+        self.assertEqual(sent[1]["params"], {"symbol": "ETHBTC", "limit": hitbtc_listener.TRADES_LIMIT})
+        self.assertEqual(len(self.hitbtc_listener._pending_subscriptions), 4)
+        # all the connection events are logged at once
+        self.assertEqual(self.session.execute.call_count, 1)
+        self.assertEqual(self.session.commit.call_count, 1)
+
+    def test_parse_responses(self):
+        self.setup_connection()
+        self.assertEqual(self.hitbtc_listener._parse_message({"jsonrpc": "2.0", "result": True, "id": 1}), [])
+        self.hitbtc_listener._parse_message({"jsonrpc": "2.0", "result": True, "id": 2})
+        self.hitbtc_listener._parse_message({"jsonrpc": "2.0", "error": {"code": 2001}, "id": 3})
+        self.assertIsNone(self.hitbtc_listener.subscription_stats["time_to_subscribed"])
+        self.hitbtc_listener._parse_message({"jsonrpc": "2.0", "result": True, "id": 4})
+        self.assertEqual(self.hitbtc_listener._pending_subscriptions, {})
+        self.assertEqual(self.hitbtc_listener.subscription_stats["errors"], 1)
+        self.assertIsNotNone(self.hitbtc_listener.subscription_stats["time_to_subscribed"])
+
+    def test_parse_snapshot_trades(self):
+        with open(path.join(FIXTURES_PATH, "hitbtc/hitbtc-snapshot-trades.json")) as f:
+            message = json.load(f)
+        insert_action, = self.hitbtc_listener._parse_message(message)
+        self.assertIsInstance(insert_action, actions.InsertAction)
+        self.assertEqual(len(insert_action.items), len(message["params"]["data"]))
+        self.assertIn(54469456, [trade.exchange_trade_id for trade in insert_action.items])
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+
+import numpy as np
+
+from antalla import models
+from antalla import settings
+from antalla.exporter import Exporter, EXPORT_COLUMNS, load_columns
+
+
+TRADES = [
+    (datetime(2019, 5, 15, 19, 30), "1", "buy", 0.5, 2.0),
+    (datetime(2019, 5, 15, 23, 59), "2", None, 0.6, 1.0),
+    (datetime(2019, 5, 16, 0, 1), "3", "sell", 0.7, 3.0),
+]
+
+
+class ExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        query_exchange_ret = "query.return_value.filter_by.return_value.one.return_value"
+        self.session.configure_mock(**{query_exchange_ret: models.Exchange(id=1, name="hitbtc")})
+        self.execute = self.session.connection.return_value.execution_options.return_value.execute
+        self.execute.side_effect = self._execute
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def _execute(self, _query, params):
+        rows = [row for row in TRADES if params["start_time"] <= row[0] < params["stop_time"]]
+        result = MagicMock()
+        result.fetchmany.side_effect = [rows[:1], rows[1:], []]
+        return result
+
+    def _exporter(self, file_format):
+        return Exporter("hitbtc", "eth", "btc", datetime(2019, 5, 15), datetime(2019, 5, 17),
+                        self.output_dir.name, tables=["trades"], file_format=file_format,
+                        session=self.session, chunk_size=1)
+
+    def test_export_npy(self):
+        written = self._exporter("npy").run()
+        day_dir = os.path.join(self.output_dir.name, "trades", "hitbtc", "ETH_BTC", "2019-05-15")
+        self.assertEqual(written, [day_dir, os.path.join(os.path.dirname(day_dir), "2019-05-16")])
+        self.assertEqual(self.execute.call_count, 2)
+        columns = load_columns(day_dir)
+        self.assertIsInstance(columns["price"], np.memmap)
+        self.assertEqual(columns["price"].tolist(), [0.5, 0.6])
+        self.assertEqual(columns["trade_type"].tolist(), ["buy", ""])
+        self.assertEqual(columns["timestamp"][0], np.datetime64("2019-05-15T19:30"))
+
+    def test_export_npz(self):
+        written = self._exporter("npz").run()
+        self.assertEqual(len(written), 2)
+        with np.load(written[1]) as columns:
+            self.assertEqual(columns["exchange_trade_id"].tolist(), ["3"])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self._exporter("csv")
+
+    def test_export_tables(self):
+        # the tables offered by the cli are defined in the settings
+        self.assertEqual(list(EXPORT_COLUMNS), settings.EXPORT_TABLES)
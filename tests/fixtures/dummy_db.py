@@ -589,6 +589,7 @@ def insert_snapshot(session):
         models.OrderBookSnapshot(
             timestamp=datetime.datetime(2019, 5, 15, 19, 37, 0, 0), 
             snapshot_type="quartile",
+            snapshot_interval=1,
             buy_sym_id='ETH',
             sell_sym_id='BTC',
             exchange_id=1,
@@ -0,0 +1,161 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+
+import sqlalchemy
+
+from antalla import models
+from antalla.actions import InsertAction
+from antalla.ingest_buffer import IngestBuffer, BufferedWriter
+
+
+def create_agg_order(price, size, last_update_id):
+    return models.AggOrder(
+        timestamp=datetime(2019, 5, 15, 19, 30),
+        last_update_id=last_update_id,
+        buy_sym_id="ETH",
+        sell_sym_id="BTC",
+        exchange_id=1,
+        order_type="bid",
+        price=price,
+        size=size,
+    )
+
+
+def create_trade(trade_id):
+    return models.Trade(
+        timestamp=datetime(2019, 5, 15, 19, 30),
+        exchange_trade_id=str(trade_id),
+        exchange_id=1,
+        buy_sym_id="ETH",
+        sell_sym_id="BTC",
+        price=0.03,
+        size=1.0,
+    )
+
+
+class IngestBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spill_dir.cleanup)
+
+    def create_buffer(self, max_rows, **policies):
+        return IngestBuffer(max_rows, policies, self.spill_dir.name)
+
+    def test_get_batch(self):
+        buffer = self.create_buffer(10)
+        other = MagicMock()
+        buffer.put([InsertAction([create_trade(1), create_trade(2)]), other, InsertAction([])])
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(len(buffer.get_batch(2)), 1)
+        self.assertEqual(buffer.get_batch(2), [other])
+        self.assertEqual(len(buffer), 0)
+
+    def test_conflate(self):
+        buffer = self.create_buffer(3)
+        buffer.put([InsertAction([create_agg_order(1.0, 2.0, 1), create_agg_order(2.0, 1.0, 2)])])
+        buffer.put([InsertAction([create_agg_order(1.0, 0.0, 3), create_agg_order(1.5, 3.0, 4)])])
+        self.assertEqual(buffer.rows, 3)
+        self.assertEqual(buffer.stats["conflated"], 1)
+        self.assertEqual(buffer.stats["blocked"], 1)
+        # new depth updates are merged into the conflated ones
+        buffer.put([InsertAction([create_agg_order(2.0, 4.0, 5)]), InsertAction([create_trade(1)])])
+        self.assertEqual(buffer.rows, 4)
+        self.assertEqual(buffer.stats["conflated"], 2)
+        action, trades = buffer.get_batch(10)
+        self.assertEqual([(order.price, order.size) for order in action.items], [(1.0, 0.0), (1.5, 3.0), (2.0, 4.0)])
+        self.assertEqual(len(trades.items), 1)
+        # once written, depth updates are buffered again until the buffer is full
+        buffer.put([InsertAction([create_agg_order(2.0, 5.0, 6)])])
+        self.assertIsNone(buffer._conflated)
+        self.assertEqual(len(buffer.get_batch(10)[0].items), 1)
+
+    def test_block(self):
+        buffer = self.create_buffer(2, trade="block")
+        buffer.put([InsertAction([create_trade(1), create_trade(2)])])
+        self.assertFalse(buffer._writable.is_set())
+        self.assertEqual(buffer.stats["blocked"], 1)
+        buffer.get_batch(10)
+        asyncio.get_event_loop().run_until_complete(asyncio.wait_for(buffer.wait_writable(), 1))
+
+    def test_spill(self):
+        buffer = self.create_buffer(2, trade="spill")
+        buffer.put([InsertAction([create_trade(1), create_trade(2)])])
+        buffer.put([InsertAction([create_trade(3)])])
+        buffer.put([InsertAction([create_trade(4)])])
+        self.assertEqual((buffer.rows, buffer.spilled_rows), (2, 2))
+        self.assertEqual(buffer.stats["spilled"], 2)
+        self.assertEqual(len(buffer.get_batch(2)[0].items), 2)
+        # spilled trades are replayed in order, and new trades are spilled until then
+        buffer.put([InsertAction([create_trade(5)])])
+        ids = [trade.exchange_trade_id for action in buffer.get_batch(10) for trade in action.items]
+        self.assertEqual(ids, ["3", "4", "5"])
+        self.assertEqual(len(buffer), 0)
+        buffer.put([InsertAction([create_trade(6)])])
+        self.assertEqual(buffer.rows, 1)
+        buffer.close()
+
+    def test_invalid_policies(self):
+        with self.assertRaises(ValueError):
+            self.create_buffer(10, trade="conflate")
+        with self.assertRaises(ValueError):
+            self.create_buffer(10, depth="drop")
+        with self.assertRaises(ValueError):
+            self.create_buffer(10, other="spill")
+
+
+def create_mock_action():
+    mock_action = MagicMock()
+    mock_action.execute.return_value = 2
+    return mock_action
+
+
+class BufferedWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_session = MagicMock()
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spill_dir.cleanup)
+
+    def test_run(self):
+        buffer = IngestBuffer(10, spill_dir=self.spill_dir.name)
+        writer = BufferedWriter(buffer, self.mock_session, 3)
+        action = create_mock_action()
+        buffer.put([action, action])
+        asyncio.get_event_loop().run_until_complete(writer.run())
+        self.assertEqual(action.execute.call_count, 2)
+        self.assertEqual(self.mock_session.commit.call_count, 2)
+
+    def test_backlog_written_by_writer_thread(self):
+        backlog = MagicMock()
+        backlog.__len__.return_value = 1
+        backlog.can_replay.return_value = False
+        threads = []
+        backlog.spill.side_effect = lambda actions: threads.append(threading.current_thread())
+        buffer = IngestBuffer(10, spill_dir=self.spill_dir.name)
+        writer = BufferedWriter(buffer, self.mock_session, 3, backlog=backlog)
+        buffer.put([create_mock_action()])
+        asyncio.get_event_loop().run_until_complete(writer.run())
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        backlog.close.assert_called_once()
+
+    def test_data_error(self):
+        writer = BufferedWriter(MagicMock(), self.mock_session, 3, backlog=MagicMock())
+        valid_action, invalid_action = create_mock_action(), create_mock_action()
+        error = sqlalchemy.exc.IntegrityError("INSERT", {}, Exception("duplicate key"))
+        invalid_action.execute.side_effect = error
+        writer._uncommitted = [valid_action, invalid_action]
+        writer.on_db_error(error)
+        # the actions are written one by one, the invalid one is dropped and nothing is spilled
+        self.assertEqual(valid_action.execute.call_count, 1)
+        self.assertEqual(writer.dropped_actions, 1)
+        self.mock_session.commit.assert_called_once()
+        writer.backlog.spill.assert_not_called()
+        self.assertEqual(writer._uncommitted, [])
+
+        writer._uncommitted = [valid_action]
+        writer.on_db_error(sqlalchemy.exc.OperationalError("COMMIT", {}, Exception("connection refused")))
+        writer.backlog.spill.assert_called_once_with([valid_action])
@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from antalla import models
+from antalla.actions import InsertAction
+from antalla.live_snapshots import LiveSnapshotGenerator
+
+
+def create_agg_order(order_type, price, size, last_update_id):
+    return models.AggOrder(timestamp=datetime(2019, 5, 15, 19, 30), exchange_id=1, buy_sym_id="ETH",
+                           sell_sym_id="BTC", order_type=order_type, price=price, size=size,
+                           last_update_id=last_update_id)
+
+
+class LiveSnapshotGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = SimpleNamespace(exchange=models.Exchange(id=1, name="dummy"), disconnections=0)
+        self.generator = LiveSnapshotGenerator([self.listener], [0.5, None])
+        self.generator.on_actions([InsertAction([
+            create_agg_order("bid", 0.5, 10, 1),
+            create_agg_order("ask", 0.6, 5, 1),
+            create_agg_order("ask", 0.7, 2, 1),
+        ])])
+
+    def test_create_snapshots(self):
+        timestamp = datetime(2019, 5, 15, 19, 31)
+        action = self.generator.create_snapshots(timestamp)[0]
+        snapshots = sorted(action.items, key=lambda snapshot: snapshot.snapshot_type)
+        self.assertEqual(len(snapshots), 2)
+        mid_price, quartile = snapshots
+        self.assertEqual(mid_price.snapshot_type, "mid_price_range")
+        self.assertEqual(mid_price.asks_count, 2)
+        self.assertEqual(quartile.snapshot_type, "quartile")
+        self.assertEqual(quartile.asks_count, 1)
+        self.assertAlmostEqual(quartile.spread, 0.1)
+        self.assertEqual(quartile.timestamp, timestamp)
+        self.assertEqual((quartile.exchange_id, quartile.buy_sym_id, quartile.sell_sym_id), (1, "ETH", "BTC"))
+
+    def test_ignores_other_actions(self):
+        self.generator.on_actions([InsertAction([models.Coin(symbol="ETH")])])
+        self.assertEqual(len(self.generator.create_snapshots()[0].items), 2)
+
+    def test_discard_books_on_disconnection(self):
+        self.listener.disconnections += 1
+        self.assertEqual(self.generator.create_snapshots()[0].items, [])
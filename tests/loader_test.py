@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+
+import numpy as np
+
+from antalla import loader
+
+
+ROWS = [
+    (datetime(2019, 5, 15, 19, 30), "buy", 0.5, 1),
+    (datetime(2019, 5, 15, 19, 31), None, 0.6, None),
+    (datetime(2019, 5, 15, 19, 32), "sell", None, 3),
+]
+COLUMNS = [("timestamp", loader.TIMESTAMP_DTYPE), ("type", str), ("price", float), ("id", np.int64)]
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.execution_options = self.session.connection.return_value.execution_options
+        self.result = self.execution_options.return_value.execute.return_value
+        self.result.fetchmany.side_effect = [ROWS[:2], ROWS[2:], []]
+
+    def test_iter_chunks(self):
+        chunks = list(loader.iter_chunks("select 1", session=self.session, chunk_size=2))
+        self.assertEqual(chunks, [ROWS[:2], ROWS[2:]])
+        self.execution_options.assert_called_once_with(stream_results=True)
+        self.result.fetchmany.assert_called_with(2)
+        self.result.close.assert_called_once()
+
+    def test_load_arrays(self):
+        arrays = loader.load_arrays("select 1", {"a": 1}, COLUMNS, session=self.session, chunk_size=2)
+        self.assertEqual(arrays["timestamp"].dtype, np.dtype("datetime64[us]"))
+        self.assertEqual(arrays["type"].tolist(), ["buy", "", "sell"])
+        self.assertTrue(np.isnan(arrays["price"][2]))
+        self.assertEqual(arrays["id"].tolist(), [1, -1, 3])
+
+    def test_load_arrays_empty(self):
+        self.result.fetchmany.side_effect = [[]]
+        arrays = loader.load_arrays("select 1", None, COLUMNS, session=self.session)
+        self.assertEqual([len(values) for values in arrays.values()], [0, 0, 0, 0])
+        self.assertEqual(arrays["price"].dtype, np.dtype(float))
+
+    def test_load_dataframe(self):
+        df = loader.load_dataframe("select 1", None, COLUMNS, session=self.session, index="timestamp")
+        self.assertEqual(list(df.columns), ["timestamp", "type", "price", "id"])
+        self.assertEqual(df.index[0], datetime(2019, 5, 15, 19, 30))
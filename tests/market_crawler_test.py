@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from antalla.market_crawler import MarketCrawler
+
+
+PRICES_HTML = """
+<html><body>
+<div>header</div>
+<table id="currencies-all"><tbody>
+<tr><td class="col-symbol">BTC</td><td><a class="price" data-usd="8000.5">$8,000.50</a></td></tr>
+<tr><td class="col-symbol">XYZ</td><td><a class="price" data-usd="?">?</a></td></tr>
+</tbody></table>
+</body></html>
+"""
+
+
+class MarketCrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_dir.name, "cache", "prices.json")
+        self.crawler = MarketCrawler(cache_path=self.cache_path, cache_ttl=60)
+        self.fetch_count = 0
+        async def fetch(_session, _url):
+            self.fetch_count += 1
+            return PRICES_HTML
+        self.crawler._fetch = fetch
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def _get_prices(self, crawler):
+        return asyncio.get_event_loop().run_until_complete(crawler.get_prices())
+
+    def test_parse_prices(self):
+        self.crawler._parse_prices(PRICES_HTML)
+        self.assertEqual(self.crawler._prices, {"BTC": 8000.5, "XYZ": 0.0})
+
+    def test_get_prices_cached(self):
+        self.assertEqual(self._get_prices(self.crawler)["BTC"], 8000.5)
+        other_crawler = MarketCrawler(cache_path=self.cache_path, cache_ttl=60)
+        other_crawler._fetch = self.crawler._fetch
+        self.assertEqual(self._get_prices(other_crawler)["BTC"], 8000.5)
+        self.assertEqual(self.fetch_count, 1)
+
+    def test_get_prices_expired_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, "w") as f:
+            json.dump(dict(fetched_at=time.time() - 120, prices={"BTC": 1.0}), f)
+        self.assertEqual(self._get_prices(self.crawler)["BTC"], 8000.5)
+        self.assertEqual(self.fetch_count, 1)
@@ -1,11 +1,21 @@
+import multiprocessing
 import unittest
+from unittest.mock import MagicMock, patch
 from datetime import datetime
 
 from antalla import db
 from antalla import models
 from antalla import ob_snapshot_generator
+from antalla.order_book import OrderBook, compute_stats
 from tests.fixtures import dummy_db
 
+def fake_snapshot_market(generator, exchange, market, last_update_times):
+    # every market writes a distinct power of two rows, so that the total identifies the generated markets
+    market_index = ["ETH", "LTC", "XRP", "EOS"].index(market["buy_sym_id"])
+    generator.rows_written += 2 ** (market_index + 1) + len(generator.event_log.get(exchange+market["buy_sym_id"]+"BTC", []))
+    generator.commit_counter += len(last_update_times)
+
+
 class ModelsTest(unittest.TestCase):
     def setUp(self):
         self.session = db.Session()
@@ -72,7 +82,7 @@ class ModelsTest(unittest.TestCase):
         generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 35, 42, 0), session=self.session)
         connection_events = generator._query_connection_events()
         generator._parse_connection_events(connection_events)
-        generator.snapshot_interval = 1
+        generator.snapshot_intervals = [1]
         market = dict(
             exchange_id=1,
             buy_sym_id="ETH",
@@ -91,7 +101,7 @@ class ModelsTest(unittest.TestCase):
         generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 35, 11, 0), session=self.session)
         connection_events = generator._query_connection_events()
         generator._parse_connection_events(connection_events)
-        generator.snapshot_interval = 1
+        generator.snapshot_intervals = [1]
         market = dict(
             exchange_id=1,
             buy_sym_id="ETH",
@@ -118,7 +128,7 @@ class ModelsTest(unittest.TestCase):
         generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 32, 41, 0), session=self.session)
         connection_events = generator._query_connection_events()
         generator._parse_connection_events(connection_events)
-        generator.snapshot_interval = 1
+        generator.snapshot_intervals = [1]
         market = dict(
             exchange_id=1,
             buy_sym_id="ETH",
@@ -131,24 +141,33 @@ class ModelsTest(unittest.TestCase):
         created_snapshots = list(self.session.execute("select count(*) from order_book_snapshots"))[0]
         self.assertEqual(created_snapshots[0], 109)
     
-    def test_query_order_book(self):
+    def test_query_order_updates(self):
         self._insert_data()
         generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime.now(), 1, session=self.session)
-        ob_result_proxy = generator._query_order_book("hitbtc", "ETH", "BTC", "2019-05-15 19:30:0.0", "2019-05-15 19:35:45.0")
-        full_order_book = generator._parse_order_book(ob_result_proxy)
-        self.assertEqual(len(full_order_book), 6)
-        bids = 0
-        asks = 0
-        bids = list(filter(lambda x: x["order_type"] == "bid", full_order_book))
-        asks = list(filter(lambda x: x["order_type"] == "ask", full_order_book))
-        bid_prices = list(map(lambda x: x["price"], bids))
-        ask_prices = list(map(lambda x: x["price"], asks))
-        self.assertEqual(len(bids), 3)
-        self.assertEqual(len(asks), 3)
-        self.assertAlmostEqual(min(bid_prices), 0.3)
-        self.assertAlmostEqual(min(ask_prices), 0.6)
-        self.assertAlmostEqual(max(bid_prices), 0.5)
-        self.assertAlmostEqual(max(ask_prices), 0.7)
+        book = OrderBook()
+        for order_type, price, size, last_update_id, _ in generator._query_order_updates(
+                1, "ETH", "BTC", datetime(2019, 5, 15, 19, 30), datetime(2019, 5, 15, 19, 35, 45)):
+            book.apply(order_type, price, size, last_update_id)
+        bid_prices, _ = book.side("bid")
+        ask_prices, _ = book.side("ask")
+        self.assertEqual(len(bid_prices), 3)
+        self.assertEqual(len(ask_prices), 3)
+        self.assertAlmostEqual(bid_prices.min(), 0.3)
+        self.assertAlmostEqual(ask_prices.min(), 0.6)
+        self.assertAlmostEqual(bid_prices.max(), 0.5)
+        self.assertAlmostEqual(ask_prices.max(), 0.7)
+
+    def _explain(self, query, params):
+        self.session.execute("set local enable_seqscan = off")
+        self.session.execute("set local enable_bitmapscan = off")
+        return "\n".join(row[0] for row in self.session.execute("explain " + query, params))
+
+    def test_order_updates_query_uses_index_only_scan(self):
+        self._insert_data()
+        params = {"exchange_id": 1, "buy_sym_id": "ETH", "sell_sym_id": "BTC",
+                  "start_time": "2019-05-15 19:30:0.0", "stop_time": "2019-05-15 19:35:45.0"}
+        plan = self._explain(ob_snapshot_generator.ORDER_UPDATES_QUERY, params)
+        self.assertIn("Index Only Scan using aggregate_orders_market_timestamp_index", plan)
 
     def test_get_connection_window(self):
         self._insert_data()
@@ -183,8 +202,10 @@ class ModelsTest(unittest.TestCase):
         {"order_type":"bid", "price": 0.75, "size": 30}, {"order_type":"bid", "price": 0.8, "size": 5},\
         {"order_type":"ask", "price": 1.08, "size": 4}, {"order_type":"ask", "price": 1.02, "size": 7},\
         {"order_type":"bid", "price": 0.95, "size": 7}, {"order_type":"ask", "price": 0.97, "size": 3}]
-        generator = ob_snapshot_generator.OBSnapshotGenerator('hitbtc', 0)
-        output = generator._compute_stats(order_book)
+        book = OrderBook()
+        for i, order in enumerate(order_book):
+            book.apply(order["order_type"], order["price"], order["size"], i)
+        output = compute_stats(*book.side("bid"), *book.side("ask"))
         self.assertEqual(output["spread"], 0.020000000000000018)
         self.assertEqual(output["min_ask_price"], 0.97)
         self.assertEqual(output["min_ask_size"], 3)
@@ -201,6 +222,147 @@ class ModelsTest(unittest.TestCase):
         self.assertEqual(output["bid_price_median"], 0.775)
         self.assertEqual(output["ask_price_median"], 1.05)
             
+    def test_flush_snapshots(self):
+        session = MagicMock()
+        generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime.now(), session=session, flush_size=2)
+        snapshots = [models.OrderBookSnapshot(timestamp=datetime(2019, 5, 15, 19, 30, i)) for i in range(3)]
+        for snapshot in snapshots:
+            generator._buffer_snapshot(snapshot)
+        session.execute.assert_called_once()
+        session.commit.assert_called_once()
+        self.assertEqual(generator.snapshots_buffer, snapshots[2:])
+        generator._flush_snapshots()
+        self.assertEqual(session.execute.call_count, 2)
+        self.assertEqual(generator.snapshots_buffer, [])
+        self.assertEqual(generator.rows_written, 3)
+        self.assertEqual(generator.commit_counter, 2)
+
+    def test_generate_snapshots_from_replay(self):
+        session = MagicMock()
+        connect_time = datetime(2019, 5, 15, 19, 30, 0)
+        updates = [
+            ("bid", 0.5, 10, 1, datetime(2019, 5, 15, 19, 30, 0)),
+            ("ask", 0.6, 5, 2, datetime(2019, 5, 15, 19, 30, 1)),
+            ("ask", 0.6, 0, 3, datetime(2019, 5, 15, 19, 30, 3)),
+            ("ask", 0.7, 2, 4, datetime(2019, 5, 15, 19, 30, 3)),
+        ]
+        generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 30, 5), 0.5,
+                                                              session=session, checkpoint_interval=2)
+        generator.event_log = {"hitbtcETHBTC": [dict(timestamp=connect_time, id=1, connection_event="connect")]}
+        market = dict(exchange_id=1, buy_sym_id="ETH", sell_sym_id="BTC")
+        buffered = []
+        generator._buffer_snapshot = buffered.append
+        query_updates = lambda _exchange, _buy, _sell, start, stop: [u for u in updates if start <= u[4] < stop]
+        with patch.object(generator, "_query_order_updates", side_effect=query_updates), \
+             patch.object(generator, "_restore_order_book", return_value=OrderBook(connect_time)), \
+             patch.object(generator, "_flush_snapshots"):
+            generator._generate_all_snapshots(connect_time, generator.stop_time, None, market, "hitbtc")
+        self.assertEqual([s.timestamp.second for s in buffered], [1, 2, 3, 4])
+        self.assertEqual([s.min_ask_price for s in buffered], [0.6, 0.6, 0.7, 0.7])
+        self.assertEqual([c.timestamp.second for c in generator.checkpoints_buffer], [2, 4])
+        # the levels removed by the replayed updates are not checkpointed
+        self.assertEqual(generator.checkpoints_buffer[-1].ask_prices, [0.7])
+        self.assertEqual(generator.checkpoints_buffer[-1].ask_sizes, [2])
+
+    def test_resume_per_band_and_interval(self):
+        generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime.now(), 0.2, [1, 60],
+                                                              session=MagicMock())
+        latest_snapshots = [
+            (datetime(2019, 5, 15, 19, 31), "ETH", "BTC", 1, "hitbtc", 0.2, "mid_price_range", 1),
+            (datetime(2019, 5, 15, 19, 30), "ETH", "BTC", 1, "hitbtc", 0.2, "mid_price_range", 60),
+        ]
+        snapshot_times = generator._parse_snapshot_times(latest_snapshots)
+        self.assertEqual(generator._get_last_update_time("hitbtcETHBTC", snapshot_times, 0.2, 1),
+                         datetime(2019, 5, 15, 19, 31))
+        self.assertEqual(generator._get_last_update_time("hitbtcETHBTC", snapshot_times, 0.2, 60),
+                         datetime(2019, 5, 15, 19, 30))
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires forked workers")
+    def test_parallel_generation_matches_serial(self):
+        work_units = [("hitbtc", dict(exchange_id=1, buy_sym_id=buy, sell_sym_id="BTC"), {(0.2, 1): None})
+                      for buy in ("ETH", "LTC", "XRP", "EOS")]
+        event_log = {"hitbtcETHBTC": [dict(timestamp=datetime(2019, 5, 15, 19, 30), id=1, connection_event="connect")]}
+
+        def generate(jobs):
+            generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 31), 0.2, 1,
+                                                                  session=MagicMock())
+            generator.event_log = event_log
+            with patch.object(generator, "_get_work_units", return_value=work_units), \
+                 patch.object(generator, "_flush_snapshots"):
+                generator.run(jobs=jobs)
+            return generator.commit_counter, generator.rows_written
+
+        fork_pool = multiprocessing.get_context("fork").Pool
+        with patch.object(ob_snapshot_generator.OBSnapshotGenerator, "_snapshot_market", fake_snapshot_market), \
+             patch.object(ob_snapshot_generator.multiprocessing, "Pool", side_effect=fork_pool) as pool, \
+             patch.object(db, "get_engine"), patch.object(db, "Session"):
+            serial = generate(1)
+            pool.assert_not_called()
+            parallel = generate(2)
+            pool.assert_called_once()
+        self.assertEqual(serial, (4, 2 + 4 + 8 + 16 + 1))
+        self.assertEqual(parallel, serial)
+
+    def test_checkpoints_only(self):
+        connect_time = datetime(2019, 5, 15, 19, 30, 0)
+        updates = [
+            ("bid", 0.5, 10, 1, datetime(2019, 5, 15, 19, 30, 0)),
+            ("ask", 1.1, 5, 2, datetime(2019, 5, 15, 19, 30, 0)),
+        ]
+        generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 35), [0.2, 0.5],
+                                                              [1, 60], session=MagicMock(), checkpoint_interval=60,
+                                                              checkpoints_only=True)
+        generator.event_log = {"hitbtcETHBTC": [dict(timestamp=connect_time, id=1, connection_event="connect")]}
+        latest_checkpoints = [(datetime(2019, 5, 15, 19, 31), "ETH", "BTC", "hitbtc")]
+        with patch.object(generator, "_query_exchange_markets", return_value=[("hitbtc", "ETH", "BTC", 1)]), \
+             patch.object(generator, "_query_connection_events", return_value=[]), \
+             patch.object(generator, "_query_latest_checkpoint", return_value=latest_checkpoints), \
+             patch.object(generator, "_query_latest_snapshot") as query_latest_snapshot:
+            work_units = generator._get_work_units()
+        query_latest_snapshot.assert_not_called()
+        self.assertEqual([last_update_times for _exchange, _market, last_update_times in work_units],
+                         [{(0.0, 60): datetime(2019, 5, 15, 19, 31)}])
+
+        generator.event_log = {"hitbtcETHBTC": [dict(timestamp=connect_time, id=1, connection_event="connect")]}
+        market = dict(exchange_id=1, buy_sym_id="ETH", sell_sym_id="BTC")
+        query_updates = MagicMock(side_effect=lambda _exchange, _buy, _sell, start, stop: [u for u in updates if start <= u[4] < stop])
+        with patch.object(generator, "_query_order_updates", query_updates), \
+             patch.object(generator, "_restore_order_book", return_value=OrderBook(connect_time)), \
+             patch.object(generator, "_flush_snapshots"):
+            generator._snapshot_market("hitbtc", market, {(0.0, 60): None})
+        self.assertEqual(generator.snapshots_buffer, [])
+        self.assertEqual([checkpoint.timestamp.minute for checkpoint in generator.checkpoints_buffer], [31, 32, 33, 34])
+        self.assertEqual(generator.checkpoints_buffer[0].bid_prices, [0.5])
+
+    def test_generate_multiple_bands_and_intervals(self):
+        connect_time = datetime(2019, 5, 15, 19, 30, 0)
+        updates = [
+            ("bid", 0.5, 10, 1, datetime(2019, 5, 15, 19, 30, 0)),
+            ("bid", 0.9, 1, 2, datetime(2019, 5, 15, 19, 30, 0)),
+            ("ask", 1.1, 5, 3, datetime(2019, 5, 15, 19, 30, 0)),
+            ("ask", 2.0, 1, 4, datetime(2019, 5, 15, 19, 30, 0)),
+        ]
+        generator = ob_snapshot_generator.OBSnapshotGenerator("hitbtc", datetime(2019, 5, 15, 19, 30, 5), [0.2, None],
+                                                              [1, 2], session=MagicMock())
+        generator.event_log = {"hitbtcETHBTC": [dict(timestamp=connect_time, id=1, connection_event="connect")]}
+        market = dict(exchange_id=1, buy_sym_id="ETH", sell_sym_id="BTC")
+        buffered = []
+        generator._buffer_snapshot = buffered.append
+        query_updates = MagicMock(side_effect=lambda _exchange, _buy, _sell, start, stop: [u for u in updates if start <= u[4] < stop])
+        with patch.object(generator, "_query_order_updates", query_updates), \
+             patch.object(generator, "_restore_order_book", return_value=OrderBook(connect_time)) as restore, \
+             patch.object(generator, "_flush_snapshots"):
+            generator._generate_all_snapshots(connect_time, generator.stop_time, None, market, "hitbtc")
+        restore.assert_called_once()
+        self.assertEqual(query_updates.call_count, 1)
+        snapshots = sorted((s.snapshot_type, s.snapshot_interval, s.timestamp.second, s.bids_count) for s in buffered)
+        # the snapshots of the 2 seconds interval share their timestamps with the ones of the 1 second interval
+        self.assertEqual(snapshots, [(snapshot_type, interval, second, 1)
+                                     for snapshot_type in ("mid_price_range", "quartile")
+                                     for interval in (1, 2)
+                                     for second in range(interval, 5, interval)])
+        self.assertEqual(len({(s.snapshot_type, s.snapshot_interval, s.timestamp) for s in buffered}), len(buffered))
+
     def test_run_mid_price(self):
         """testing the computation of order book snapshots using a mid price range approach
         """
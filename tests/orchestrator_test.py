@@ -1,11 +1,20 @@
 import asyncio
+from datetime import datetime
+import tempfile
 import unittest
 from unittest.mock import MagicMock
 
+import sqlalchemy
+
 
 from antalla.orchestrator import Orchestrator
 from antalla.exchange_listener import ExchangeListener
+from antalla.ingest_buffer import IngestBuffer
+from antalla.trade_dedup import TradeDeduplicator
+from antalla.spill import Backlog
+from antalla.actions import InsertAction
 from antalla import models
+from tests.support import mock_reference_data
 
 
 def create_mock_action():
@@ -16,8 +25,8 @@ def create_mock_action():
 
 @ExchangeListener.register("dummy")
 class DummyListener(ExchangeListener):
-    def __init__(self, exchange, on_event, event_type=None):
-        super().__init__(exchange, on_event, markets=["ETH_BTC"], event_type=event_type)
+    def __init__(self, exchange, on_event, event_type=None, cache=None):
+        super().__init__(exchange, on_event, markets=["ETH_BTC"], event_type=event_type, cache=cache)
         self.mock_action = create_mock_action()
         self.mock_stop = MagicMock()
 
@@ -33,8 +42,7 @@ class OrchestratorTest(unittest.TestCase):
     def setUp(self):
         self.mock_session = MagicMock()
         self.dummy_exchange = models.Exchange(id=1337, name="dummy")
-        query_exchange_ret = "query.return_value.filter_by.return_value.one.return_value"
-        self.mock_session.configure_mock(**{query_exchange_ret: self.dummy_exchange})
+        mock_reference_data(self.mock_session, [self.dummy_exchange])
         self.orchestrator = Orchestrator(["dummy"], session=self.mock_session, commit_interval=3)
 
     def test_listeners_instanciation(self):
@@ -56,6 +64,86 @@ class OrchestratorTest(unittest.TestCase):
         self.orchestrator._on_event([create_mock_action()])
         self.mock_session.commit.assert_called_once()
 
+    def test_buffered_writes(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            buffer = IngestBuffer(10, spill_dir=spill_dir)
+            orchestrator = Orchestrator(["dummy"], session=self.mock_session, commit_interval=3, buffer=buffer)
+            self.assertIs(orchestrator.exchange_listeners[0].backpressure, buffer)
+            action = create_mock_action()
+            orchestrator._on_event([action, action])
+            action.execute.assert_not_called()
+            self.assertEqual(len(buffer), 2)
+            asyncio.get_event_loop().run_until_complete(orchestrator.writer.run())
+        self.assertEqual(action.execute.call_count, 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self.mock_session.commit.call_count, 2)
+
+    def test_trade_deduplication(self):
+        # trade ids loaded on start, then the partitioned tables
+        self.mock_session.execute.side_effect = [[(1337, "ETH", "BTC", "1")], MagicMock()]
+        deduplicator = TradeDeduplicator(session=self.mock_session)
+        orchestrator = Orchestrator(["dummy"], session=self.mock_session, deduplicator=deduplicator)
+        asyncio.get_event_loop().run_until_complete(orchestrator.start())
+        self.assertEqual(deduplicator.stats["trades"], 0)
+        trade = models.Trade(exchange_trade_id="1", exchange_id=1337, buy_sym_id="ETH", sell_sym_id="BTC")
+        orchestrator._on_event([InsertAction([trade])])
+        self.assertEqual(deduplicator.stats["suppressed"], 1)
+
+    def test_trade_deduplication_rollback(self):
+        deduplicator = TradeDeduplicator(session=self.mock_session)
+        orchestrator = Orchestrator(["dummy"], session=self.mock_session, commit_interval=1,
+                                    deduplicator=deduplicator)
+        def create_trade():
+            return models.Trade(exchange_trade_id="1", exchange_id=1337, buy_sym_id="ETH", sell_sym_id="BTC")
+        self.mock_session.commit.side_effect = sqlalchemy.exc.OperationalError("COMMIT", {}, Exception("closed"))
+        with self.assertRaises(sqlalchemy.exc.OperationalError):
+            orchestrator._on_event([InsertAction([create_trade()])])
+        orchestrator.exchange_listeners[0]._rollback()
+        self.mock_session.commit.side_effect = None
+        orchestrator._on_event([InsertAction([create_trade()])])
+        # the rolled back trade is written again, then suppressed once committed
+        self.assertEqual(deduplicator.stats["suppressed"], 0)
+        orchestrator._on_event([InsertAction([create_trade()])])
+        self.assertEqual(deduplicator.stats["suppressed"], 1)
+
+    def test_db_outage(self):
+        def create_trades(*trade_ids):
+            return InsertAction([models.Trade(exchange_trade_id=str(trade_id), exchange_id=1337,
+                                              timestamp=datetime(2019, 5, 15), buy_sym_id="ETH",
+                                              sell_sym_id="BTC", price=0.03, size=1.0)
+                                 for trade_id in trade_ids])
+        def commit():
+            if db_down:
+                raise sqlalchemy.exc.OperationalError("COMMIT", {}, Exception("connection refused"))
+        self.mock_session.commit.side_effect = commit
+
+        def create_orchestrator(buffer, backlog):
+            return Orchestrator(["dummy"], session=self.mock_session, commit_interval=3, buffer=buffer,
+                                backlog=backlog)
+
+        with tempfile.TemporaryDirectory() as spill_dir, tempfile.TemporaryDirectory() as backlog_dir:
+            db_down = True
+            backlog = Backlog(backlog_dir)
+            orchestrator = create_orchestrator(IngestBuffer(10, spill_dir=spill_dir), backlog)
+            orchestrator._on_event([create_trades(1, 2), create_trades(3, 4)])
+            asyncio.get_event_loop().run_until_complete(orchestrator.writer.run())
+            # the rolled back actions are kept on disk
+            self.mock_session.rollback.assert_called()
+            self.assertEqual(len(backlog), 4)
+            self.assertEqual(backlog.stats["outages"], 1)
+
+            # the backlog is replayed by the next process before the new actions
+            db_down = False
+            self.mock_session.execute.reset_mock()
+            backlog = Backlog(backlog_dir)
+            orchestrator = create_orchestrator(IngestBuffer(10, spill_dir=spill_dir), backlog)
+            orchestrator._on_event([create_trades(5)])
+            asyncio.get_event_loop().run_until_complete(orchestrator.writer.run())
+            self.assertEqual(len(backlog), 0)
+            self.assertEqual(backlog.stats["spilled"], 1)
+            self.assertEqual(backlog.stats["replayed"], 5)
+            self.assertEqual(self.mock_session.execute.call_count, 3)
+
     @property
     def dummy_listener(self):
         return self.orchestrator.exchange_listeners[0]
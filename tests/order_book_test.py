@@ -0,0 +1,128 @@
+import random
+import unittest
+
+import numpy as np
+
+from antalla.order_book import OrderBook, compute_stats
+
+
+def reference_stats(order_book):
+    # pure python statistics computed by the snapshot generator before they were vectorised
+    bids = [order for order in order_book if order["order_type"] == "bid"]
+    asks = [order for order in order_book if order["order_type"] == "ask"]
+    bid_prices = [order["price"] for order in bids]
+    ask_prices = [order["price"] for order in asks]
+    return dict(
+        spread=float(min(ask_prices)) - float(max(bid_prices)),
+        min_ask_price=min(ask_prices),
+        min_ask_size=max(order["size"] if order["price"] == min(ask_prices) else 0 for order in asks),
+        max_bid_price=max(bid_prices),
+        max_bid_size=max(order["size"] if order["price"] == max(bid_prices) else 0 for order in bids),
+        bids_volume=float(sum(order["price"] * order["size"] for order in bids)),
+        asks_volume=float(sum(order["price"] * order["size"] for order in asks)),
+        bids_count=len(bids),
+        asks_count=len(asks),
+        bids_price_stddev=np.std(bid_prices),
+        asks_price_stddev=np.std(ask_prices),
+        bids_price_mean=float(sum(bid_prices)) / len(bids),
+        asks_price_mean=float(sum(ask_prices)) / len(asks),
+        bid_price_median=np.median(bid_prices),
+        ask_price_median=np.median(ask_prices)
+    )
+
+
+class OrderBookTest(unittest.TestCase):
+    def test_apply_keeps_latest_update(self):
+        book = OrderBook()
+        book.apply("ask", 1.1, 5, 3)
+        book.apply("ask", 1.1, 2, 1)
+        book.apply("ask", 1.2, 4, 2)
+        book.apply("bid", 0.9, 1, None)
+        prices, sizes = book.side("ask")
+        self.assertEqual(prices.tolist(), [1.1, 1.2])
+        self.assertEqual(sizes.tolist(), [5, 4])
+        self.assertEqual(book.side("bid")[0].tolist(), [])
+        self.assertEqual(book.last_update_id, 3)
+
+    def test_removed_level_is_not_restored_by_older_update(self):
+        book = OrderBook()
+        book.apply("bid", 0.5, 0, 4)
+        book.apply("bid", 0.5, 3, 2)
+        self.assertEqual(book.side("bid")[0].tolist(), [])
+
+    def test_prune_removed_levels(self):
+        book = OrderBook()
+        book.apply("bid", 0.5, 3, 1)
+        book.apply("bid", 0.5, 0, 2)
+        book.apply("bid", 0.4, 0, 3)
+        book.apply("ask", 0.6, 2, 4)
+        book.prune()
+        self.assertEqual(book.to_arrays("bid"), ([], [], []))
+        self.assertEqual(book.to_arrays("ask"), ([0.6], [2], [4]))
+        # a level restored after its removal is kept
+        book.apply("bid", 0.5, 0, 5)
+        book.apply("bid", 0.5, 1, 6)
+        book.prune()
+        self.assertEqual(book.side("bid")[1].tolist(), [1.0])
+
+    def assert_stats_match_reference(self, order_book):
+        book = OrderBook()
+        for i, order in enumerate(order_book):
+            book.apply(order["order_type"], order["price"], order["size"], i)
+        expected = reference_stats(order_book)
+        stats = compute_stats(*book.side("bid"), *book.side("ask"))
+        self.assertEqual(stats.keys(), expected.keys())
+        for key, value in expected.items():
+            self.assertAlmostEqual(stats[key], value, places=9, msg=key)
+
+    def test_compute_stats_matches_reference(self):
+        rng = random.Random(42)
+        order_book = [dict(order_type="bid", price=round(0.5 + 0.001 * i, 3), size=rng.randint(1, 1000) / 10)
+                      for i in range(200)]
+        order_book += [dict(order_type="ask", price=round(0.8 + 0.001 * i, 3), size=rng.randint(1, 1000) / 10)
+                       for i in range(150)]
+        rng.shuffle(order_book)
+        self.assert_stats_match_reference(order_book)
+
+    def test_compute_stats_single_level(self):
+        self.assert_stats_match_reference([dict(order_type="bid", price=0.5, size=3),
+                                           dict(order_type="ask", price=0.6, size=2)])
+
+    def test_compute_stats_empty_side(self):
+        # neither implementation has statistics for a one sided book, which the callers skip
+        for order_type in ("bid", "ask"):
+            order_book = [dict(order_type=order_type, price=0.5, size=3)]
+            with self.assertRaises(ValueError):
+                reference_stats(order_book)
+            book = OrderBook()
+            book.apply(order_type, 0.5, 3, 1)
+            with self.assertRaises(ValueError):
+                compute_stats(*book.side("bid"), *book.side("ask"))
+
+    def test_select_mid_price_range(self):
+        book = OrderBook()
+        for i, (order_type, price) in enumerate([("bid", 0.8), ("bid", 0.95), ("ask", 1.05), ("ask", 1.3)]):
+            book.apply(order_type, price, 1, i)
+        bid_prices, _, ask_prices, _ = book.select_mid_price_range(0.1)
+        self.assertEqual(bid_prices.tolist(), [0.95])
+        self.assertEqual(ask_prices.tolist(), [1.05])
+
+    def test_select_mid_price_range_one_sided(self):
+        book = OrderBook()
+        book.apply("bid", 0.8, 1, 1)
+        bid_prices, _, ask_prices, _ = book.select_mid_price_range(0.1)
+        self.assertEqual(len(bid_prices), 0)
+        self.assertEqual(len(ask_prices), 0)
+
+    def test_arrays_round_trip(self):
+        book = OrderBook("2019-05-15")
+        book.apply("bid", 0.5, 10, 1)
+        book.apply("bid", 0.4, 0, 2)
+        book.apply("ask", 0.6, 3, 3)
+        restored = OrderBook.from_arrays(book.timestamp, book.last_update_id,
+                                         book.to_arrays("bid"), book.to_arrays("ask"))
+        self.assertEqual(restored.to_arrays("bid"), book.to_arrays("bid"))
+        self.assertEqual(restored.to_arrays("ask"), book.to_arrays("ask"))
+        self.assertEqual(restored.last_update_id, 3)
+        restored.apply("bid", 0.4, 7, 1)
+        self.assertEqual(restored.side("bid")[0].tolist(), [0.5])
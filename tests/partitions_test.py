@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import DBAPIError
+
+from antalla import partitions
+
+
+def daily_bound(start):
+    return "FOR VALUES FROM ('{:%Y-%m-%d %H:%M:%S}') TO ('{:%Y-%m-%d %H:%M:%S}')".format(
+        start, start + timedelta(days=1))
+
+
+class PartitionsTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.partitions = {
+            "aggregate_orders": [("aggregate_orders_default", "DEFAULT")],
+            "trades": [("trades_default", "DEFAULT"), ("trades_p20190515", daily_bound(datetime(2019, 5, 15)))],
+        }
+        self.default_rows = False
+        self.session.execute.side_effect = self._execute
+
+    def _execute(self, statement, params=None):
+        if "pg_get_expr" in str(statement):
+            return self.partitions[params["table"]]
+        result = MagicMock()
+        result.scalar.return_value = self.default_rows
+        return result
+
+    def _executed_statements(self):
+        return [str(call[0][0]) for call in self.session.execute.call_args_list]
+
+    def test_partition_range(self):
+        self.assertEqual(partitions.partition_range(datetime(2019, 5, 19, 23, 59), "week"),
+                         (datetime(2019, 5, 13), datetime(2019, 5, 20)))
+        self.assertEqual(partitions.partition_range(datetime(2019, 5, 20), "week"),
+                         (datetime(2019, 5, 20), datetime(2019, 5, 27)))
+        with self.assertRaises(ValueError):
+            partitions.partition_range(datetime(2019, 5, 20), "month")
+
+    def test_create_partitions(self):
+        created = partitions.create_partitions(self.session, datetime(2019, 5, 15, 12), datetime(2019, 5, 16))
+        self.assertEqual(created, ["aggregate_orders_p20190515", "aggregate_orders_p20190516", "trades_p20190516"])
+        create_statements = [s for s in self._executed_statements() if s.startswith("create table")]
+        self.assertEqual(len(create_statements), 3)
+        self.assertIn("create table if not exists trades_p20190516 partition of trades "
+                      "for values from ('2019-05-16T00:00:00') to ('2019-05-17T00:00:00')", create_statements)
+        self.assertEqual(self.session.commit.call_count, 3)
+
+    def test_create_partitions_lock_timeout(self):
+        def execute(statement, params=None):
+            if str(statement).startswith("create table"):
+                raise DBAPIError("create table", None, Exception("lock timeout"))
+            return self._execute(statement, params)
+        self.session.execute.side_effect = execute
+        created = partitions.create_partitions(self.session, datetime(2019, 5, 15), datetime(2019, 5, 15))
+        self.assertEqual(created, [])
+        self.session.rollback.assert_called_once()
+        self.session.commit.assert_not_called()
+
+    def test_create_future_partitions(self):
+        self.partitions["trades"] = [("trades_default", "DEFAULT")]
+        created = partitions.create_future_partitions(
+            self.session, interval="week", ahead=1, now=datetime(2019, 5, 15), tables=["trades"])
+        self.assertEqual(created, ["trades_p20190513", "trades_p20190520"])
+
+    def test_get_partitions(self):
+        self.partitions["trades"].append(
+            ("trades_p20190520", "FOR VALUES FROM ('2019-05-20 00:00:00') TO ('2019-05-27 00:00:00')"))
+        self.assertEqual(partitions.get_partitions(self.session, "trades"), [
+            ("trades_p20190515", datetime(2019, 5, 15), datetime(2019, 5, 16)),
+            ("trades_p20190520", datetime(2019, 5, 20), datetime(2019, 5, 27)),
+        ])
+        self.assertEqual(partitions.get_default_partition(self.session, "trades"), "trades_default")
+
+    def test_get_partition_interval(self):
+        self.assertEqual(partitions.get_partition_interval("trades", []), None)
+        self.assertEqual(partitions.get_partition_interval(
+            "trades", [("trades_p20190513", datetime(2019, 5, 13), datetime(2019, 5, 20))]), "week")
+        with self.assertRaises(ValueError):
+            partitions.get_partition_interval("trades", [
+                ("trades_p20190513", datetime(2019, 5, 13), datetime(2019, 5, 20)),
+                ("trades_p20190520", datetime(2019, 5, 20), datetime(2019, 5, 21)),
+            ])
+
+    def test_create_partitions_other_interval(self):
+        with self.assertRaises(ValueError):
+            partitions.create_partitions(self.session, datetime(2019, 5, 15), datetime(2019, 5, 22), "week")
+        self.session.commit.assert_not_called()
+
+    def test_create_partitions_with_default_rows(self):
+        self.default_rows = True
+        created = partitions.create_partitions(self.session, datetime(2019, 5, 16), datetime(2019, 5, 16),
+                                               tables=["trades"])
+        self.assertEqual(created, ["trades_p20190516"])
+        statements = [s for s in self._executed_statements() if not s.startswith("select") and "lock_timeout" not in s]
+        self.assertEqual(statements, [
+            "lock table trades_default in share row exclusive mode",
+            "create table trades_p20190516 (like trades including defaults)",
+            "with moved as (delete from trades_default where timestamp >= :lower and timestamp < :upper returning *) "
+            "insert into trades_p20190516 select * from moved",
+            "alter table trades attach partition trades_p20190516 "
+            "for values from ('2019-05-16T00:00:00') to ('2019-05-17T00:00:00')",
+        ])
+        self.session.commit.assert_called_once()
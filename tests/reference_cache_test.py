@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+
+from antalla import models
+from antalla.reference_cache import ReferenceCache
+
+
+def create_exchange_market(first_coin_id, second_coin_id, original_name, agg_orders_count, volume_usd=None):
+    return models.ExchangeMarket(
+        first_coin_id=first_coin_id,
+        second_coin_id=second_coin_id,
+        exchange_id=1,
+        original_name=original_name,
+        quoted_volume=10.0,
+        quoted_volume_id=first_coin_id,
+        quoted_vol_timestamp=datetime(2019, 5, 15),
+        agg_orders_count=agg_orders_count,
+        volume_usd=volume_usd,
+    )
+
+
+class ReferenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.session = MagicMock()
+        self.session.query.side_effect = self._query
+        self.cache = ReferenceCache(self.session, ttl=60, clock=lambda: self.now)
+
+    def _query(self, entity):
+        query = MagicMock()
+        if entity is models.Coin.symbol:
+            rows = [("BTC",), ("ETH",), ("LTC",)]
+        elif entity is models.Exchange:
+            rows = [models.Exchange(id=1, name="binance")]
+            query.order_by.return_value = rows
+        else:
+            rows = [create_exchange_market("BTC", "ETH", "ETHBTC", 12, volume_usd=1000.0),
+                    create_exchange_market("BTC", "LTC", "LTCBTC", 0)]
+        query.__iter__.return_value = iter(rows)
+        return query
+
+    def test_lookups_without_queries(self):
+        self.assertEqual(self.cache.get_coin_symbols(), {"BTC", "ETH", "LTC"})
+        self.assertEqual(self.session.query.call_count, 3)
+        self.assertEqual(self.cache.get_original_market("binance", "ETH", "BTC"), "ETHBTC")
+        self.assertEqual(self.cache.get_original_market("binance", "BTC", "ETH"), "ETHBTC")
+        self.assertIsNone(self.cache.get_original_market("binance", "BTC", "XYZ"))
+        self.assertEqual(self.session.query.call_count, 3)
+
+    def test_load_exchanges(self):
+        exchange, = self.cache.load_exchanges(["binance"])
+        self.assertEqual((exchange.id, exchange.name), (1, "binance"))
+        with self.assertRaises(ValueError):
+            self.cache.load_exchanges(["binance", "unknown"])
+
+    def test_load_markets(self):
+        exchange = models.Exchange(id=1, name="binance")
+        markets = self.cache.load_markets(exchange, ["LTC_BTC", "XYZ_BTC", "BTC_ETH"])
+        self.assertEqual([market["original_name"] for market in markets], ["LTCBTC", "ETHBTC"])
+        self.assertNotIn("agg_orders_count", markets[0])
+        # the markets with the highest volume first
+        markets = self.cache.load_markets(exchange, ["LTC_BTC", "ETH_BTC"], max_markets=1)
+        self.assertEqual([market["original_name"] for market in markets], ["ETHBTC"])
+        self.assertNotIn("sort_volume_usd", markets[0])
+        self.assertEqual(self.session.query.call_count, 3)
+
+    def test_get_exchanges_with_markets(self):
+        exchanges = self.cache.get_exchanges(include_markets=True)
+        self.assertEqual(len(exchanges), 1)
+        self.assertEqual([market["original_name"] for market in exchanges[0]["markets"]], ["ETHBTC"])
+        self.assertNotIn("agg_orders_count", exchanges[0]["markets"][0])
+        self.assertEqual(self.cache.get_exchanges(), [dict(id=1, name="binance")])
+
+    def test_ttl_and_invalidate(self):
+        self.cache.get_coin_symbols()
+        self.now = 59
+        self.cache.get_coin_symbols()
+        self.assertEqual(self.session.query.call_count, 3)
+        self.now = 60
+        self.cache.get_coin_symbols()
+        self.assertEqual(self.session.query.call_count, 6)
+        self.cache.invalidate()
+        self.cache.get_coin_symbols()
+        self.assertEqual(self.session.query.call_count, 9)
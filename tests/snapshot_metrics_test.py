@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+
+import numpy as np
+
+from antalla import snapshot_metrics
+
+
+T0, T1 = datetime(2019, 5, 15, 19, 30), datetime(2019, 5, 15, 19, 31)
+ROWS = [
+    (T0, "binance", 0.1, 5.0),
+    (T0, "hitbtc", None, None),
+    (T1, "binance", 0.1, 5.0),
+    (T1, "hitbtc", 0.3, 2.0),
+]
+
+
+class SnapshotMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.session.execute.return_value = [("binance",), ("hitbtc",)]
+        execute = self.session.connection.return_value.execution_options.return_value.execute
+        execute.return_value.fetchmany.side_effect = [ROWS, []]
+        self.execute = execute
+
+    def _load(self, **kwargs):
+        return snapshot_metrics.load_aligned_metrics(
+            "eth", "btc", T0, T1, metrics=["spread", "bids_count"], session=self.session, **kwargs)
+
+    def test_load_aligned_metrics(self):
+        timestamps, exchanges, values = self._load(exchanges=["hitbtc", "binance"])
+        self.assertEqual(exchanges, ["binance", "hitbtc"])
+        self.assertEqual(timestamps.tolist(), [T0, T1])
+        self.assertEqual(values.shape, (2, 2, 2))
+        self.assertTrue(np.isnan(values[0, 1]).all())
+        self.assertEqual(values[1, 1].tolist(), [0.3, 2.0])
+        query, params = self.execute.call_args[0]
+        self.assertNotIn(":max_staleness", str(query))
+        self.assertEqual(params["snapshot_type"], "quartile")
+        self.assertEqual(params["exchanges"], ["binance", "hitbtc"])
+        self.assertEqual(params["buy_sym_id"], "ETH")
+
+    def test_max_staleness(self):
+        self._load(mid_price_range=0.01, max_staleness=10)
+        query, params = self.execute.call_args[0]
+        self.assertIn(":max_staleness", str(query))
+        self.assertEqual(params["snapshot_type"], "mid_price_range")
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            snapshot_metrics.load_aligned_metrics("eth", "btc", T0, T1, metrics=["foo"], session=self.session)
+
+    def test_load_aligned_metrics_frame(self):
+        df = snapshot_metrics.load_aligned_metrics_frame(
+            "eth", "btc", T0, T1, metrics=["spread", "bids_count"], session=self.session)
+        self.assertEqual(df[("spread", "hitbtc")].tolist()[1], 0.3)
+        self.assertEqual(df[("bids_count", "binance")].tolist(), [5.0, 5.0])
+        self.assertEqual(df.index[0], T0)
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from antalla import models
+from antalla.actions import InsertAction
+from antalla.spill import SpillQueue, Backlog
+
+
+def create_trades(*trade_ids):
+    return InsertAction([models.Trade(
+        timestamp=datetime(2019, 5, 15, 19, 30),
+        exchange_trade_id=str(trade_id),
+        exchange_id=1,
+        buy_sym_id="ETH",
+        sell_sym_id="BTC",
+        price=0.03,
+        size=1.0,
+    ) for trade_id in trade_ids])
+
+
+class SpillQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_append_and_pop(self):
+        queue = SpillQueue(self.directory.name, segment_size=1)
+        self.assertEqual(queue.append(create_trades(1, 2)), 2)
+        self.assertEqual(queue.append(create_trades(3)), 1)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+        action = queue.pop()
+        self.assertIs(action.item_type, models.Trade)
+        self.assertEqual([trade.exchange_trade_id for trade in action.items], ["1", "2"])
+        queue.append(create_trades(4))
+        self.assertEqual([trade.exchange_trade_id for trade in queue.pop().items], ["3"])
+        self.assertEqual([trade.exchange_trade_id for trade in queue.pop().items], ["4"])
+        self.assertIsNone(queue.pop())
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        queue.close()
+
+    def test_resume(self):
+        queue = SpillQueue(self.directory.name)
+        queue.append(create_trades(1))
+        queue.append(create_trades(2, 3))
+        queue.close()
+        queue = SpillQueue(self.directory.name)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual([trade.exchange_trade_id for trade in queue.pop().items], ["1"])
+        queue.append(create_trades(4))
+        self.assertEqual([trade.exchange_trade_id for trade in queue.pop().items], ["2", "3"])
+        self.assertEqual([trade.exchange_trade_id for trade in queue.pop().items], ["4"])
+        queue.close()
+
+    def test_push_front(self):
+        queue = SpillQueue(self.directory.name)
+        queue.append(create_trades(1, 2))
+        queue.append(create_trades(3))
+        popped = queue.pop()
+        queue.push_front([popped])
+        self.assertEqual(len(queue), 3)
+        queue.append(create_trades(4))
+        queue.close()
+        queue = SpillQueue(self.directory.name)
+        trade_ids = []
+        action = queue.pop()
+        while action is not None:
+            trade_ids.extend(trade.exchange_trade_id for trade in action.items)
+            action = queue.pop()
+        self.assertEqual(trade_ids, ["1", "2", "3", "4"])
+        queue.close()
+
+    def test_append_unsupported_action(self):
+        queue = SpillQueue(self.directory.name)
+        with self.assertRaises(ValueError):
+            queue.append(object())
+
+
+class BacklogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.now = 0
+        self.backlog = Backlog(self.directory.name, retry_interval=5, clock=lambda: self.now)
+        self.addCleanup(self.backlog.close)
+
+    def test_outage(self):
+        self.assertTrue(self.backlog.db_available)
+        self.assertFalse(self.backlog.can_replay())
+        self.backlog.on_db_error()
+        self.backlog.spill([create_trades(1, 2), MagicMock(), create_trades(3)])
+        self.assertEqual(len(self.backlog), 3)
+        self.assertEqual(self.backlog.stats, dict(outages=1, spilled=3, replayed=0, dropped=1))
+        self.assertFalse(self.backlog.can_replay())
+        self.now = 5
+        self.assertTrue(self.backlog.can_replay())
+
+        batch = self.backlog.next_batch(2)
+        self.assertEqual([trade.exchange_trade_id for action in batch for trade in action.items], ["1", "2"])
+        # the db failed again: the same batch is replayed once it is back
+        self.backlog.on_db_error()
+        self.assertEqual(self.backlog.stats["outages"], 1)
+        self.assertFalse(self.backlog.can_replay())
+        self.now = 10
+        batch = self.backlog.next_batch(3)
+        self.assertEqual([trade.exchange_trade_id for action in batch for trade in action.items], ["1", "2", "3"])
+        self.now = 12
+        self.backlog.on_batch_written()
+        self.assertEqual(len(self.backlog), 0)
+        self.assertEqual(self.backlog.stats["replayed"], 3)
+        self.assertTrue(self.backlog.db_available)
+        self.assertFalse(self.backlog.can_replay())
+
+    def test_drain_rate(self):
+        self.backlog.spill([create_trades(1, 2), create_trades(3, 4)])
+        self.backlog.next_batch(2)
+        self.now = 2
+        self.backlog.on_batch_written()
+        self.assertEqual(self.backlog.drain_rate(), 1.0)
+
+    def test_close_while_replaying(self):
+        self.backlog.spill([create_trades(1), create_trades(2), create_trades(3)])
+        self.backlog.next_batch(2)
+        self.backlog.close()
+        backlog = Backlog(self.directory.name)
+        self.addCleanup(backlog.close)
+        self.assertEqual(len(backlog), 3)
+        batch = backlog.next_batch(3)
+        self.assertEqual([trade.exchange_trade_id for action in batch for trade in action.items], ["1", "2", "3"])
+
+    def test_resume(self):
+        self.backlog.spill([create_trades(1)])
+        self.backlog.close()
+        backlog = Backlog(self.directory.name)
+        self.addCleanup(backlog.close)
+        self.assertEqual(len(backlog), 1)
+        self.assertTrue(backlog.can_replay())
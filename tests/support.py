@@ -1,6 +1,8 @@
 import unittest
+from unittest.mock import MagicMock
 
 from antalla import db
+from antalla import models
 
 
 class TransactionalTestCase(unittest.TestCase):
@@ -10,3 +12,20 @@ class TransactionalTestCase(unittest.TestCase):
             
     def tearDown(self):
         self.session.rollback()
+
+
+def mock_reference_data(session, exchanges=(), exchange_markets=(), coins=()):
+    """makes the queries of the reference cache on the mock `session` return the given rows
+    """
+    def query(entity):
+        if entity is models.Coin.symbol:
+            rows = [(symbol,) for symbol in coins]
+        elif entity is models.Exchange:
+            rows = list(exchanges)
+        else:
+            rows = list(exchange_markets)
+        result = MagicMock()
+        result.__iter__.side_effect = lambda: iter(rows)
+        result.order_by.return_value = rows
+        return result
+    session.query.side_effect = query
@@ -0,0 +1,65 @@
+from datetime import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from antalla import models
+from antalla.actions import InsertAction
+from antalla.trade_dedup import TradeDeduplicator
+
+
+def create_trade(trade_id, exchange_id=1, buy_sym_id="ETH", sell_sym_id="BTC"):
+    return models.Trade(exchange_trade_id=trade_id, exchange_id=exchange_id, timestamp=datetime(2019, 5, 15),
+                        buy_sym_id=buy_sym_id, sell_sym_id=sell_sym_id, price=0.03, size=1.0)
+
+
+class TradeDeduplicatorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.deduplicator = TradeDeduplicator(max_ids_per_market=3, session=self.session)
+
+    def store(self, *trade_ids):
+        self.deduplicator.track([InsertAction([create_trade(trade_id) for trade_id in trade_ids])])
+        self.deduplicator.on_commit()
+
+    def test_filter(self):
+        actions = self.deduplicator.filter([InsertAction([create_trade("1"), create_trade("2")])])
+        self.assertEqual([trade.exchange_trade_id for trade in actions[0].items], ["1", "2"])
+        self.deduplicator.track(actions)
+        self.deduplicator.on_commit()
+        other_action = MagicMock()
+        actions = self.deduplicator.filter([
+            InsertAction([create_trade("2"), create_trade("3"), create_trade(2, buy_sym_id="LTC")]),
+            InsertAction([create_trade(1)]),
+            other_action,
+        ])
+        self.assertEqual(len(actions), 2)
+        self.assertEqual([trade.exchange_trade_id for trade in actions[0].items], ["3", 2])
+        self.assertIs(actions[1], other_action)
+        self.assertEqual(self.deduplicator.stats, dict(trades=6, suppressed=2))
+        self.assertEqual(self.deduplicator.suppressed[(1, "ETH", "BTC")], 2)
+
+    def test_lru_eviction(self):
+        self.store("1", "2", "3")
+        # a resent trade becomes the most recently used
+        self.assertTrue(self.deduplicator.is_duplicate(create_trade("1")))
+        self.store("4")
+        self.assertFalse(self.deduplicator.is_duplicate(create_trade("2")))
+        self.assertTrue(self.deduplicator.is_duplicate(create_trade("1")))
+        self.assertTrue(self.deduplicator.is_duplicate(create_trade("4")))
+
+    def test_rollback(self):
+        self.deduplicator.track([InsertAction([create_trade("1")])])
+        self.assertFalse(self.deduplicator.is_duplicate(create_trade("1")))
+        self.deduplicator.on_rollback()
+        self.deduplicator.on_commit()
+        # the rolled back trades are written again when resent
+        self.assertFalse(self.deduplicator.is_duplicate(create_trade("1")))
+
+    def test_seed(self):
+        self.session.execute.return_value = [(1, "ETH", "BTC", "1"), (1, "ETH", "BTC", "2")]
+        self.assertEqual(self.deduplicator.seed([1]), 2)
+        params = self.session.execute.call_args[0][1]
+        self.assertEqual(params["exchange_ids"], [1])
+        self.assertEqual(params["max_ids"], 3)
+        self.assertTrue(self.deduplicator.is_duplicate(create_trade(2)))
+        self.assertFalse(self.deduplicator.is_duplicate(create_trade(2, exchange_id=2)))